@@ -1,215 +1,168 @@
-from typing import Dict, Set, List, Tuple
-import re
-from dataclasses import dataclass
+# asp_validator.py
+
 from collections import defaultdict
+from typing import Dict, List, Set
+
+from map_analysis import DIRECTIONS, parse_layout, player_region
+
+# Predicates of the instance vocabulary that the validator checks; all others are skipped.
+LOCATION_PREDICATES = {"sokoban", "crate", "location", "isgoal", "isnongoal", "wall", "leftOf", "below", "at", "clear"}
+COORD_PREDICATES = {"sokoban", "crate", "floor", "goal", "at"}
+
+# How many offending facts an error message lists.
+MAX_LISTED = 10
+
+
+def cell_id(pos: tuple, fact_format: str) -> str:
+    """The cell term generate_facts_from_map uses for pos."""
+    return f"l{pos[0]}_{pos[1]}" if fact_format == "location" else f"cell({pos[0]},{pos[1]})"
+
+
+def parse_facts(asp_facts: str, predicates: Set[str]) -> Dict[str, Set[str]]:
+    """
+    Collects the argument lists of the given predicates, expanding pools.
+
+    "isgoal(l1_1;l2_4)." gives "l1_1" and "l2_4" under "isgoal", and
+    "at(sokoban, l1_1, 0)." gives "sokoban,l1_1,0". Facts of other predicates
+    and non-fact lines are skipped without being parsed.
+    """
+    # One partition per line; the rest of the work runs over whole strings per predicate.
+    bodies: Dict[str, List[str]] = defaultdict(list)
+    for line in asp_facts.replace(" ", "").replace("\r", "").split("\n"):
+        name, _, rest = line.partition("(")
+        bodies[name].append(rest)
+    facts: Dict[str, Set[str]] = {}
+    for name in predicates & bodies.keys():
+        facts[name] = set("".join(bodies[name]).replace(").", ";").split(";"))
+        facts[name].discard("")
+    return facts
 
-@dataclass(frozen=True)
-class Position:
-    x: int
-    y: int
-    
-    @classmethod
-    def from_pos_str(cls, pos_str: str) -> 'Position':
-        """Convert 'pos_x_y' string to Position object."""
-        _, x, y = pos_str.split('_')
-        return cls(int(x), int(y))
-    
-    def is_adjacent(self, other: 'Position') -> bool:
-        """Check if positions are adjacent."""
-        return abs(self.x - other.x) + abs(self.y - other.y) == 1
-    
-    def __str__(self) -> str:
-        return f"pos_{self.x}_{self.y}"
-
-    def get_adjacent_positions(self) -> List[Tuple['Position', str]]:
-        """Get all adjacent positions with their direction names."""
-        return [
-            (Position(self.x-1, self.y), 'left'),
-            (Position(self.x+1, self.y), 'right'),
-            (Position(self.x, self.y+1), 'up'),
-            (Position(self.x, self.y-1), 'down')
-        ]
 
 class SokobanASPValidator:
-    """Validates Sokoban map encodings with focus on semantic correctness."""
-    
-    CELL_TYPES = {
-        '#': 'wall',
-        'S': 'player',
-        'C': 'stone',
-        'X': 'goal',
-        's': 'player_on_goal',
-        'c': 'stone_on_goal',
-        ' ': 'free'
-    }
-    
-    DIRECTIONS = ['left', 'right', 'up', 'down']
-
-    def __init__(self, original_map: str, asp_facts: str):
-        self.map_grid = self._parse_map(original_map)
-        self.facts = self._parse_facts(asp_facts)
+    """
+    Checks the instance facts of generate_facts_from_map against the map they came from.
+
+    The expected facts are derived from the map the same way the generator
+    derives them: the region the sokoban can reach (crates passable), and the
+    kernel of that region, the crate cells and the walls bordering the region. For the "location" format
+    the validator checks location/isgoal/isnongoal/wall, leftOf/below, and the
+    initial at/clear facts. For the "coord" format it checks floor, goal and at.
+    In both formats it checks the sokoban and crate names.
+
+    The facts are parsed once into sets of argument lists and compared with
+    expected sets built in one pass over the map's cells, so validation is
+    linear in the number of facts and cells.
+    """
+
+    def __init__(self, original_map: str, asp_facts: str, fact_format: str = "location"):
+        if fact_format not in ("location", "coord"):
+            raise ValueError(f"Unknown fact format: {fact_format}")
+        self.fact_format = fact_format
+        self.layout = parse_layout(original_map)
+        self.region = player_region(self.layout) if self.layout.sokoban is not None else set(self.layout.floor)
+        # Crates outside the region keep their cells so that they can still stand on a goal.
+        self.cells = self.region | set(self.layout.crates)
+        walls = self.layout.walls
+        self.kernel = self.cells | {
+            (r + dr, c + dc) for r, c in self.region for dr, dc in DIRECTIONS.values() if (r + dr, c + dc) in walls
+        }
+        self.crate_names = [f"crate_{i:02d}" for i in range(1, len(self.layout.crates) + 1)]
+        self.facts = parse_facts(asp_facts, LOCATION_PREDICATES if fact_format == "location" else COORD_PREDICATES)
+        # Cell id of every kernel cell, formatted once.
+        self.ids: Dict[tuple, str] = {pos: cell_id(pos, fact_format) for pos in self.kernel}
         self.errors: List[str] = []
-        
-        # Extract key positions
-        self.walls = self._get_positions_of_type('wall')
-        self.goals = self._get_positions_of_type(['goal', 'player_on_goal', 'stone_on_goal'])
-        self.stones = self._get_positions_of_type(['stone', 'stone_on_goal'])
-        player_positions = self._get_positions_of_type(['player', 'player_on_goal'])
-        self.player = next(iter(player_positions)) if player_positions else None
-
-    def _parse_map(self, map_str: str) -> Dict[Position, str]:
-        """Parse map into a grid with Position objects as keys."""
-        grid = {}
-        for y, line in enumerate(map_str.strip().split('\n'), start=1):
-            for x, char in enumerate(line, start=1):
-                if char in self.CELL_TYPES:
-                    grid[Position(x, y)] = self.CELL_TYPES[char]
-        return grid
-
-    def _parse_facts(self, facts_str: str) -> Dict[str, Set[str]]:
-        """Parse and categorize ASP facts."""
-        categorized = defaultdict(set)
-        for fact in facts_str.strip().split('\n'):
-            fact = fact.strip()
-            if not fact:  # Skip empty lines
-                continue
-            predicate = fact.split('(')[0]
-            categorized[predicate].add(fact)
-        return dict(categorized)
-
-    def _get_positions_of_type(self, types: str | list[str]) -> Set[Position]:
-        """Get all positions of specified type(s)."""
-        if isinstance(types, str):
-            types = [types]
-        return {pos for pos, type_ in self.map_grid.items() if type_ in types}
-
-    def _extract_position(self, fact: str) -> Position:
-        """Extract position from fact string."""
-        match = re.search(r'pos_(\d+)_(\d+)', fact)
-        if match:
-            return Position(int(match.group(1)), int(match.group(2)))
-        raise ValueError(f"No position found in fact: {fact}")
 
     def validate(self) -> bool:
-        """Run all semantic validation checks."""
-        validators = [
-            self._validate_walls_behavior,
-            self._validate_movement_rules,
-            self._validate_walls_behavior,
-        ]
-        
-        for validator in validators:
-            validator()
-        
+        """Runs every check; raises AssertionError listing all problems found."""
+        self._validate_objects()
+        if self.fact_format == "location":
+            self._validate_cells()
+            self._validate_adjacency()
+            self._validate_initial_state(clear=True)
+        else:
+            self._compare("floor", {f"{r},{c}" for r, c in self.cells}, self._args("floor"))
+            self._compare("goal", {f"{r},{c}" for r, c in self.layout.goals & self.cells}, self._args("goal"))
+            self._validate_initial_state(clear=False)
         if self.errors:
-            raise AssertionError("ASP Encoding Validation Failed:\n" + 
-                               "\n".join(self.errors))
+            raise AssertionError("ASP Encoding Validation Failed:\n" + "\n".join(self.errors))
         return True
 
-    def _validate_walls_behavior(self):
-        """Validate wall semantics."""
-        self._validate_wall_movement()
-        self._validate_wall_clear()
-
-    def _validate_wall_movement(self):
-        """Check that walls properly block movement."""
-        for fact in self.facts.get('movedir', []):
-            try:
-                match = re.match(r'movedir\((pos_\d+_\d+),(pos_\d+_\d+),dir_\w+\)', fact)
-                if match:
-                    from_pos = self._extract_position(match.group(1))
-                    to_pos = self._extract_position(match.group(2))
-                    
-                    if from_pos in self.walls or to_pos in self.walls:
-                        self._add_error(f"Invalid movedir through wall: {fact}")
-                    
-                    if not from_pos.is_adjacent(to_pos):
-                        self._add_error(f"Non-adjacent positions in movedir: {fact}")
-            except (ValueError, AttributeError) as e:
-                self._add_error(f"Malformed movedir fact: {fact} - {str(e)}")
-
-    def _validate_wall_clear(self):
-        """Check that walls are never marked as clear."""
-        for fact in self.facts.get('clear', []):
-            try:
-                pos = self._extract_position(fact)
-                if pos in self.walls:
-                    self._add_error(f"Wall position marked as clear: {fact}")
-            except ValueError as e:
-                self._add_error(f"Malformed clear fact: {fact} - {str(e)}")
-
-    def _validate_movement_rules(self):
-        """Validate movement semantics and completeness."""
-        self._validate_direction_names()
-        self._validate_movement_completeness()
-        self._validate_movement_connectivity()
-
-    def _validate_direction_names(self):
-        """Check that all direction names are valid."""
-        valid_dirs = set(self.DIRECTIONS)
-        for fact in self.facts.get('movedir', []):
-            match = re.search(r'dir_(\w+)', fact)
-            if match and match.group(1) not in valid_dirs:
-                self._add_error(f"Invalid direction in fact: {fact}")
-
-    def _validate_movement_completeness(self):
-        """Verify all possible valid movements are present."""
-        expected_movedir = set()
-        
-        # Only generate movedir facts for non-wall positions
-        for pos in self.map_grid:
-            if pos not in self.walls:  # Only consider non-wall positions
-                for next_pos, dir_name in pos.get_adjacent_positions():
-                    # Only add movedir if both positions are in grid and neither is a wall
-                    if (next_pos in self.map_grid and 
-                        next_pos not in self.walls):
-                        expected = f"movedir({pos},{next_pos},dir_{dir_name})."
-                        expected_movedir.add(expected)
-                    
-        actual_movedir = set(self.facts.get('movedir', []))
-        
-        if missing := expected_movedir - actual_movedir:
-            self._add_error("Missing movedir facts:\n" + 
-                          "\n".join(f"  {fact}" for fact in sorted(missing)))
-        if extra := actual_movedir - expected_movedir:
-            self._add_error("Unexpected movedir facts:\n" + 
-                          "\n".join(f"  {fact}" for fact in sorted(extra)))
-
-    def _validate_movement_connectivity(self):
-        """Check that non-wall positions have valid moves."""
-        for pos in self.map_grid:
-            if pos not in self.walls:
-                outgoing_moves = self._get_outgoing_moves(pos)
-                if not outgoing_moves:
-                    self._add_error(f"Position {pos} has no valid moves")
-
-    def _get_outgoing_moves(self, pos: Position) -> Set[Position]:
-        """Get all valid moves from a position."""
-        moves = set()
-        for fact in self.facts.get('movedir', []):
-            if str(pos) in fact:
-                try:
-                    to_pos = self._extract_position(fact.split(',')[1])
-                    moves.add(to_pos)
-                except (ValueError, IndexError):
-                    continue
-        return moves
+    def _args(self, predicate: str) -> Set[str]:
+        return self.facts.get(predicate, set())
+
+    def _compare(self, predicate: str, expected: Set[str], actual: Set[str]) -> None:
+        """Records missing and unexpected arguments of one predicate."""
+        for label, difference in (("Missing", expected - actual), ("Unexpected", actual - expected)):
+            if difference:
+                listed = sorted(difference)[:MAX_LISTED]
+                more = f" (and {len(difference) - len(listed)} more)" if len(difference) > len(listed) else ""
+                self._add_error(f"{label} {predicate} facts: "
+                                + ", ".join(f"{predicate}({args})" for args in listed) + more)
+
+    def _validate_objects(self) -> None:
+        self._compare("sokoban", {"sokoban"} if self.layout.sokoban is not None else set(), self._args("sokoban"))
+        self._compare("crate", set(self.crate_names), self._args("crate"))
+
+    def _validate_cells(self) -> None:
+        """location covers the kernel; isgoal/isnongoal split the region and crate cells; wall marks the kernel's walls."""
+        ids = self.ids
+        goals = self.layout.goals & self.cells
+        self._compare("location", set(ids.values()), self._args("location"))
+        self._compare("isgoal", {ids[pos] for pos in goals}, self._args("isgoal"))
+        self._compare("isnongoal", {ids[pos] for pos in self.cells - goals}, self._args("isnongoal"))
+        self._compare("wall", {ids[pos] for pos in self.kernel & self.layout.walls}, self._args("wall"))
+        if both := self._args("isgoal") & self._args("isnongoal"):
+            self._add_error(f"Cells both isgoal and isnongoal: {', '.join(sorted(both)[:MAX_LISTED])}")
+        if blocked := self._args("wall") & (self._args("isgoal") | self._args("isnongoal")):
+            self._add_error(f"Walls marked as goal or non-goal: {', '.join(sorted(blocked)[:MAX_LISTED])}")
+
+    def _validate_adjacency(self) -> None:
+        """
+        leftOf(A,B): B is the right neighbour of A. below(A,B): A is directly below B.
+
+        Exactly the pairs of adjacent kernel cells with at least one cell in the
+        region are expected; pairs of two walls are left out.
+        """
+        ids, region = self.ids, self.region
+        expected_left, expected_below = set(), set()
+        for (r, c), cell in ids.items():
+            right, down = ids.get((r, c + 1)), ids.get((r + 1, c))
+            inside = (r, c) in region
+            if right is not None and (inside or (r, c + 1) in region):
+                expected_left.add(f"{cell},{right}")
+            if down is not None and (inside or (r + 1, c) in region):
+                expected_below.add(f"{down},{cell}")
+        self._compare("leftOf", expected_left, self._args("leftOf"))
+        self._compare("below", expected_below, self._args("below"))
+
+    def _validate_initial_state(self, clear: bool) -> None:
+        """at(X,L,0) places the sokoban and every crate (row-major names); clear(L,0) covers the rest of the region."""
+        ids = self.ids
+        expected_at = {f"{name},{ids[pos]},0"
+                       for name, pos in zip(self.crate_names, self.layout.crates)}
+        if self.layout.sokoban is not None:
+            expected_at.add(f"sokoban,{ids[self.layout.sokoban]},0")
+        self._compare("at", expected_at, self._args("at"))
+        if clear:
+            occupied = set(self.layout.crates) | {self.layout.sokoban}
+            self._compare("clear", {f"{ids[pos]},0" for pos in self.region - occupied}, self._args("clear"))
 
     def _add_error(self, message: str):
         """Add validation error."""
         self.errors.append(message)
 
 
-def validate_asp_encoding(original_map: str, asp_facts: str) -> bool:
+def validate_asp_encoding(original_map: str, asp_facts: str, fact_format: str = "location") -> bool:
     """
     Validate the semantic correctness of a Sokoban map encoding in ASP format.
-    
+
     Args:
         original_map: Original map encoding as a string
         asp_facts: ASP encoding of the map as a string
-    
+        fact_format: "location" (sokoban.lp) or "coord" (sokoban_coord.lp)
+
     Returns:
         True if encoding is valid, otherwise raises AssertionError with details
     """
-    validator = SokobanASPValidator(original_map, asp_facts)
-    return validator.validate()
\ No newline at end of file
+    validator = SokobanASPValidator(original_map, asp_facts, fact_format)
+    return validator.validate()
@@ -0,0 +1,253 @@
+# benchmark.py
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from tabulate import tabulate
+
+from map_analysis import map_features, parse_layout
+from horizon_ledger import LEDGER_FILE
+from level_collection import expand_references
+from solver import SokobanSolver
+from sokoban_map import SokobanMap
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MAPS_DIR = os.path.join(BASE_DIR, 'maps')
+
+# Seconds a child process may run past its timeout before run_map_isolated stops it.
+KILL_GRACE = 5.0
+
+
+def default_map_files() -> List[str]:
+    """All maps shipped in the maps directory."""
+    return sorted(
+        os.path.join(MAPS_DIR, f) for f in os.listdir(MAPS_DIR) if f.endswith('.txt')
+    )
+
+
+def run_map(map_path: str, solver_kwargs: Dict, timeout: float, verbose: bool = False) -> Dict:
+    """
+    Solves one map and records the outcome.
+
+    Args:
+        map_path: Path to the map file.
+        solver_kwargs: Keyword arguments for SokobanSolver.
+        timeout: Wall clock limit in seconds; the solve is cancelled afterwards.
+        verbose: Keep the solver's own output instead of swallowing it.
+
+    Returns:
+        A dict with the map, its MapFeatures, the solver options and the result.
+    """
+    map_str = SokobanMap.read_map_file(map_path)
+    solver = SokobanSolver(**solver_kwargs)
+    cancel_event = threading.Event()
+    timer = threading.Timer(timeout, cancel_event.set)
+    timer.start()
+    try:
+        with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()):
+            result = solver.solve_plan(map_str, cancel_event=cancel_event)
+    finally:
+        timer.cancel()
+    return {
+        "map": os.path.basename(map_path),
+        "features": map_features(parse_layout(map_str))._asdict(),
+        "options": {k: v for k, v in solver_kwargs.items() if k != "domain_asp_file"},
+        "encoding": os.path.basename(solver_kwargs["domain_asp_file"]),
+        "engine": result.engine or "asp",
+        "status": "TIMEOUT" if result.status == "CANCELLED" else result.status,
+        "horizon": result.horizon,
+        "plan_length": len(result.steps),
+        "seconds": round(result.elapsed, 3),
+        "stats": result.stats,
+    }
+
+
+def _run_map_worker(map_path: str, solver_kwargs: Dict, timeout: float, verbose: bool, results) -> None:
+    results.put(run_map(map_path, solver_kwargs, timeout, verbose))
+
+
+def run_map_isolated(map_path: str, solver_kwargs: Dict, timeout: float, verbose: bool = False,
+                     retries: int = 1) -> Dict:
+    """
+    Runs run_map in a child process and resumes it after a crash.
+
+    A child that dies without a result (killed, out of memory, a crash in
+    clingo) is started again with resume=True for the rest of the timeout, so
+    it continues from the solver's last checkpoint. After the last retry the
+    map is recorded as CRASHED. A child still running KILL_GRACE seconds after
+    the timeout is stopped and the map is recorded as TIMEOUT. Every run keeps its checkpoints in a fresh
+    temporary directory, so a retry never resumes a checkpoint of another run.
+
+    Args:
+        retries: How often a crashed run is resumed.
+    """
+    with tempfile.TemporaryDirectory(prefix="checkpoints-") as checkpoint_dir:
+        return _run_attempts(map_path, solver_kwargs, timeout, verbose, retries, checkpoint_dir)
+
+
+def _run_attempts(map_path: str, solver_kwargs: Dict, timeout: float, verbose: bool, retries: int,
+                  checkpoint_dir: str) -> Dict:
+    deadline = time.monotonic() + timeout
+    kwargs = dict(solver_kwargs, checkpoint_dir=checkpoint_dir)
+    for attempt in range(retries + 1):
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_run_map_worker,
+                                          args=(map_path, kwargs, max(deadline - time.monotonic(), 0.0), verbose, results))
+        process.start()
+        while process.is_alive() and results.empty():
+            if time.monotonic() > deadline + KILL_GRACE:
+                # The cancel event is not checked while clingo grounds, so a run past its
+                # deadline may never return on its own.
+                process.terminate()
+                process.join()
+                print(f"{os.path.basename(map_path)}: solver process stopped after the timeout", flush=True)
+                return _failed_record(map_path, solver_kwargs, "TIMEOUT", timeout, attempt + 1)
+            process.join(0.1)
+        if not results.empty():
+            record = results.get()
+            process.join()
+            record["options"].pop("resume", None)
+            record["options"].pop("checkpoint_dir", None)
+            record["attempts"] = attempt + 1
+            return record
+        print(f"{os.path.basename(map_path)}: solver process exited with code {process.exitcode}"
+              + (", resuming from its checkpoint" if attempt < retries else ""), flush=True)
+        kwargs["resume"] = True
+        if time.monotonic() >= deadline:
+            break
+    return _failed_record(map_path, solver_kwargs, "CRASHED",
+                          timeout - max(deadline - time.monotonic(), 0.0), attempt + 1)
+
+
+def _failed_record(map_path: str, solver_kwargs: Dict, status: str, seconds: float, attempts: int) -> Dict:
+    """The record of a run whose process returned no result."""
+    return {
+        "map": os.path.basename(map_path),
+        "features": map_features(parse_layout(SokobanMap.read_map_file(map_path)))._asdict(),
+        "options": {k: v for k, v in solver_kwargs.items() if k != "domain_asp_file"},
+        "encoding": os.path.basename(solver_kwargs["domain_asp_file"]),
+        "engine": solver_kwargs.get("engine", "asp"),
+        "status": status,
+        "horizon": 0,
+        "plan_length": 0,
+        "seconds": round(seconds, 3),
+        "stats": {},
+        "attempts": attempts,
+    }
+
+
+def run_benchmark(map_files: List[str], configurations: List[Dict], timeout: float, verbose: bool = False,
+                  retries: int = 0, done: Optional[List[Dict]] = None, output: Optional[str] = None) -> List[Dict]:
+    """
+    Runs every configuration on every map, printing one line per run.
+
+    Args:
+        retries: With retries > 0 every run gets its own process and is resumed after a crash
+            (see run_map_isolated); 0 runs in this process.
+        done: Records of an earlier, interrupted benchmark; runs already in it are skipped.
+        output: Rewrite this JSON file after every run, so an interrupted benchmark can be resumed.
+    """
+    records = list(done or [])
+    finished = {(r["map"], json.dumps(r["options"], sort_keys=True)) for r in records}
+    for map_path in map_files:
+        for solver_kwargs in configurations:
+            options = {k: v for k, v in solver_kwargs.items() if k != "domain_asp_file"}
+            if (os.path.basename(map_path), json.dumps(options, sort_keys=True)) in finished:
+                continue
+            if retries > 0:
+                record = run_map_isolated(map_path, solver_kwargs, timeout, verbose, retries)
+            else:
+                record = run_map(map_path, solver_kwargs, timeout, verbose)
+            print(f"{record['map']:<12} {record['options']} -> {record['status']} "
+                  f"(horizon {record['horizon']}, {record['seconds']}s)", flush=True)
+            records.append(record)
+            if output:
+                write_records(records, output)
+    return records
+
+
+def write_records(records: List[Dict], path: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(records, file, indent=2)
+    os.replace(tmp_path, path)
+
+
+def print_table(records: List[Dict]) -> None:
+    """Prints the benchmark results as a table."""
+    rows = [
+        (r["map"], r["encoding"], json.dumps(r["options"], sort_keys=True), r["status"],
+         r["horizon"], r["plan_length"], r["seconds"])
+        for r in records
+    ]
+    print(tabulate(rows, headers=["Map", "Encoding", "Options", "Status", "Horizon", "Plan", "Seconds"], tablefmt="grid"))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the Sokoban solver on a set of maps.")
+    parser.add_argument("maps", nargs="*",
+                        help="Map files, collection.sok#<number or title>, or whole collections "
+                             "(default: every map in maps/).")
+    parser.add_argument("--domain_file", default=os.path.join(BASE_DIR, "sokoban.lp"), help="ASP encoding.")
+    parser.add_argument("--fact_format", choices=SokobanSolver.FACT_FORMATS, default="location")
+    parser.add_argument("--max_steps", type=int, default=50)
+    parser.add_argument("--distance_pruning", choices=sorted(SokobanSolver.DISTANCE_PRUNING), default="none")
+    parser.add_argument("--heuristic", choices=SokobanSolver.HEURISTICS, default="default")
+    parser.add_argument("--freeze_propagator", action="store_true")
+    parser.add_argument("--tunnel_macros", action="store_true")
+    parser.add_argument("--engine", choices=SokobanSolver.ENGINES, default="asp",
+                        help="Solver engine; 'native' and the encodings give the samples for cost_model.py.")
+    parser.add_argument("--memory_budget", type=float, default=None,
+                        help="Memory in MB one grounded horizon may take; see SokobanSolver.MEMORY_POLICIES.")
+    parser.add_argument("--memory_policy", choices=SokobanSolver.MEMORY_POLICIES, default="refuse")
+    parser.add_argument("--ledger", action="store_true",
+                        help="Let runs start after the horizons earlier runs proved UNSAT (skews the timings).")
+    parser.add_argument("--compare_heuristics", action="store_true",
+                        help="Run every map with both the default and the Domain heuristic.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds per map and configuration.")
+    parser.add_argument("--output", help="Write the raw results as JSON to this file (after every run).")
+    parser.add_argument("--retries", type=int, default=1,
+                        help="Run each map in its own process and resume it this often after a crash (0: in-process).")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip the runs already recorded in --output and append the rest.")
+    parser.add_argument("--verbose", action="store_true", help="Show the solver output.")
+    args = parser.parse_args(argv)
+
+    base = {
+        "domain_asp_file": args.domain_file,
+        "max_steps": args.max_steps,
+        "fact_format": args.fact_format,
+        "distance_pruning": args.distance_pruning,
+        "freeze_propagator": args.freeze_propagator,
+        "tunnel_macros": args.tunnel_macros,
+        "engine": args.engine,
+        "memory_budget_mb": args.memory_budget,
+        "memory_policy": args.memory_policy,
+        "ledger_file": LEDGER_FILE if args.ledger else None,
+    }
+    heuristics = SokobanSolver.HEURISTICS if args.compare_heuristics else (args.heuristic,)
+    configurations = [dict(base, heuristic=h) for h in heuristics]
+
+    done = []
+    if args.resume and args.output and os.path.exists(args.output):
+        with open(args.output, 'r', encoding='utf-8') as file:
+            done = json.load(file)
+        print(f"resuming: {len(done)} runs already in {args.output}")
+    records = run_benchmark(expand_references(args.maps) or default_map_files(), configurations, args.timeout, args.verbose,
+                            args.retries, done, args.output)
+    print_table(records)
+
+    if args.output:
+        write_records(records, args.output)
+
+
+if __name__ == "__main__":
+    main()
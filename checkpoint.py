@@ -0,0 +1,66 @@
+# checkpoint.py
+
+import datetime
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHECKPOINT_DIR = os.path.join(BASE_DIR, ".checkpoints")
+
+
+@dataclass
+class Checkpoint:
+    """State of an interrupted solve_plan run."""
+    key: str
+    # Every horizon up to this one has been solved (UNSAT) in this or an earlier run.
+    horizon_completed: int
+    # Best plan found so far (raw do/2 atoms of the encoding) and its horizon.
+    best_steps: List[str] = field(default_factory=list)
+    best_horizon: Optional[int] = None
+    # Lower bound on the horizon learned before solving, e.g. from the pattern database.
+    min_horizon: int = 1
+    stats: Dict[str, int] = field(default_factory=dict)
+    # Seconds spent on the map so far, over all runs.
+    elapsed: float = 0.0
+    saved: str = ""
+
+
+class CheckpointStore:
+    """
+    One JSON file per run key in a directory, written atomically.
+
+    SokobanSolver saves a checkpoint after every horizon and every
+    CHECKPOINT_INTERVAL seconds while a horizon is being solved. The checkpoint
+    is discarded once the run ends with a definite answer. A killed or
+    cancelled run leaves it behind for resume=True.
+    """
+
+    def __init__(self, directory: str = CHECKPOINT_DIR):
+        self.directory = directory
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key: str) -> Optional[Checkpoint]:
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as file:
+                return Checkpoint(**json.load(file))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def save(self, checkpoint: Checkpoint) -> None:
+        checkpoint.saved = datetime.datetime.now().isoformat(timespec="seconds")
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(checkpoint.key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(asdict(checkpoint), file, indent=1)
+        os.replace(tmp_path, path)
+
+    def discard(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,188 @@
+# cost_model.py
+
+import argparse
+import json
+import math
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from tabulate import tabulate
+
+from map_analysis import MapFeatures
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+COST_MODEL_FILE = os.path.join(BASE_DIR, "engine_costs.json")
+
+# Engines the model knows about: the configured per-horizon ASP encoding, the macro
+# (push-level) encoding and the native push search.
+ENGINES = ("asp", "macro", "native")
+
+
+class EngineChoice(NamedTuple):
+    """Outcome of CostModel.choose."""
+    engine: str
+    predictions: Dict[str, Optional[float]]
+    confident: bool
+    # Engines worth racing when the choice is not confident, best first.
+    candidates: List[str]
+
+
+def record_engine(record: Dict) -> str:
+    """The engine a benchmark.py record was measured with."""
+    if record.get("options", {}).get("engine") == "native":
+        return "native"
+    return "macro" if record.get("encoding") == "sokoban_macro.lp" else "asp"
+
+
+class CostModel:
+    """
+    Predicts the solve time of each engine from MapFeatures.
+
+    The model is calibrated from benchmark.py results: every record contributes a
+    sample (engine, features, seconds). The time of an engine on a new map is the
+    distance-weighted geometric mean of its k nearest samples, where distances are
+    taken over log-scaled features. Runs that timed out count as TIMEOUT_PENALTY
+    times their time limit.
+
+    A choice is confident when the nearest calibrated map is close and the best
+    engine is predicted to be at least RACE_MARGIN times faster than the runner-up.
+    """
+
+    NEIGHBOURS = 3
+    TIMEOUT_PENALTY = 2.0
+    RACE_MARGIN = 3.0
+    # Largest feature distance to the nearest sample for a confident choice.
+    MAX_DISTANCE = 1.0
+
+    def __init__(self, samples: Optional[List[Dict]] = None):
+        """
+        Args:
+            samples: Dicts with "engine", "features" (MapFeatures fields), "seconds" and "solved".
+        """
+        self.samples = samples or []
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict]) -> "CostModel":
+        """Builds a model from benchmark.py records; statically unsolvable and refused maps are skipped."""
+        samples = []
+        for record in records:
+            if record.get("status") in ("UNSOLVABLE", "REFUSED") or "features" not in record:
+                continue
+            if record.get("options", {}).get("engine") == "auto":
+                continue  # the front door itself, not a single engine
+            solved = record["status"] != "TIMEOUT"
+            samples.append({
+                "engine": record_engine(record),
+                "map": record["map"],
+                "features": record["features"],
+                "seconds": record["seconds"] if solved else record["seconds"] * cls.TIMEOUT_PENALTY,
+                "solved": solved,
+            })
+        return cls(samples)
+
+    @classmethod
+    def load(cls, path: Optional[str] = COST_MODEL_FILE) -> "CostModel":
+        """Reads a model saved by save(); a missing file gives an empty model."""
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf-8') as file:
+            return cls(json.load(file).get("samples", []))
+
+    def save(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({"samples": self.samples}, file, indent=2)
+
+    @staticmethod
+    def _vector(features: Dict) -> Tuple[float, ...]:
+        return (
+            math.log1p(features["free_cells"]),
+            math.log1p(features["crates"]),
+            math.log1p(features["goals"]),
+            features["tunnel_fraction"],
+            math.log1p(features["horizon_estimate"]),
+            math.log1p(features["ground_size"]),
+        )
+
+    def predict(self, features: MapFeatures, exclude_map: Optional[str] = None) -> Dict[str, Optional[float]]:
+        """
+        Predicted seconds per engine, or None for engines without samples.
+
+        Args:
+            features: Features of the map to solve.
+            exclude_map: Ignore samples of this map (leave-one-out evaluation).
+        """
+        target = self._vector(features._asdict())
+        predictions: Dict[str, Optional[float]] = {}
+        for engine in ENGINES:
+            nearest = sorted(
+                (math.dist(target, self._vector(s["features"])), s["seconds"])
+                for s in self.samples if s["engine"] == engine and s.get("map") != exclude_map
+            )[:self.NEIGHBOURS]
+            if not nearest:
+                predictions[engine] = None
+                continue
+            weights = [1.0 / (distance + 1e-3) for distance, _ in nearest]
+            log_time = sum(w * math.log(max(seconds, 1e-3)) for w, (_, seconds) in zip(weights, nearest))
+            predictions[engine] = round(math.exp(log_time / sum(weights)), 4)
+        return predictions
+
+    def nearest_distance(self, features: MapFeatures, exclude_map: Optional[str] = None) -> float:
+        target = self._vector(features._asdict())
+        return min((math.dist(target, self._vector(s["features"]))
+                    for s in self.samples if s.get("map") != exclude_map), default=math.inf)
+
+    def choose(self, features: MapFeatures, exclude_map: Optional[str] = None) -> EngineChoice:
+        """
+        Picks the engine with the lowest predicted time.
+
+        Engines without samples are raced along with the others whenever the
+        choice is not confident. Without any samples every engine is a candidate.
+        """
+        predictions = self.predict(features, exclude_map)
+        known = sorted((seconds, engine) for engine, seconds in predictions.items() if seconds is not None)
+        if not known:
+            return EngineChoice(ENGINES[-1], predictions, False, list(ENGINES))
+        best_seconds, best = known[0]
+        runner_up = known[1][0] if len(known) > 1 else math.inf
+        confident = (len(known) == len(ENGINES)
+                     and best_seconds * self.RACE_MARGIN <= runner_up
+                     and self.nearest_distance(features, exclude_map) <= self.MAX_DISTANCE)
+        candidates = [engine for seconds, engine in known if seconds <= best_seconds * self.RACE_MARGIN]
+        candidates += [engine for engine in ENGINES if predictions[engine] is None]
+        if len(candidates) < 2 and len(known) > 1:
+            candidates.append(known[1][1])
+        return EngineChoice(best, predictions, confident, candidates)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Calibrate the engine cost model from benchmark.py --output files.")
+    parser.add_argument("results", nargs="+", help="JSON files written by benchmark.py --output.")
+    parser.add_argument("--output", default=COST_MODEL_FILE, help="Where to write the calibrated model.")
+    args = parser.parse_args(argv)
+
+    records = []
+    for path in args.results:
+        with open(path, 'r', encoding='utf-8') as file:
+            records.extend(json.load(file))
+    model = CostModel.from_records(records)
+    model.save(args.output)
+
+    # Leave-one-out check: would the model route each calibration map to its fastest engine?
+    rows, hits = [], 0
+    maps = sorted({s["map"] for s in model.samples})
+    for map_name in maps:
+        measured = {s["engine"]: s["seconds"] for s in model.samples if s["map"] == map_name}
+        features = MapFeatures(**next(s["features"] for s in model.samples if s["map"] == map_name))
+        choice = model.choose(features, exclude_map=map_name)
+        fastest = min(measured, key=measured.get)
+        hits += choice.engine == fastest
+        rows.append((map_name, fastest, choice.engine, "yes" if choice.confident else "race",
+                     ", ".join(f"{e}={s}" for e, s in choice.predictions.items())))
+    print(tabulate(rows, headers=["Map", "Fastest", "Chosen", "Confident", "Predicted seconds"], tablefmt="grid"))
+    print(f"{len(model.samples)} samples, leave-one-out routing accuracy {hits}/{len(maps)}; "
+          f"written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
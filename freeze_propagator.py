@@ -0,0 +1,129 @@
+# freeze_propagator.py
+
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+import clingo
+
+from map_analysis import Cell, MapLayout, player_region, step
+from plan_utils import cell_coords
+
+# Unit steps along each axis; a crate can only move along an axis if both
+# neighbours on it are free.
+AXES: Tuple[Cell, Cell] = ((0, 1), (1, 0))
+
+
+class FreezePropagator:
+    """
+    A clingo propagator that detects frozen-crate deadlocks while solving.
+
+    It watches the at(C,L,T) atoms of crates. Whenever a crate is placed, it checks whether
+    the crates at the same time step form a group in which no crate can ever
+    move again: every crate in the group is blocked on both axes by walls or
+    by other crates of the group. This covers 2x2 blocks, two crates side by
+    side against a wall and longer frozen chains. A frozen group containing a crate
+    off its goal is a deadlock unless that crate already stood on a goal
+    earlier, since the encodings count a goal reached at any moment. The
+    propagator then adds the nogood {at(...) of the group at T} plus
+    {not at(C,G,T') : G goal, T' < T} for a crate C of the group that is off its goal.
+    """
+
+    def __init__(self, layout: MapLayout):
+        """
+        Args:
+            layout: The map layout; cells outside the sokoban's region count as walls.
+        """
+        self.region = player_region(layout) if layout.sokoban is not None else set(layout.floor)
+        self.goals = layout.goals
+        self.conflicts = 0
+        self._placements: Dict[int, List[Tuple[str, Cell, int]]] = {}
+        self._fixed: List[Tuple[str, Cell, int, int]] = []
+        self._goal_visits: Dict[str, List[Tuple[int, int]]] = {}
+        self._states: List[Dict[int, Dict[Cell, Tuple[str, int]]]] = []
+
+    def init(self, init: clingo.PropagateInit) -> None:
+        """Maps crate placements to solver literals and watches them."""
+        crates = {str(atom.symbol.arguments[0]) for atom in init.symbolic_atoms.by_signature("crate", 1)}
+        for atom in init.symbolic_atoms.by_signature("at", 3):
+            obj, loc, time = atom.symbol.arguments
+            crate = str(obj)
+            if crate not in crates:
+                continue  # the sokoban
+            lit = init.solver_literal(atom.literal)
+            placement = (crate, cell_coords(str(loc)), time.number)
+            if placement[1] in self.goals:
+                self._goal_visits.setdefault(crate, []).append((time.number, lit))
+            if init.assignment.is_true(lit):
+                self._fixed.append(placement + (lit,))
+                continue
+            if lit not in self._placements:
+                init.add_watch(lit)
+            self._placements.setdefault(lit, []).append(placement)
+
+        self._states = []
+        for _ in range(init.number_of_threads):
+            state: Dict[int, Dict[Cell, Tuple[str, int]]] = {}
+            for crate, cell, time, lit in self._fixed:
+                state.setdefault(time, {})[cell] = (crate, lit)
+            self._states.append(state)
+
+    def propagate(self, control: clingo.PropagateControl, changes: List[int]) -> None:
+        """Records new placements and adds a nogood for every frozen group found."""
+        state = self._states[control.thread_id]
+        for lit in changes:
+            for crate, cell, time in self._placements[lit]:
+                layer = state.setdefault(time, {})
+                if cell in layer:
+                    continue
+                layer[cell] = (crate, lit)
+                nogood = self._deadlock_nogood(layer, cell, time)
+                if nogood is None or any(control.assignment.is_false(l) for l in nogood):
+                    continue
+                self.conflicts += 1
+                if not control.add_nogood(nogood) or not control.propagate():
+                    return
+
+    def undo(self, thread_id: int, assignment: clingo.Assignment, changes: List[int]) -> None:
+        """Forgets placements that were backtracked."""
+        state = self._states[thread_id]
+        for lit in changes:
+            for _, cell, time in self._placements[lit]:
+                layer = state.get(time)
+                if layer is not None and layer.get(cell, (None, None))[1] == lit:
+                    del layer[cell]
+
+    def _deadlock_nogood(self, layer: Dict[Cell, Tuple[str, int]], cell: Cell, time: int) -> Optional[List[int]]:
+        """Returns the nogood for a frozen group around cell at time that leaves a crate off its goal."""
+        group = self._frozen_group(layer, cell, frozenset())
+        if group is None:
+            return None
+        stuck = next((c for c in sorted(group) if c not in self.goals), None)
+        if stuck is None:
+            return None
+        nogood = [layer[c][1] for c in group]
+        nogood.extend(-lit for t, lit in self._goal_visits.get(layer[stuck][0], []) if t < time)
+        return nogood
+
+    def _frozen_group(self, layer: Dict[Cell, Tuple[str, int]], cell: Cell, assumed: FrozenSet[Cell]) -> Optional[Set[Cell]]:
+        """
+        Returns the crates that keep the crate on cell frozen, including itself,
+        or None if it might still move. Cells in assumed are treated as walls.
+        """
+        group = {cell}
+        for axis in AXES:
+            blockers = self._axis_blockers(layer, cell, axis, assumed | {cell})
+            if blockers is None:
+                return None
+            group |= blockers
+        return group
+
+    def _axis_blockers(self, layer: Dict[Cell, Tuple[str, int]], cell: Cell, axis: Cell, assumed: FrozenSet[Cell]) -> Optional[Set[Cell]]:
+        """Crates blocking movement of cell along axis (empty set for a wall), or None if unblocked."""
+        neighbours = (step(cell, axis), (cell[0] - axis[0], cell[1] - axis[1]))
+        if any(n not in self.region or n in assumed for n in neighbours):
+            return set()
+        for n in neighbours:
+            if n in layer:
+                group = self._frozen_group(layer, n, assumed)
+                if group is not None:
+                    return group
+        return None
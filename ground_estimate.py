@@ -0,0 +1,213 @@
+# ground_estimate.py
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import sys
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import clingo
+from tabulate import tabulate
+
+from map_analysis import MapFeatures, map_features, parse_layout
+from sokoban_map import SokobanMap
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GROUND_MODEL_FILE = os.path.join(BASE_DIR, "ground_costs.json")
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process so far, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class GroundEstimate(NamedTuple):
+    """Predicted size of one grounded horizon."""
+    atoms: int
+    rules: int
+    bytes: int
+
+    @property
+    def megabytes(self) -> float:
+        return self.bytes / 2 ** 20
+
+
+class GroundEstimator:
+    """
+    Predicts the ground program size and memory of an encoding for a horizon.
+
+    With x = free_cells * (crates + 1), the model is
+
+        atoms = atoms_per_step * horizon * x + atoms_static * x
+        rules = rules_per_step * horizon * x + rules_static * x
+        bytes = bytes_base + bytes_per_element * (atoms + rules)
+
+    The coefficients are fitted per encoding by least squares against clingo's
+    grounding statistics and the peak RSS of a fresh process (see main()). The
+    defaults come from the bundled maps at horizons 5, 20 and 60, with the
+    solver's default options (arrival bounds and crate domains on); refit them
+    whenever an encoding or its instance facts change. Encodings without
+    coefficients use those of sokoban.lp.
+    """
+
+    DEFAULT_COEFFICIENTS: Dict[str, Dict[str, float]] = {
+        "sokoban.lp": {
+            "atoms_per_step": 3.5, "atoms_static": -0.38,
+            "rules_per_step": 33.1, "rules_static": -114.5,
+            "bytes_base": 2.97e6, "bytes_per_element": 278.9,
+        },
+        "sokoban_macro.lp": {
+            "atoms_per_step": 2.97, "atoms_static": 6.48,
+            "rules_per_step": 15.4, "rules_static": 21.85,
+            "bytes_base": 4.88e6, "bytes_per_element": 114.9,
+        },
+    }
+    FALLBACK_ENCODING = "sokoban.lp"
+    # The guard keeps this much headroom over the estimate; the fit is off by up to about a third.
+    SAFETY_FACTOR = 1.5
+
+    def __init__(self, coefficients: Optional[Dict[str, Dict[str, float]]] = None):
+        self.coefficients = dict(self.DEFAULT_COEFFICIENTS)
+        self.coefficients.update(coefficients or {})
+
+    @classmethod
+    def load(cls, path: Optional[str] = GROUND_MODEL_FILE) -> "GroundEstimator":
+        """Reads coefficients saved by main(); a missing file keeps the defaults."""
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path, 'r', encoding='utf-8') as file:
+            return cls(json.load(file).get("coefficients", {}))
+
+    def estimate(self, encoding: str, features: MapFeatures, horizon: int) -> GroundEstimate:
+        """
+        Args:
+            encoding: Path or file name of the encoding.
+            features: Features of the map.
+            horizon: Number of time steps (maxsteps).
+        """
+        c = self.coefficients.get(os.path.basename(encoding), self.coefficients[self.FALLBACK_ENCODING])
+        x = features.free_cells * (features.crates + 1)
+        atoms = max(0.0, c["atoms_per_step"] * horizon * x + c["atoms_static"] * x)
+        rules = max(0.0, c["rules_per_step"] * horizon * x + c["rules_static"] * x)
+        return GroundEstimate(round(atoms), round(rules), round(c["bytes_base"] + c["bytes_per_element"] * (atoms + rules)))
+
+    def max_horizon(self, encoding: str, features: MapFeatures, budget_bytes: float, upto: int) -> int:
+        """Largest horizon up to upto whose estimate (with SAFETY_FACTOR) fits the budget, 0 if none."""
+        horizon = 0
+        while horizon < upto and self.estimate(encoding, features, horizon + 1).bytes * self.SAFETY_FACTOR <= budget_bytes:
+            horizon += 1
+        return horizon
+
+    @staticmethod
+    def fit(samples: Iterable[Dict]) -> Dict[str, float]:
+        """
+        Fits the coefficients of one encoding.
+
+        Args:
+            samples: Dicts with "features" (MapFeatures fields), "horizon", "atoms", "rules" and "bytes".
+        """
+        samples = list(samples)
+        rows = [(s["horizon"] * s["features"]["free_cells"] * (s["features"]["crates"] + 1),
+                 s["features"]["free_cells"] * (s["features"]["crates"] + 1)) for s in samples]
+        per_step_atoms, static_atoms = _least_squares(rows, [s["atoms"] for s in samples])
+        per_step_rules, static_rules = _least_squares(rows, [s["rules"] for s in samples])
+        per_element, base = _least_squares([(s["atoms"] + s["rules"], 1) for s in samples],
+                                           [s["bytes"] for s in samples])
+        return {
+            "atoms_per_step": round(per_step_atoms, 2), "atoms_static": round(static_atoms, 2),
+            "rules_per_step": round(per_step_rules, 2), "rules_static": round(static_rules, 2),
+            "bytes_base": round(base, -4), "bytes_per_element": round(per_element, 1),
+        }
+
+
+def _least_squares(rows: List[Tuple[float, float]], targets: List[float]) -> Tuple[float, float]:
+    """Solves min |a * u + b * v - y| over rows (u, v) with the 2x2 normal equations."""
+    suu = sum(u * u for u, _ in rows)
+    suv = sum(u * v for u, v in rows)
+    svv = sum(v * v for _, v in rows)
+    suy = sum(u * y for (u, _), y in zip(rows, targets))
+    svy = sum(v * y for (_, v), y in zip(rows, targets))
+    det = suu * svv - suv * suv
+    if det == 0:
+        return (suy / suu if suu else 0.0), 0.0
+    return (suy * svv - svy * suv) / det, (svy * suu - suy * suv) / det
+
+
+def _ground_sample(arguments: List[str], encoding: str, facts: str, results) -> None:
+    """Grounds one horizon in a fresh process and reports atoms, rules and the memory it took."""
+    before = peak_rss_bytes() or 0
+    ctl = clingo.Control(arguments)
+    ctl.load(encoding)
+    ctl.add("base", [], facts)
+    ctl.ground([("base", [])])
+    atoms = len(ctl.symbolic_atoms)
+    used = (peak_rss_bytes() or 0) - before
+    ctl.solve()
+    results.put((atoms, int(ctl.statistics["problem"]["lp"]["rules"]), used))
+
+
+def main(argv: Optional[List[str]] = None):
+    # Imported here: solver imports this module.
+    from benchmark import default_map_files
+    from solver import SokobanSolver
+
+    parser = argparse.ArgumentParser(
+        description="Calibrate the ground size and memory estimates against clingo's grounding statistics.")
+    parser.add_argument("maps", nargs="*", help="Map files (default: every map in maps/).")
+    parser.add_argument("--domain_files", default="sokoban.lp,sokoban_macro.lp", help="Comma separated encodings.")
+    parser.add_argument("--horizons", default="5,20,60", help="Comma separated horizons to ground.")
+    parser.add_argument("--output", default=GROUND_MODEL_FILE, help="Where to write the fitted coefficients.")
+    args = parser.parse_args(argv)
+
+    horizons = [int(h) for h in args.horizons.split(",")]
+    coefficients, rows = {}, []
+    for domain_file in args.domain_files.split(","):
+        encoding = os.path.join(BASE_DIR, domain_file) if not os.path.exists(domain_file) else domain_file
+        samples = []
+        for map_path in args.maps or default_map_files():
+            map_str = SokobanMap.read_map_file(map_path)
+            layout = parse_layout(map_str)
+            if layout.sokoban is None or not layout.crates:
+                continue
+            solver = SokobanSolver(encoding, tuning_file=None)
+            with contextlib.redirect_stdout(io.StringIO()):
+                facts = solver.generate_facts_from_map(map_str)
+            for horizon in horizons:
+                results = multiprocessing.Queue()
+                process = multiprocessing.Process(
+                    target=_ground_sample,
+                    args=(solver._clingo_arguments(horizon) + ["--solve-limit=0"], encoding, facts, results))
+                process.start()
+                atoms, rules, used = results.get()
+                process.join()
+                samples.append({"map": os.path.basename(map_path), "features": map_features(layout)._asdict(),
+                                "horizon": horizon, "atoms": atoms, "rules": rules, "bytes": used})
+        name = os.path.basename(encoding)
+        coefficients[name] = GroundEstimator.fit(samples)
+        estimator = GroundEstimator({name: coefficients[name]})
+        for s in samples:
+            estimate = estimator.estimate(name, MapFeatures(**s["features"]), s["horizon"])
+            rows.append((name, s["map"], s["horizon"], s["atoms"], estimate.atoms, s["rules"], estimate.rules,
+                         round(s["bytes"] / 2 ** 20, 1), round(estimate.megabytes, 1)))
+
+    print(tabulate(rows, headers=["Encoding", "Map", "Horizon", "Atoms", "Est.", "Rules", "Est.", "MB", "Est."],
+                   tablefmt="grid"))
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump({"coefficients": coefficients}, file, indent=2)
+    print(f"Coefficients written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
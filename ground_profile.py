@@ -0,0 +1,191 @@
+# ground_profile.py
+
+import argparse
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+import clingo
+from clingo import ast
+from tabulate import tabulate
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Predicates of the tag rules; the double underscore keeps them apart from the encoding's own.
+RULE_TAG = "__rule"
+HEAD_TAG = "__head"
+
+
+class RuleProfile(NamedTuple):
+    """Ground size attributed to one rule of an encoding."""
+    index: int
+    file: str
+    line: int
+    # Source of the rule on one line.
+    rule: str
+    # Ground instances of the rule that survive grounding.
+    instances: int
+    # Distinct ground atoms the rule can derive in its head.
+    atoms: int
+
+
+def _global_variables(body) -> List[str]:
+    """
+    Names of the variables shared by the literals of a rule body.
+
+    Variables local to aggregate elements and conditional literals are
+    skipped; aggregate guards (N = #count{...}) count as global.
+    """
+    names: List[str] = []
+
+    class Collector(ast.Transformer):
+        def visit_Variable(self, node):
+            if node.name != "_" and node.name not in names:
+                names.append(node.name)
+            return node
+
+    collector = Collector()
+    for literal in body:
+        if literal.ast_type != ast.ASTType.Literal:
+            continue  # conditional literal: its variables are local
+        atom = literal.atom
+        if atom.ast_type in (ast.ASTType.BodyAggregate, ast.ASTType.Aggregate):
+            for guard in (atom.left_guard, atom.right_guard):
+                if guard is not None:
+                    collector(guard.term)
+        else:
+            collector(atom)
+    return names
+
+
+def _head_terms(head) -> List[Tuple[ast.AST, list]]:
+    """The head atoms of a rule as terms, each with the condition it is derived under."""
+    if head.ast_type == ast.ASTType.Literal:
+        if head.atom.ast_type == ast.ASTType.SymbolicAtom:
+            return [(head.atom.symbol, [])]
+        return []  # constraint
+    if head.ast_type in (ast.ASTType.Aggregate, ast.ASTType.Disjunction):
+        return [(element.literal.atom.symbol, list(element.condition)) for element in head.elements
+                if element.literal.atom.ast_type == ast.ASTType.SymbolicAtom]
+    return []
+
+
+def _tag(location, name: str, index: int, arguments: list) -> ast.AST:
+    number = ast.SymbolicTerm(location, clingo.Number(index))
+    return ast.Literal(location, ast.Sign.NoSign,
+                       ast.SymbolicAtom(ast.Function(location, name, [number] + arguments, 0)))
+
+
+def tagged_program(encoding_files: List[str]) -> Tuple[List[ast.AST], Dict[int, ast.AST]]:
+    """
+    Parses the encodings and adds tag rules next to every rule.
+
+    For a rule i "H :- B." with global variables V1..Vn the program gets
+    "__rule(i,V1,..,Vn) :- B." (one atom per ground instance) and, for every
+    head atom A with condition C, "__head(i,A) :- B, C." (one atom per derivable
+    head atom). Tag atoms occur in no other rule, so the encoding grounds as before.
+
+    Returns:
+        The statements to add and the original rule of every index.
+    """
+    statements: List[ast.AST] = []
+    rules: Dict[int, ast.AST] = {}
+
+    def add(statement) -> None:
+        statements.append(statement)
+        if statement.ast_type != ast.ASTType.Rule:
+            return
+        index = len(rules)
+        rules[index] = statement
+        location, body = statement.location, list(statement.body)
+        variables = [ast.Variable(location, name) for name in _global_variables(body)]
+        statements.append(ast.Rule(location, _tag(location, RULE_TAG, index, variables), body))
+        for term, condition in _head_terms(statement.head):
+            statements.append(ast.Rule(location, _tag(location, HEAD_TAG, index, [term]), body + condition))
+
+    ast.parse_files(encoding_files, add)
+    return statements, rules
+
+
+def profile_grounding(encoding_files: List[str], facts: str, arguments: List[str]) -> Tuple[List[RuleProfile], Dict]:
+    """
+    Grounds the encodings with the instance and attributes the ground program to source rules.
+
+    Args:
+        encoding_files: The encoding and any files loaded with it.
+        facts: Instance facts (generate_facts_from_map).
+        arguments: clingo arguments, e.g. SokobanSolver._clingo_arguments(horizon).
+
+    Returns:
+        The profile of every rule, most ground instances first, and totals: ground_atoms of the
+        whole program without the tags, the rule instances summed over all rules, and the seconds
+        grounding took.
+    """
+    statements, rules = tagged_program(encoding_files)
+    ctl = clingo.Control(arguments + ["--warn=none"])
+    with ast.ProgramBuilder(ctl) as builder:
+        for statement in statements:
+            builder.add(statement)
+    ctl.add("base", [], facts)
+    start = time.monotonic()
+    ctl.ground([("base", [])])
+    seconds = time.monotonic() - start
+
+    instances: Dict[int, int] = {index: 0 for index in rules}
+    heads: Dict[int, Set[clingo.Symbol]] = {index: set() for index in rules}
+    tag_atoms = 0
+    for atom in ctl.symbolic_atoms:
+        name = atom.symbol.name
+        if name == RULE_TAG:
+            instances[atom.symbol.arguments[0].number] += 1
+            tag_atoms += 1
+        elif name == HEAD_TAG:
+            heads[atom.symbol.arguments[0].number].add(atom.symbol.arguments[1])
+            tag_atoms += 1
+
+    profiles = [
+        RuleProfile(index, os.path.basename(rule.location.begin.filename), rule.location.begin.line,
+                    " ".join(str(rule).split()), instances[index], len(heads[index]))
+        for index, rule in rules.items()
+    ]
+    profiles.sort(key=lambda p: (-p.instances, p.index))
+    totals = {
+        "ground_atoms": len(ctl.symbolic_atoms) - tag_atoms,
+        "instances": sum(instances.values()),
+        "seconds": round(seconds, 3),
+    }
+    return profiles, totals
+
+
+def format_profile(profiles: List[RuleProfile], totals: Dict, top: Optional[int] = 20, width: int = 70) -> str:
+    """A ranked table of the rules with the most ground instances."""
+    total = max(totals["instances"], 1)
+    rows = [
+        (rank, f"{p.file}:{p.line}", p.rule if len(p.rule) <= width else p.rule[:width - 3] + "...",
+         p.instances, f"{100 * p.instances / total:.1f}", p.atoms)
+        for rank, p in enumerate(profiles[:top] if top else profiles, 1)
+    ]
+    table = tabulate(rows, headers=["Rank", "Source", "Rule", "Instances", "%", "Head atoms"], tablefmt="grid")
+    return (f"{table}\n{totals['instances']} rule instances, {totals['ground_atoms']} ground atoms, "
+            f"grounded in {totals['seconds']}s")
+
+
+def main(argv: Optional[List[str]] = None):
+    # Imported here: solver imports this module.
+    from solver import SokobanSolver
+    from sokoban_map import SokobanMap
+
+    parser = argparse.ArgumentParser(description="Attribute the ground program of an encoding to its rules.")
+    parser.add_argument("map_file", help="Path to the Sokoban map file, or collection.sok#<number or title>.")
+    parser.add_argument("--domain_file", default=os.path.join(BASE_DIR, "sokoban.lp"), help="ASP encoding.")
+    parser.add_argument("--fact_format", choices=SokobanSolver.FACT_FORMATS, default="location")
+    parser.add_argument("--horizon", type=int, default=20, help="Number of time steps (maxsteps) to ground.")
+    parser.add_argument("--top", type=int, default=20, help="Rules to list (0: all).")
+    args = parser.parse_args(argv)
+
+    solver = SokobanSolver(args.domain_file, fact_format=args.fact_format, tuning_file=None)
+    print(solver.profile_grounding(SokobanMap.read_map_file(args.map_file), args.horizon, args.top))
+
+
+if __name__ == "__main__":
+    main()
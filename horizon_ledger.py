@@ -0,0 +1,114 @@
+# horizon_ledger.py
+
+import datetime
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LEDGER_FILE = os.path.join(BASE_DIR, ".horizon_ledger.json")
+
+
+# An #include directive of an ASP encoding.
+INCLUDE = re.compile(r'^\s*#include\s+"([^"]+)"\s*\.', re.MULTILINE)
+
+
+def _encoding_files(encoding_file: str) -> List[str]:
+    """The encoding followed by the files it #includes (recursively, relative to its directory)."""
+    files, pending = [], [encoding_file]
+    while pending:
+        path = pending.pop(0)
+        if path in files:
+            continue
+        files.append(path)
+        with open(path, 'r', encoding='utf-8') as file:
+            included = INCLUDE.findall(file.read())
+        pending += [os.path.join(os.path.dirname(path), name) for name in included]
+    return files
+
+
+class LedgerEntry(NamedTuple):
+    """What earlier runs proved about one (map, encoding, options) combination."""
+    # Every horizon up to this one is UNSAT (0: nothing proven).
+    unsat_upto: int = 0
+    # Smallest horizon a plan was found at, if any.
+    best_sat: Optional[int] = None
+
+    @property
+    def start_horizon(self) -> int:
+        """First horizon that still needs solving."""
+        start = self.unsat_upto + 1
+        return start if self.best_sat is None else min(start, self.best_sat)
+
+
+class HorizonLedger:
+    """
+    A small JSON file remembering horizon results across runs.
+
+    The solver tries horizons in increasing order, so an UNSAT answer at a horizon
+    proves every smaller one UNSAT as well. The ledger keeps the largest such
+    horizon and the smallest SAT horizon per key, and the next run starts right
+    after the proven part. Results are written as soon as a horizon is decided,
+    so runs that time out or are cancelled still leave their progress behind.
+
+    Keys hash the instance facts, the encoding's contents (with its #includes) and the
+    options that change which horizons are satisfiable. Editing an encoding or the fact
+    generator therefore invalidates its entries.
+    Every update re-reads the file and is written atomically, so concurrent runs
+    on other maps do not lose each other's entries.
+    """
+
+    def __init__(self, path: str = LEDGER_FILE):
+        self.path = path
+
+    @staticmethod
+    def key(instance: str, encoding_file: str, options: Dict) -> str:
+        """
+        Args:
+            instance: The instance facts (or the map).
+            encoding_file: Path of the ASP encoding; its contents and those of the files it
+                #includes are hashed.
+            options: Solver options that change satisfiability at a given horizon.
+        """
+        digest = hashlib.sha256()
+        digest.update("\n".join(line.rstrip() for line in instance.splitlines() if line.strip()).encode("utf-8"))
+        for path in _encoding_files(encoding_file):
+            with open(path, "rb") as file:
+                digest.update(hashlib.sha256(file.read()).digest())
+        digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()[:32]
+
+    def get(self, key: str) -> LedgerEntry:
+        entry = self._read().get(key)
+        if entry is None:
+            return LedgerEntry()
+        return LedgerEntry(entry.get("unsat_upto", 0), entry.get("best_sat"))
+
+    def record_unsat(self, key: str, horizon: int) -> None:
+        """Records that every horizon up to horizon is UNSAT."""
+        self._update(key, lambda e: e._replace(unsat_upto=max(e.unsat_upto, horizon)))
+
+    def record_sat(self, key: str, horizon: int) -> None:
+        """Records a plan found at horizon."""
+        self._update(key, lambda e: e._replace(best_sat=horizon if e.best_sat is None else min(e.best_sat, horizon)))
+
+    def _read(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _update(self, key: str, change) -> None:
+        entries = self._read()
+        stored = entries.get(key, {})
+        entry = change(LedgerEntry(stored.get("unsat_upto", 0), stored.get("best_sat")))
+        entries[key] = dict(entry._asdict(), updated=datetime.datetime.now().isoformat(timespec="seconds"))
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(entries, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,228 @@
+# level_collection.py
+
+import mmap
+import os
+import threading
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+# File extensions of multi-level collections in the XSB format.
+COLLECTION_EXTENSIONS = (".sok", ".xsb")
+
+# XSB symbol -> symbol of the repository's map format. '-' and '_' are floor.
+XSB_SYMBOLS = str.maketrans({"@": "S", "+": "s", "$": "C", "*": "c", ".": "X", "-": " ", "_": " "})
+# Bytes a board row may consist of.
+BOARD_BYTES = b"#@+$*.-_ "
+
+
+class LevelEntry(NamedTuple):
+    """Where one level of a collection is stored."""
+    # 1-based position in the collection.
+    number: int
+    title: str
+    # Byte offsets of the first board row and just past the last one.
+    start: int
+    end: int
+
+
+class Level(NamedTuple):
+    number: int
+    title: str
+    # The board in the repository's map format (see SokobanMap).
+    map_str: str
+
+
+class _Index(NamedTuple):
+    entries: List[LevelEntry]
+    by_title: Dict[str, int]
+
+
+# (real path, size, mtime) -> index, so every collection file is scanned once per process.
+_INDEX_CACHE: Dict[Tuple[str, int, int], _Index] = {}
+_INDEX_LOCK = threading.Lock()
+
+
+def _is_board_row(line: bytes) -> bool:
+    stripped = line.rstrip()
+    return bool(stripped) and b"#" in stripped and not stripped.translate(None, BOARD_BYTES)
+
+
+def _text(line: bytes) -> str:
+    return line.decode("utf-8", errors="replace").strip()
+
+
+def _build_index(data: Union[bytes, mmap.mmap]) -> _Index:
+    """
+    Scans a collection once and records the byte range and title of every level.
+
+    A level is a run of board rows. Its title is taken from a "Title:" line
+    after the board, or else from the last text or comment (';') line before
+    it, or else its number.
+    """
+    entries: List[LevelEntry] = []
+    titles: List[Optional[str]] = []
+    pending: Optional[str] = None
+    board_start, board_end = None, None
+    position, size = 0, len(data)
+    while position < size:
+        newline = data.find(b"\n", position)
+        line_end = size if newline == -1 else newline + 1
+        line = data[position:line_end].rstrip(b"\r\n")
+        if _is_board_row(line):
+            if board_start is None:
+                board_start = position
+            board_end = line_end
+        else:
+            if board_start is not None:
+                entries.append(LevelEntry(len(entries) + 1, "", board_start, board_end))
+                titles.append(pending)
+                board_start, pending = None, None
+            text = _text(line).lstrip(";").strip()
+            key, sep, value = text.partition(":")
+            if sep and key.strip().lower() == "title" and entries and board_start is None:
+                titles[-1] = value.strip()
+                pending = None
+            elif text and not (sep and key.strip().isalpha()):
+                pending = text
+        position = line_end
+    if board_start is not None:
+        entries.append(LevelEntry(len(entries) + 1, "", board_start, board_end))
+        titles.append(pending)
+    entries = [e._replace(title=title or str(e.number)) for e, title in zip(entries, titles)]
+    by_title: Dict[str, int] = {}
+    for entry in entries:
+        by_title.setdefault(entry.title, entry.number)
+        by_title.setdefault(entry.title.casefold(), entry.number)
+    return _Index(entries, by_title)
+
+
+class LevelCollection:
+    """
+    Random access to the levels of a collection file in the XSB/.sok format.
+
+    The file is memory-mapped, and a single pass over it records the byte
+    range and title of every level. Levels are decoded only when they are
+    asked for, so a collection with thousands of levels is never read into
+    memory as a whole. The index is kept for the rest of the process and is
+    rebuilt when the file changes.
+
+    Boards are converted to the repository's map format: '@'/'+' become
+    'S'/'s', '$'/'*' become 'C'/'c', '.' becomes 'X' and '-'/'_' become floor.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap cannot map an empty file.
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._index: Optional[_Index] = None
+
+    def __enter__(self) -> "LevelCollection":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    @property
+    def index(self) -> _Index:
+        if self._index is None:
+            stat = os.fstat(self._file.fileno())
+            key = (os.path.realpath(self.path), stat.st_size, stat.st_mtime_ns)
+            with _INDEX_LOCK:
+                if key not in _INDEX_CACHE:
+                    _INDEX_CACHE[key] = _build_index(self._data)
+                self._index = _INDEX_CACHE[key]
+        return self._index
+
+    @property
+    def entries(self) -> List[LevelEntry]:
+        return self.index.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[Level]:
+        for entry in self.entries:
+            yield self._load(entry)
+
+    def __getitem__(self, number: int) -> Level:
+        """The level with the given 1-based number."""
+        if not 1 <= number <= len(self.entries):
+            raise IndexError(f"{self.path} has {len(self.entries)} levels, no level {number}")
+        return self._load(self.entries[number - 1])
+
+    def find(self, title: str) -> Level:
+        """The first level with this title; case is ignored if there is no exact match."""
+        index = self.index
+        number = index.by_title.get(title, index.by_title.get(title.casefold()))
+        if number is None:
+            raise KeyError(f"No level titled '{title}' in {self.path}")
+        return self[number]
+
+    def level(self, reference: Union[int, str]) -> Level:
+        """A level by number (an int or a string of digits) or by title."""
+        if isinstance(reference, int) or reference.strip().isdigit():
+            return self[int(reference)]
+        return self.find(reference)
+
+    def _load(self, entry: LevelEntry) -> Level:
+        rows = self._data[entry.start:entry.end].decode("utf-8", errors="replace").splitlines()
+        map_str = "\n".join(row.rstrip().translate(XSB_SYMBOLS) for row in rows)
+        return Level(entry.number, entry.title, map_str + "\n")
+
+
+def split_reference(reference: str) -> Tuple[str, Optional[str]]:
+    """
+    Splits "collection.sok#123" or "collection.sok#Title" into the path and the level part.
+
+    A path that exists as given (even one containing '#') has no level part.
+    """
+    if os.path.exists(reference):
+        return reference, None
+    # Both the path and a title may contain '#'; the path is the shortest prefix that exists.
+    position = reference.find("#")
+    while position != -1:
+        if os.path.isfile(reference[:position]):
+            return reference[:position], reference[position + 1:]
+        position = reference.find("#", position + 1)
+    return reference, None
+
+
+def is_collection(path: str) -> bool:
+    return path.lower().endswith(COLLECTION_EXTENSIONS)
+
+
+def read_level(reference: str) -> str:
+    """
+    Reads one level, addressed as "path#number", "path#title" or just "path" for a single-level collection.
+
+    Returns:
+        The level in the repository's map format.
+    """
+    path, level = split_reference(reference)
+    with LevelCollection(path) as collection:
+        if level is not None:
+            try:
+                return collection.level(level).map_str
+            except (IndexError, KeyError) as e:
+                raise ValueError(str(e).strip("'\"")) from None
+        if len(collection) != 1:
+            raise ValueError(f"{path} holds {len(collection)} levels; address one as {path}#<number or title>")
+        return collection[1].map_str
+
+
+def expand_references(paths: List[str]) -> List[str]:
+    """Replaces every collection given without a level by references to all of its levels."""
+    expanded = []
+    for path in paths:
+        if is_collection(path) and split_reference(path)[1] is None:
+            with LevelCollection(path) as collection:
+                expanded += [f"{path}#{entry.number}" for entry in collection.entries]
+        else:
+            expanded.append(path)
+    return expanded
@@ -0,0 +1,200 @@
+# lurd.py
+
+import argparse
+import os
+import re
+from typing import Dict, List, Optional
+
+from map_analysis import DIRECTIONS, parse_layout
+from plan_utils import expand_tunnel, expand_walks, parse_action
+from sokoban_map import SokobanMap
+
+DIRECTION_LETTERS = {"Left": "l", "Up": "u", "Right": "r", "Down": "d"}
+# Action name -> LURD letter: lowercase for moves, uppercase for pushes.
+LETTERS: Dict[str, str] = {
+    **{f"move{name}": letter for name, letter in DIRECTION_LETTERS.items()},
+    **{f"push{name}": letter.upper() for name, letter in DIRECTION_LETTERS.items()},
+}
+# Lowercase LURD letter -> (direction name, row delta, column delta)
+DELTAS = {letter: (name,) + DIRECTIONS[name] for name, letter in DIRECTION_LETTERS.items()}
+
+_RUN = re.compile(r"(.)\1+")
+
+
+def encode_rle(lurd: str) -> str:
+    """Run-length encodes a LURD string, e.g. "rrrUUl" -> "3r2Ul"."""
+    return _RUN.sub(lambda m: f"{len(m.group(0))}{m.group(1)}", lurd)
+
+
+def decode_rle(text: str) -> str:
+    """
+    Expands run-length encoded LURD.
+
+    Counts precede a letter or a parenthesized group ("3r2(lU)"). Whitespace and
+    line breaks are ignored, and plain LURD passes through unchanged.
+
+    Raises:
+        ValueError: On characters other than LURD letters, digits and parentheses.
+    """
+    if not any(ch.isdigit() or ch == "(" for ch in text):
+        lurd = "".join(text.split())
+        if lurd.strip("lurdLURD"):
+            raise ValueError(f"Not a LURD string: {text[:40]}")
+        return lurd
+    groups: List[List[str]] = [[]]
+    counts: List[int] = []
+    number = ""
+    for ch in text:
+        if ch.isdigit():
+            number += ch
+        elif ch in "lurdLURD":
+            groups[-1].append(ch * int(number or 1))
+            number = ""
+        elif ch == "(":
+            counts.append(int(number or 1))
+            groups.append([])
+            number = ""
+        elif ch == ")":
+            if not counts:
+                raise ValueError("Unbalanced ')' in run-length encoded LURD")
+            if number:
+                raise ValueError("Run-length encoded LURD has a count without a letter before ')'")
+            group = "".join(groups.pop()) * counts.pop()
+            groups[-1].append(group)
+        elif not ch.isspace():
+            raise ValueError(f"Unexpected character {ch!r} in run-length encoded LURD")
+    if counts or number:
+        raise ValueError("Run-length encoded LURD ends inside a group or after a count")
+    return "".join(groups[0])
+
+
+def to_lurd(steps: List[str], map_str: Optional[str] = None, run_length: bool = False) -> str:
+    """
+    Converts a plan to LURD.
+
+    Args:
+        steps: do(...) literals in any order.
+        map_str: The initial map. Needed for plans of the macro encoding, whose walks between pushes
+            are implicit; without it every move must be part of the plan.
+        run_length: Run-length encode the result.
+    """
+    if map_str is not None:
+        steps = expand_walks(map_str, steps)
+    timed = sorted((int(s[s.rfind(",") + 1:s.rfind(")")]), s) for s in steps)
+    letters = []
+    for _, literal in timed:
+        name = literal[3:literal.index("(", 3)]
+        letter = LETTERS.get(name)
+        if letter is None:
+            action = parse_action(literal)
+            if not action.is_tunnel:
+                raise ValueError(f"No LURD letter for {literal}")
+            letters.append(LETTERS[f"push{action.direction}"] * len(expand_tunnel(action)))
+        else:
+            letters.append(letter)
+    lurd = "".join(letters)
+    return encode_rle(lurd) if run_length else lurd
+
+
+def from_lurd(map_str: str, lurd: str, fact_format: str = "location") -> List[str]:
+    """
+    Converts (optionally run-length encoded) LURD to the do(...) literals SokobanMap replays.
+
+    Crates are named crate_01, crate_02, ... in row-major order of the initial map, as in the
+    instance facts.
+
+    Args:
+        map_str: The initial map.
+        lurd: The plan in LURD notation.
+        fact_format: Cell ids of the literals: "location" (l3_4) or "coord" (cell(3,4)).
+
+    Raises:
+        ValueError: If a step leaves the floor, pushes a crate into an obstacle, or the case of a
+            letter does not match whether it pushes a crate.
+    """
+    layout = parse_layout(map_str)
+    if layout.sokoban is None:
+        raise ValueError("The map has no sokoban")
+    cell = "cell({},{})".format if fact_format == "coord" else "l{}_{}".format
+    crates = {pos: f"crate_{i:02d}" for i, pos in enumerate(layout.crates, 1)}
+    floor = layout.floor
+    r, c = layout.sokoban
+    steps = []
+    for t, letter in enumerate(decode_rle(lurd)):
+        direction, dr, dc = DELTAS[letter.lower()]
+        nxt = (r + dr, c + dc)
+        if nxt not in floor:
+            raise ValueError(f"Step {t} ({letter}) walks into a wall at {nxt}")
+        crate = crates.get(nxt)
+        if crate is None:
+            if letter.isupper():
+                raise ValueError(f"Step {t} ({letter}) pushes, but there is no crate at {nxt}")
+            steps.append(f"do(move{direction}(sokoban,{cell(r, c)},{cell(*nxt)}),{t})")
+        else:
+            target = (nxt[0] + dr, nxt[1] + dc)
+            if letter.islower():
+                raise ValueError(f"Step {t} ({letter}) moves into the crate at {nxt}; pushes are uppercase")
+            if target not in floor or target in crates:
+                raise ValueError(f"Step {t} ({letter}) pushes the crate at {nxt} into an obstacle")
+            del crates[nxt]
+            crates[target] = crate
+            steps.append(f"do(push{direction}(sokoban,{cell(r, c)},{cell(*nxt)},{cell(*target)},{crate}),{t})")
+        r, c = nxt
+    return steps
+
+
+def _do_literals(text: str) -> List[str]:
+    """Every do(...) literal in text, matched by balanced parentheses."""
+    literals = []
+    start = text.find("do(")
+    while start != -1:
+        depth, end = 0, start + 2
+        for end in range(start + 2, len(text)):
+            depth += {"(": 1, ")": -1}.get(text[end], 0)
+            if depth == 0:
+                break
+        literals.append(text[start:end + 1])
+        start = text.find("do(", end)
+    return literals
+
+
+def read_plan_file(path: str) -> List[str]:
+    """
+    The do(...) literals of a plan file.
+
+    Either one or more literals per line, or the output of solver.py, whose
+    "Step t: ..." lines hold the final plan (earlier models are ignored).
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        lines = file.read().splitlines()
+    step_lines = [line for line in lines if line.startswith("Step ")]
+    return [literal for line in (step_lines or lines) for literal in _do_literals(line)]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Convert plans between do(...) literals and LURD.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="Print the LURD string of a plan file.")
+    export.add_argument("map_file", help="Path to the Sokoban map file, or collection.sok#<number or title>.")
+    export.add_argument("plan_file", help="File with one do(...) literal per line (solver.py output works).")
+    export.add_argument("--rle", action="store_true", help="Run-length encode the LURD string.")
+    load = subparsers.add_parser("import", help="Print the do(...) literals of a LURD string.")
+    load.add_argument("map_file", help="Path to the Sokoban map file, or collection.sok#<number or title>.")
+    load.add_argument("lurd", help="LURD (optionally run-length encoded), or a file containing it.")
+    load.add_argument("--fact_format", choices=("location", "coord"), default="location")
+    args = parser.parse_args(argv)
+
+    map_str = SokobanMap.read_map_file(args.map_file)
+    if args.command == "export":
+        print(to_lurd(read_plan_file(args.plan_file), map_str, run_length=args.rle))
+        return
+    lurd = args.lurd
+    if os.path.isfile(lurd):
+        with open(lurd, "r", encoding="utf-8") as file:
+            lurd = file.read()
+    for literal in from_lurd(map_str, lurd, args.fact_format):
+        print(literal)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+# map_analysis.py
+
+import heapq
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+Cell = Tuple[int, int]
+
+# Direction name (as used in the action names, e.g. pushLeft) -> (row delta, column delta)
+DIRECTIONS: Dict[str, Cell] = {
+    "Left": (0, -1),
+    "Right": (0, 1),
+    "Up": (-1, 0),
+    "Down": (1, 0),
+}
+
+
+def step(cell: Cell, delta: Cell) -> Cell:
+    """Returns the neighbour of cell in the given direction."""
+    return cell[0] + delta[0], cell[1] + delta[1]
+
+
+@dataclass
+class MapLayout:
+    """
+    Static structure of a Sokoban map.
+
+    Coordinates are (row, column) exactly as SokobanMap sees them, i.e. leading
+    spaces of ragged rows are kept.
+    """
+    lines: List[str]
+    walls: Set[Cell] = field(default_factory=set)
+    floor: Set[Cell] = field(default_factory=set)
+    goals: Set[Cell] = field(default_factory=set)
+    crates: List[Cell] = field(default_factory=list)
+    sokoban: Optional[Cell] = None
+    sokoban_count: int = 0
+
+    @property
+    def height(self) -> int:
+        return len(self.lines)
+
+    @property
+    def width(self) -> int:
+        return max((len(row) for row in self.lines), default=0)
+
+
+def parse_layout(map_str: str) -> MapLayout:
+    """
+    Parses a map in the repository's text format.
+
+    Args:
+        map_str: String representation of the Sokoban map.
+
+    Returns:
+        The MapLayout of the map. Crates are listed in row-major order.
+    """
+    lines = [line.rstrip('\r') for line in map_str.split('\n') if line.strip()]
+    layout = MapLayout(lines=lines)
+    for r, row in enumerate(lines):
+        for c, ch in enumerate(row):
+            pos = (r, c)
+            if ch == '#':
+                layout.walls.add(pos)
+                continue
+            layout.floor.add(pos)
+            if ch in ('S', 's'):
+                layout.sokoban = pos
+                layout.sokoban_count += 1
+            elif ch in ('C', 'c'):
+                layout.crates.append(pos)
+            if ch in ('s', 'c', 'X'):
+                layout.goals.add(pos)
+    return layout
+
+
+def player_region(layout: MapLayout, blocked: Optional[Set[Cell]] = None, start: Optional[Cell] = None) -> Set[Cell]:
+    """
+    Flood-fills the floor cells reachable by the sokoban.
+
+    Args:
+        layout: The map layout.
+        blocked: Cells the sokoban cannot enter (e.g. crates). By default crates are
+            passable, which yields the whole playable region of the level.
+        start: Start cell, defaults to the sokoban position.
+
+    Returns:
+        The set of reachable floor cells (empty if there is no sokoban).
+    """
+    start = layout.sokoban if start is None else start
+    if start is None:
+        return set()
+    blocked = blocked or set()
+    region = {start}
+    queue = deque([start])
+    while queue:
+        cell = queue.popleft()
+        for delta in DIRECTIONS.values():
+            nxt = step(cell, delta)
+            if nxt in layout.floor and nxt not in region and nxt not in blocked:
+                region.add(nxt)
+                queue.append(nxt)
+    return region
+
+
+class TunnelPush(NamedTuple):
+    """
+    A macro push of a crate straight through a one-wide tunnel.
+
+    The sokoban stands on player and pushes the crate from start in direction
+    until it leaves the tunnel, lands on a goal or hits a wall. path lists the
+    cells the crate enters, ending with its target.
+    """
+    direction: str
+    player: Cell
+    start: Cell
+    path: Tuple[Cell, ...]
+
+    @property
+    def target(self) -> Cell:
+        return self.path[-1]
+
+    @property
+    def player_end(self) -> Cell:
+        """Where the sokoban stands after the macro: right behind the crate."""
+        return self.path[-2]
+
+    def unit_pushes(self) -> List[Tuple[Cell, Cell, Cell]]:
+        """The single pushes of the macro as (player, crate, crate target) triples."""
+        cells = (self.player, self.start) + self.path
+        return [cells[i:i + 3] for i in range(len(self.path))]
+
+
+def is_tunnel_cell(cell: Cell, delta: Cell, region: Set[Cell]) -> bool:
+    """True if both neighbours of cell perpendicular to delta are outside the region (walls)."""
+    side = (delta[1], delta[0])
+    return step(cell, side) not in region and (cell[0] - side[0], cell[1] - side[1]) not in region
+
+
+def tunnel_pushes(layout: MapLayout, region: Optional[Set[Cell]] = None) -> List[TunnelPush]:
+    """
+    Finds the macro pushes through one-wide tunnels.
+
+    A crate pushed into a tunnel cell can only keep going in the same
+    direction, so pushing it on until it comes out (or reaches a goal or a
+    wall) is a single macro move. Only macros of at least two pushes are
+    returned, since a single push is already an ordinary action.
+
+    Args:
+        layout: The map layout.
+        region: Playable cells; defaults to player_region(layout).
+
+    Returns:
+        The tunnel pushes, ordered by start cell and direction.
+    """
+    region = player_region(layout) if region is None else region
+    pushes = []
+    for start in sorted(region):
+        for name, delta in DIRECTIONS.items():
+            player = (start[0] - delta[0], start[1] - delta[1])
+            entry = step(start, delta)
+            if player not in region or entry not in region or not is_tunnel_cell(entry, delta, region):
+                continue
+            path = [entry]
+            while path[-1] not in layout.goals and is_tunnel_cell(path[-1], delta, region):
+                nxt = step(path[-1], delta)
+                if nxt not in region:
+                    break
+                path.append(nxt)
+            if len(path) > 1:
+                pushes.append(TunnelPush(name, player, start, tuple(path)))
+    return pushes
+
+
+def push_distances(
+    layout: MapLayout, region: Optional[Set[Cell]] = None, tunnels: Iterable[TunnelPush] = ()
+) -> Dict[Cell, int]:
+    """
+    Computes, for every cell, the minimum number of pushes needed to bring a crate
+    standing there onto some goal, ignoring all other crates.
+
+    This is a backward BFS from the goals using pulls: a crate reaches B from
+    A = B - d when the sokoban can stand on A - d.
+
+    Args:
+        layout: The map layout.
+        region: Playable cells; defaults to player_region(layout).
+        tunnels: Macro pushes that count as a single push, see tunnel_pushes().
+
+    Returns:
+        Mapping cell -> push distance. Cells without an entry can never reach a goal.
+    """
+    region = player_region(layout) if region is None else region
+    macros_into: Dict[Cell, List[Cell]] = {}
+    for tunnel in tunnels:
+        macros_into.setdefault(tunnel.target, []).append(tunnel.start)
+    distances = {goal: 0 for goal in layout.goals if goal in region}
+    queue = deque(distances)
+    while queue:
+        cell = queue.popleft()
+        for delta in DIRECTIONS.values():
+            prev = (cell[0] - delta[0], cell[1] - delta[1])
+            player = (prev[0] - delta[0], prev[1] - delta[1])
+            if prev in region and player in region and prev not in distances:
+                distances[prev] = distances[cell] + 1
+                queue.append(prev)
+        for prev in macros_into.get(cell, []):
+            if prev not in distances:
+                distances[prev] = distances[cell] + 1
+                queue.append(prev)
+    return distances
+
+
+def dead_squares(layout: MapLayout, region: Optional[Set[Cell]] = None) -> Set[Cell]:
+    """Returns the playable cells from which a crate can never be pushed onto a goal."""
+    region = player_region(layout) if region is None else region
+    distances = push_distances(layout, region)
+    return {cell for cell in region if cell not in distances}
+
+
+def crate_reachable_cells(layout: MapLayout, start: Cell, region: Optional[Set[Cell]] = None) -> Set[Cell]:
+    """
+    Returns the cells a crate starting at start can be pushed to, ignoring other crates.
+
+    Args:
+        layout: The map layout.
+        start: Initial crate position.
+        region: Playable cells; defaults to player_region(layout).
+    """
+    region = player_region(layout) if region is None else region
+    reachable = {start}
+    queue = deque([start])
+    while queue:
+        cell = queue.popleft()
+        for delta in DIRECTIONS.values():
+            nxt = step(cell, delta)
+            player = (cell[0] - delta[0], cell[1] - delta[1])
+            if nxt in region and player in region and nxt not in reachable:
+                reachable.add(nxt)
+                queue.append(nxt)
+    return reachable
+
+
+def crate_domains(
+    layout: MapLayout, region: Optional[Set[Cell]] = None, tunnels: Iterable[TunnelPush] = ()
+) -> List[Set[Cell]]:
+    """
+    Returns, for every crate in the order of layout.crates, the cells it can ever stand on.
+
+    A crate moves by pushes (and tunnel macros) from its start, ignoring the
+    other crates, and never onto a dead square: from there it could not reach
+    a goal any more.
+
+    Args:
+        layout: The map layout.
+        region: Playable cells; defaults to player_region(layout).
+        tunnels: Macro pushes that move a crate to the end of a tunnel, see tunnel_pushes().
+    """
+    region = player_region(layout) if region is None else region
+    tunnels = list(tunnels)
+    live = push_distances(layout, region, tunnels)
+    macros_from: Dict[Cell, List[Cell]] = {}
+    for tunnel in tunnels:
+        macros_from.setdefault(tunnel.start, []).append(tunnel.target)
+    domains = []
+    for start in layout.crates:
+        reachable = {start}
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            targets = [step(cell, delta) for delta in DIRECTIONS.values()
+                       if (cell[0] - delta[0], cell[1] - delta[1]) in region]
+            for nxt in targets + macros_from.get(cell, []):
+                if nxt in live and nxt not in reachable:
+                    reachable.add(nxt)
+                    queue.append(nxt)
+        domains.append(reachable)
+    return domains
+
+
+def earliest_arrivals(
+    layout: MapLayout, region: Optional[Set[Cell]] = None, tunnels: Iterable[TunnelPush] = ()
+) -> Tuple[Dict[Cell, int], List[Dict[Cell, int]]]:
+    """
+    Computes lower bounds on the step at which each object can first stand on each cell.
+
+    The sokoban's bound is its BFS distance with crates passable. A crate on Y
+    reaches Z = Y + d at step max(crate on Y, sokoban on Y - d) + 1 at the
+    earliest, ignoring all other crates; Dijkstra over these pushes gives the
+    crate's bound for every cell it can be pushed to. Both only relax the real
+    moves, so no plan has an object anywhere before its bound.
+
+    Args:
+        layout: The map layout.
+        region: Playable cells; defaults to player_region(layout).
+        tunnels: Macro pushes that take a single step, see tunnel_pushes(). They move
+            both the crate and the sokoban several cells at once.
+
+    Returns:
+        The sokoban's bounds, and the bounds of every crate in the order of layout.crates.
+        Cells without an entry can never be reached.
+    """
+    region = player_region(layout) if region is None else region
+    tunnels = list(tunnels)
+    player: Dict[Cell, int] = {}
+    if layout.sokoban is not None:
+        player_macros: Dict[Cell, List[Cell]] = {}
+        for tunnel in tunnels:
+            player_macros.setdefault(tunnel.player, []).append(tunnel.player_end)
+        player[layout.sokoban] = 0
+        queue = deque([layout.sokoban])
+        while queue:
+            cell = queue.popleft()
+            for nxt in [step(cell, delta) for delta in DIRECTIONS.values()] + player_macros.get(cell, []):
+                if nxt in region and nxt not in player:
+                    player[nxt] = player[cell] + 1
+                    queue.append(nxt)
+
+    # crate cell -> (sokoban cell, crate target) of every push starting there
+    pushes: Dict[Cell, List[Tuple[Cell, Cell]]] = {}
+    for cell in region:
+        for delta in DIRECTIONS.values():
+            behind, target = (cell[0] - delta[0], cell[1] - delta[1]), step(cell, delta)
+            if behind in player and target in region:
+                pushes.setdefault(cell, []).append((behind, target))
+    for tunnel in tunnels:
+        if tunnel.player in player:
+            pushes.setdefault(tunnel.start, []).append((tunnel.player, tunnel.target))
+
+    crates: List[Dict[Cell, int]] = []
+    for start in layout.crates:
+        arrival = {start: 0}
+        heap = [(0, start)]
+        while heap:
+            t, cell = heapq.heappop(heap)
+            if t > arrival[cell]:
+                continue
+            for behind, target in pushes.get(cell, []):
+                reach = max(t, player[behind]) + 1
+                if reach < arrival.get(target, reach + 1):
+                    arrival[target] = reach
+                    heapq.heappush(heap, (reach, target))
+        crates.append(arrival)
+    return player, crates
+
+
+def map_class(layout: MapLayout) -> str:
+    """
+    Coarse class of a level used to share solver settings between similar maps,
+    e.g. "crates2-3/small": bucketed crate count and number of playable cells.
+    """
+    crates = len(layout.crates)
+    crate_bucket = "crates1" if crates <= 1 else "crates2-3" if crates <= 3 else "crates4+"
+    cells = len(player_region(layout)) if layout.sokoban is not None else len(layout.floor)
+    size_bucket = "small" if cells <= 30 else "medium" if cells <= 80 else "large"
+    return f"{crate_bucket}/{size_bucket}"
+
+
+class MapFeatures(NamedTuple):
+    """Cheap static features of a level, used to predict which solver engine is fastest."""
+    free_cells: int
+    crates: int
+    goals: int
+    tunnel_fraction: float
+    horizon_estimate: int
+    ground_size: int
+
+
+def map_features(layout: MapLayout) -> MapFeatures:
+    """
+    Computes the MapFeatures of a level in linear time.
+
+    horizon_estimate is the sum of the crates' push distances (at least 1). ground_size
+    is a rough count of the action atoms over that horizon: every playable cell can
+    host a move, and a push of every crate, in each of the four directions.
+    """
+    region = player_region(layout) if layout.sokoban is not None else set(layout.floor)
+    tunnel_cells = sum(1 for cell in region if any(is_tunnel_cell(cell, delta, region)
+                                                   for delta in (DIRECTIONS["Right"], DIRECTIONS["Down"])))
+    distances = push_distances(layout, region) if layout.sokoban is not None else {}
+    horizon = max(1, sum(distances.get(crate, 0) for crate in layout.crates))
+    crates = len(layout.crates)
+    return MapFeatures(
+        free_cells=len(region),
+        crates=crates,
+        goals=len(layout.goals),
+        tunnel_fraction=round(tunnel_cells / len(region), 3) if region else 0.0,
+        horizon_estimate=horizon,
+        ground_size=horizon * len(region) * 4 * (crates + 1),
+    )
+
+
+def find_unsolvable_reason(layout: MapLayout) -> Optional[str]:
+    """
+    Runs cheap static checks that prove a map unsolvable.
+
+    Every check over-approximates what the sokoban can do, so a returned reason
+    is a proof; None only means no proof was found.
+
+    Args:
+        layout: The map layout.
+
+    Returns:
+        A human readable reason if the map is provably unsolvable, otherwise None.
+    """
+    if layout.sokoban is None:
+        return "the map has no sokoban"
+    if layout.sokoban_count > 1:
+        return f"the map has {layout.sokoban_count} sokobans"
+    # A crate only has to stand on a goal at some step (sokoban.lp), so crates
+    # already on a goal need no further checks and goals may be shared.
+    region = player_region(layout)
+    dead = dead_squares(layout, region)
+    for crate in layout.crates:
+        if crate in layout.goals:
+            continue
+        if crate not in region:
+            return f"crate at {crate} is outside the sokoban's region"
+        if crate in dead:
+            return f"crate at {crate} is on a dead square"
+        if not crate_reachable_cells(layout, crate, region) & layout.goals:
+            return f"crate at {crate} cannot be pushed onto any goal"
+    return None
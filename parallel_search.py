@@ -0,0 +1,233 @@
+# parallel_search.py
+
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from tabulate import tabulate
+
+from map_analysis import find_unsolvable_reason
+from push_search import PushSearch, Shift
+from sokoban_map import SokobanMap
+from solver import SolveResult
+
+
+def _worker(index: int, workers: int, map_str: str, inboxes, control, results) -> None:
+    """
+    One partition of the parallel search, run in its own process.
+
+    The worker owns the states whose key satisfies key % workers == index. It keeps
+    their parent pointers and its share of the current BFS layer. On "step" it expands
+    its layer and sends every child to its owner's inbox, one batch per worker (possibly
+    empty). It then reads exactly one batch from every worker and keeps the children it
+    has not seen before as its next layer. The time blocked on its inbox is counted as
+    waiting, not as busy time.
+    """
+    search = PushSearch(map_str)
+    parents: Dict[int, Tuple[Optional[int], Optional[Shift]]] = {}
+    layer = []
+    expanded = 0
+    # Seconds spent expanding and merging, and seconds blocked waiting for the other workers' batches.
+    busy, waiting = 0.0, 0.0
+    while True:
+        command, payload = control.get()
+        if command == "seed":
+            key, crates, player = payload
+            parents[key] = (None, None)
+            layer = [(key, crates, player)]
+            results.put((index, None))
+        elif command == "step":
+            started, waited = time.monotonic(), waiting
+            batches: List[list] = [[] for _ in range(workers)]
+            for key, crates, player in layer:
+                expanded += 1
+                for src, dst in search.pushes(crates, search.reachable(crates, player)):
+                    new_crates = crates - {src} | {dst}
+                    reach = search.reachable(new_crates, src)
+                    new_key = search.key(new_crates, reach)
+                    batches[new_key % workers].append((new_key, new_crates, min(reach), key, (src, dst)))
+            for target, batch in enumerate(batches):
+                inboxes[target].put(batch)
+            layer, solved = [], None
+            for _ in range(workers):
+                blocked = time.monotonic()
+                batch = inboxes[index].get()
+                waiting += time.monotonic() - blocked
+                for new_key, new_crates, player, parent, shift in batch:
+                    if new_key in parents:
+                        continue
+                    parents[new_key] = (parent, shift)
+                    layer.append((new_key, new_crates, player))
+                    if solved is None and new_crates <= search.goals:
+                        solved = new_key
+            busy += time.monotonic() - started - (waiting - waited)
+            results.put((index, (len(layer), len(parents), solved)))
+        elif command == "parent":
+            results.put((index, parents.get(payload)))
+        elif command == "stats":
+            results.put((index, (expanded, busy, waiting, len(parents))))
+        elif command == "stop":
+            return
+
+
+class ParallelPushSearch:
+    """
+    Hash-distributed breadth-first push search over several processes.
+
+    States are partitioned by their Zobrist key: worker i owns every state with
+    key % workers == i, as in hash-distributed A*. Children are exchanged in one
+    batch per worker pair and BFS layer through multiprocessing queues (pipes).
+    The coordinator advances all workers layer by layer. That makes termination
+    detection global and simple: the search ends when some worker reports a
+    solved state or every worker's next layer is empty. The plan is traced back
+    by asking the owner of each state for its parent.
+
+    Plans use the fewest pushes, like PushSearch in forward mode.
+    """
+
+    def __init__(self, map_str: str, workers: Optional[int] = None, max_states: int = 2_000_000):
+        """
+        Args:
+            map_str: The map in the text format SokobanMap reads.
+            workers: Number of worker processes, defaults to the number of CPUs.
+            max_states: Give up (CANCELLED) after storing this many states.
+        """
+        self.map_str = map_str
+        self.workers = workers or os.cpu_count() or 1
+        self.max_states = max_states
+        self.search = PushSearch(map_str)
+        self.worker_stats: List[Dict[str, float]] = []
+
+    def solve(self, cancel_event: Optional[threading.Event] = None) -> SolveResult:
+        """
+        Searches for a plan with the fewest pushes.
+
+        Returns:
+            A SolveResult. Its horizon is the number of pushes. Its stats hold the total
+            states, the per-worker states/s and the load balance: the busiest worker's
+            expanded states relative to the mean, in percent.
+        """
+        start_time = time.monotonic()
+        search = self.search
+        reason = find_unsolvable_reason(search.layout)
+        if reason is not None:
+            return SolveResult(SolveResult.UNSOLVABLE, reason=reason, elapsed=time.monotonic() - start_time)
+
+        start_crates = frozenset(search.layout.crates)
+        reach = search.reachable(start_crates, search.layout.sokoban)
+        start_key = search.key(start_crates, reach)
+        if start_crates <= search.goals:
+            return SolveResult(SolveResult.SAT, [], 0, time.monotonic() - start_time)
+
+        inboxes = [multiprocessing.Queue() for _ in range(self.workers)]
+        controls = [multiprocessing.Queue() for _ in range(self.workers)]
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=_worker, args=(i, self.workers, self.map_str, inboxes, controls[i], results),
+                                    daemon=True)
+            for i in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            controls[start_key % self.workers].put(("seed", (start_key, start_crates, min(reach))))
+            results.get()
+            status, reason, solved, depth = SolveResult.UNSAT, "search space exhausted", None, 0
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    status, reason = SolveResult.CANCELLED, "cancelled"
+                    break
+                replies = self._broadcast(controls, results, "step")
+                depth += 1
+                solved = next((reply[2] for reply in replies if reply[2] is not None), None)
+                if solved is not None:
+                    status, reason = SolveResult.SAT, ""
+                    break
+                if all(reply[0] == 0 for reply in replies):
+                    break
+                if sum(reply[1] for reply in replies) > self.max_states:
+                    status, reason = SolveResult.CANCELLED, "state limit reached"
+                    break
+
+            steps = []
+            if solved is not None:
+                steps = search.plan_from_shifts(self._trace(controls, results, solved))
+            stats = self._collect_stats(controls, results, time.monotonic() - start_time)
+            for control in controls:
+                control.put(("stop", None))
+            return SolveResult(status, steps, depth if solved is not None else 0,
+                               time.monotonic() - start_time, reason, stats)
+        finally:
+            for process in processes:
+                process.join(timeout=1)
+                if process.is_alive():
+                    process.terminate()
+
+    def _broadcast(self, controls, results, command: str):
+        """Sends a command to every worker and returns their replies in worker order."""
+        for control in controls:
+            control.put((command, None))
+        replies = [None] * self.workers
+        for _ in range(self.workers):
+            index, reply = results.get()
+            replies[index] = reply
+        return replies
+
+    def _trace(self, controls, results, key: int) -> List[Shift]:
+        """Follows the parent pointers from key back to the start across the owning workers."""
+        shifts = []
+        while True:
+            controls[key % self.workers].put(("parent", key))
+            _, (parent, shift) = results.get()
+            if parent is None:
+                return shifts[::-1]
+            shifts.append(shift)
+            key = parent
+
+    def _collect_stats(self, controls, results, elapsed: float) -> Dict[str, int]:
+        replies = self._broadcast(controls, results, "stats")
+        self.worker_stats = [
+            {"worker": i, "expanded": expanded, "states": states, "busy_seconds": round(busy, 3),
+             "wait_seconds": round(waiting, 3), "states_per_second": round(expanded / busy) if busy > 0 else 0}
+            for i, (expanded, busy, waiting, states) in enumerate(replies)
+        ]
+        expanded = [w["expanded"] for w in self.worker_stats]
+        mean = sum(expanded) / len(expanded)
+        stats = {
+            "workers": self.workers,
+            "states": sum(w["states"] for w in self.worker_stats),
+            "expanded": sum(expanded),
+            "states_per_second": round(sum(expanded) / elapsed) if elapsed > 0 else 0,
+            "load_balance_pct": round(100 * max(expanded) / mean) if mean > 0 else 100,
+        }
+        for w in self.worker_stats:
+            stats[f"worker_{w['worker']}_states_per_second"] = w["states_per_second"]
+        return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Solve a Sokoban map with the parallel native push search.")
+    parser.add_argument("map_file", help="Path to the Sokoban map file, or collection.sok#<number or title>.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: number of CPUs).")
+    parser.add_argument("--max_states", type=int, default=2_000_000)
+    args = parser.parse_args(argv)
+
+    map_str = SokobanMap.read_map_file(args.map_file)
+    engine = ParallelPushSearch(map_str, workers=args.workers, max_states=args.max_states)
+    result = engine.solve()
+    print(f"{result.status} after {result.elapsed:.2f}s: {result.horizon} pushes, {len(result.steps)} moves")
+    if result.reason:
+        print(result.reason)
+    if engine.worker_stats:
+        print(tabulate([list(w.values()) for w in engine.worker_stats],
+                       headers=list(engine.worker_stats[0].keys()), tablefmt="grid"))
+        print(f"Load balance: busiest worker at {result.stats['load_balance_pct']}% of the mean")
+    for action in result.step_actions():
+        print(action)
+
+
+if __name__ == "__main__":
+    main()
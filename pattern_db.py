@@ -0,0 +1,245 @@
+# pattern_db.py
+
+import hashlib
+import itertools
+import os
+import pickle
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from map_analysis import DIRECTIONS, Cell, MapLayout, parse_layout, player_region, push_distances
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, ".pattern_db")
+# Bump when the table layout or the computation changes, so stale cache files are ignored.
+VERSION = 1
+
+# One crate of a pair state: (cell, has been on a goal)
+PairCrate = Tuple[Cell, bool]
+
+
+class PatternDatabase:
+    """
+    Exact push costs for every pair of crate positions on a level.
+
+    For two crates alone on the board (the sokoban anywhere), the table holds
+    the minimum number of pushes until both have reached a goal. The pushes of
+    disjoint pairs of crates are disjoint, so summing the pair costs over a
+    pairing of the crates gives an admissible lower bound (lower_bound). Pairs
+    whose cost is higher than the two single-crate distances together capture
+    crate-crate interference that the per-crate distance sum ignores.
+
+    Two goal semantics are supported:
+
+    - "visited" matches the ASP encodings, where a crate counts once it has stood
+      on a goal at any moment.
+    - "simultaneous" matches the native search, where both crates must end on
+      (different) goals.
+
+    Tables are computed by a backward BFS with pulls over (pair, player area,
+    goal flags) states. They are cached on disk under a hash of the map, so
+    each level is computed once.
+    """
+
+    SEMANTICS = ("visited", "simultaneous")
+    # Above this many crates lower_bound() pairs crates greedily instead of optimally.
+    EXACT_PAIRING_LIMIT = 12
+
+    def __init__(self, layout: MapLayout, semantics: str = "visited", cache_dir: Optional[str] = CACHE_DIR):
+        """
+        Args:
+            layout: The map layout.
+            semantics: One of SEMANTICS.
+            cache_dir: Directory for cached tables; None disables the cache.
+        """
+        if semantics not in self.SEMANTICS:
+            raise ValueError(f"Unknown goal semantics: {semantics}")
+        self.layout = layout
+        self.semantics = semantics
+        self.region = player_region(layout) if layout.sokoban is not None else set()
+        self.goals = layout.goals & self.region
+        self.singles = push_distances(layout, self.region)
+        self.loaded_from_cache = False
+        self.pairs = self._load(cache_dir)
+        if self.pairs is None:
+            self.pairs = self._build()
+            self._save(cache_dir)
+
+    @classmethod
+    def from_map_str(cls, map_str: str, semantics: str = "visited", cache_dir: Optional[str] = CACHE_DIR):
+        return cls(parse_layout(map_str), semantics, cache_dir)
+
+    @property
+    def map_hash(self) -> str:
+        """Identifies the level (and the table format) in the cache."""
+        text = "\n".join(self.layout.lines) + f"\n{self.semantics}\n{VERSION}"
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+    def pair_cost(self, a: Cell, b: Cell) -> Optional[int]:
+        """Pushes needed to bring crates on a and b onto goals, or None if they never can."""
+        return self.pairs.get((a, b) if a <= b else (b, a))
+
+    def interfering_pairs(self) -> Dict[Tuple[Cell, Cell], Optional[int]]:
+        """
+        Pairs of cells whose cost exceeds the sum of the single distances.
+
+        Returns:
+            Mapping (a, b) -> cost, with None for pairs that can never both reach a goal
+            although each crate alone could.
+        """
+        result: Dict[Tuple[Cell, Cell], Optional[int]] = {}
+        live = sorted(self.singles)
+        for a, b in itertools.combinations(live, 2):
+            cost = self.pairs.get((a, b))
+            if cost is None or cost > self.singles[a] + self.singles[b]:
+                result[(a, b)] = cost
+        return result
+
+    def lower_bound(self, crates: Iterable[Cell], done: Iterable[Cell] = ()) -> Optional[int]:
+        """
+        Admissible lower bound on the pushes left in a state.
+
+        Args:
+            crates: Cells of the crates.
+            done: Cells of crates that no longer need a goal (visited semantics:
+                crates that have already stood on one).
+
+        Returns:
+            The bound, or None if some crate or pair of crates can never be solved.
+        """
+        done = set(done)
+        todo = [c for c in crates if c not in done]
+        if any(c not in self.singles for c in todo):
+            return None
+        base = sum(self.singles[c] for c in todo)
+        gains: Dict[Tuple[int, int], int] = {}
+        for i, j in itertools.combinations(range(len(todo)), 2):
+            cost = self.pair_cost(todo[i], todo[j])
+            if cost is None:
+                return None
+            gain = cost - self.singles[todo[i]] - self.singles[todo[j]]
+            if gain > 0:
+                gains[(i, j)] = gain
+        if not gains:
+            return base
+        if len(todo) <= self.EXACT_PAIRING_LIMIT:
+            return base + self._best_pairing(len(todo), gains)
+        return base + self._greedy_pairing(gains)
+
+    @staticmethod
+    def _best_pairing(n: int, gains: Dict[Tuple[int, int], int]) -> int:
+        """Maximum total gain over disjoint pairs, by dynamic programming over subsets."""
+        best = [0] * (1 << n)
+        for mask in range(1, 1 << n):
+            i = (mask & -mask).bit_length() - 1
+            rest = mask & ~(1 << i)
+            value = best[rest]  # crate i stays unpaired
+            for j in range(i + 1, n):
+                if rest & (1 << j) and (i, j) in gains:
+                    value = max(value, gains[(i, j)] + best[rest & ~(1 << j)])
+            best[mask] = value
+        return best[-1]
+
+    @staticmethod
+    def _greedy_pairing(gains: Dict[Tuple[int, int], int]) -> int:
+        used: Set[int] = set()
+        total = 0
+        for (i, j), gain in sorted(gains.items(), key=lambda item: -item[1]):
+            if i not in used and j not in used:
+                used |= {i, j}
+                total += gain
+        return total
+
+    def _load(self, cache_dir: Optional[str]) -> Optional[Dict[Tuple[Cell, Cell], int]]:
+        if cache_dir is None:
+            return None
+        path = os.path.join(cache_dir, f"{self.map_hash}.pkl")
+        try:
+            with open(path, "rb") as file:
+                pairs = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        self.loaded_from_cache = True
+        return pairs
+
+    def _save(self, cache_dir: Optional[str]) -> None:
+        if cache_dir is None:
+            return
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f"{self.map_hash}.pkl")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump(self.pairs, file)
+        os.replace(tmp_path, path)
+
+    def _build(self) -> Dict[Tuple[Cell, Cell], int]:
+        """Runs the backward BFS and keeps, per pair of cells, the cost of the state without goal flags."""
+        if not self.region:
+            return {}
+        areas: Dict[Tuple[Cell, Cell], Dict[Cell, Cell]] = {}
+
+        def anchor(a: Cell, b: Cell, player: Cell) -> Cell:
+            """Smallest cell of the sokoban's area when crates stand on a and b."""
+            key = (a, b) if a <= b else (b, a)
+            components = areas.get(key)
+            if components is None:
+                components = {}
+                for cell in sorted(self.region - {a, b}):
+                    if cell not in components:
+                        for member in player_region(self.layout, blocked={a, b}, start=cell):
+                            components[member] = cell
+                areas[key] = components
+            return components[player]
+
+        def canonical(x: PairCrate, y: PairCrate) -> Tuple[PairCrate, PairCrate]:
+            return (x, y) if x <= y else (y, x)
+
+        distances: Dict[Tuple[PairCrate, PairCrate, Cell], int] = {}
+        queue = deque()
+        if self.semantics == "visited":
+            seeds = [((a, True), (b, True)) for a, b in itertools.combinations(sorted(self.region), 2)]
+        else:
+            seeds = [((a, False), (b, False)) for a, b in itertools.combinations(sorted(self.goals), 2)]
+        for x, y in seeds:
+            for cell in sorted(self.region - {x[0], y[0]}):
+                state = (x, y, anchor(x[0], y[0], cell))
+                if state not in distances:
+                    distances[state] = 0
+                    queue.append(state)
+
+        while queue:
+            state = queue.popleft()
+            x, y, area_anchor = state
+            for (moved, flag), (other, other_flag) in ((x, y), (y, x)):
+                for delta in DIRECTIONS.values():
+                    prev = (moved[0] - delta[0], moved[1] - delta[1])
+                    player = (prev[0] - delta[0], prev[1] - delta[1])
+                    if prev not in self.region or player not in self.region or player == other:
+                        continue
+                    if prev == other or anchor(moved, other, prev) != area_anchor:
+                        continue
+                    for prev_flag in self._previous_flags(moved, prev, flag):
+                        pred = canonical((prev, prev_flag), (other, other_flag)) + (anchor(prev, other, player),)
+                        if pred not in distances:
+                            distances[pred] = distances[state] + 1
+                            queue.append(pred)
+
+        pairs: Dict[Tuple[Cell, Cell], int] = {}
+        for (x, y, _), cost in distances.items():
+            if self.semantics == "visited" and (x[1] != (x[0] in self.goals) or y[1] != (y[0] in self.goals)):
+                continue  # only states where the flags just reflect the current cells are looked up
+            key = (x[0], y[0])
+            if key not in pairs or cost < pairs[key]:
+                pairs[key] = cost
+        return pairs
+
+    def _previous_flags(self, cell: Cell, prev: Cell, flag: bool) -> List[bool]:
+        """Goal flags a crate may have had on prev before being pushed to cell."""
+        if self.semantics == "simultaneous":
+            return [False]
+        if not flag:
+            return [False] if prev not in self.goals else []
+        flags = [True]
+        if cell in self.goals and prev not in self.goals:
+            flags.append(False)
+        return flags
@@ -0,0 +1,262 @@
+# plan_optimizer.py
+
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import os
+import threading
+import time
+from typing import Dict, FrozenSet, List, NamedTuple, Optional
+
+import clingo
+
+from map_analysis import Cell, parse_layout
+from plan_utils import cell_coords, parse_action
+from sokoban_map import SokobanMap
+from solver import SokobanSolver, SolveResult
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Window(NamedTuple):
+    """One segment [start, end) of a plan, with the maps before and after it."""
+    start: int
+    end: int
+    start_map: str
+    end_map: str
+    # Crate cell (row, col) at the start of the window -> crate name used by the plan.
+    labels: Dict[Cell, str]
+    # Instance names (crate_01, ... of start_map) of the crates that, in the original plan,
+    # stand on a goal only at steps inside the window.
+    goal_visitors: FrozenSet[str] = frozenset()
+
+
+def _solve_window(window: Window, domain_asp_file: str, fact_format: str, deadline: float) -> Optional[List[str]]:
+    """
+    Finds a shorter action sequence for one window, or None.
+
+    Runs in a worker process. The window's start map is the instance. Extra
+    constraints pin the crate cells and the sokoban cell at maxsteps to those of
+    the end map. The goal condition of the encoding (every crate on a goal at
+    some step) is kept for the crates whose only goal visits in the original
+    plan lie inside the window, so the replacement keeps those visits, and
+    switched off for the others. The horizon is one step shorter than the window, so any model is
+    an improvement; the encoding's #minimize keeps improving it until the deadline.
+    """
+    solver = SokobanSolver(domain_asp_file, fact_format=fact_format, presolve_checks=False, tuning_file=None)
+    end = parse_layout(window.end_map)
+    program = [solver.generate_facts_from_map(window.start_map), "#defined windowvisitor/1.",
+               "reachedGoal(C) :- crate(C), not windowvisitor(C)."]
+    program += [f"windowvisitor({name})." for name in sorted(window.goal_visitors)]
+    program += [f"windowcrate({solver.cell_term(cell)})." for cell in end.crates]
+    program += [
+        "windowreached(L) :- crate(C), at(C,L,maxsteps).",
+        ":- windowcrate(L), not windowreached(L).",
+        f":- not at(sokoban,{solver.cell_term(end.sokoban)},maxsteps).",
+    ]
+    ctl = clingo.Control(solver._clingo_arguments(window.end - window.start - 1))
+    ctl.load(domain_asp_file)
+    ctl.add("base", [], "\n".join(program))
+    ctl.ground([("base", [])])
+
+    best: List[List[str]] = []
+
+    def on_model(model: clingo.Model) -> None:
+        best[:] = [[str(atom) for atom in model.symbols(shown=True) if atom.name == "do"]]
+
+    with ctl.solve(on_model=on_model, async_=True) as handle:
+        if not handle.wait(max(0.0, deadline - time.time())):
+            handle.cancel()
+        handle.get()
+    if not best:
+        return None
+    names = {f"crate_{i:02d}": window.labels[cell] for i, cell in enumerate(parse_layout(window.start_map).crates, 1)}
+    steps = []
+    for action in sorted((parse_action(s) for s in best[0]), key=lambda a: a.time):
+        args = list(action.args)
+        if action.is_push:
+            args[4] = names.get(args[4], args[4])
+        steps.append(action._replace(args=args).to_literal(window.start + len(steps)))
+    return steps
+
+
+class PlanOptimizer:
+    """
+    Large neighbourhood search over a finished plan.
+
+    The plan is cut into windows of consecutive actions. Each window is
+    re-solved with clingo on its own: the map replayed up to the window start
+    is the instance, and the window must end in exactly the state the original
+    plan reaches there, so the rest of the plan stays valid. A shorter
+    replacement is spliced in. Windows of one round do not overlap, so they are
+    solved in parallel worker processes. Rounds alternate the window offset by
+    half a window, and the search stops when the time budget is spent or two
+    rounds in a row found nothing.
+
+    The start and end states of every window are kept, so the final map of the
+    optimized plan is the final map of the input plan. Since sokoban.lp only asks
+    every crate to stand on a goal at some step, a spliced plan is also replayed
+    and kept only if each crate still visits a goal.
+    """
+
+    # Seconds a single window may take, within the overall time budget.
+    WINDOW_TIMEOUT = 10.0
+
+    def __init__(
+        self,
+        map_str: str,
+        domain_asp_file: str = os.path.join(BASE_DIR, "sokoban.lp"),
+        fact_format: str = "location",
+        window: int = 16,
+        workers: Optional[int] = None,
+        time_budget: float = 30.0,
+    ):
+        """
+        Args:
+            map_str: The initial map.
+            domain_asp_file: A move-level encoding with #minimize over do/2 (sokoban.lp or sokoban_coord.lp).
+            fact_format: Instance format matching the encoding.
+            window: Number of actions per window.
+            workers: Worker processes, defaults to the number of CPUs.
+            time_budget: Seconds for the whole optimization.
+        """
+        if window < 2:
+            raise ValueError("window must cover at least two actions")
+        self.map_str = map_str
+        self.domain_asp_file = domain_asp_file
+        self.fact_format = fact_format
+        self.window = window
+        self.workers = workers or os.cpu_count() or 1
+        self.time_budget = time_budget
+
+    def optimize(self, steps: List[str], cancel_event: Optional[threading.Event] = None) -> SolveResult:
+        """
+        Shortens a plan.
+
+        Args:
+            steps: do(...) literals of a complete, move-level plan (as in SolveResult.steps).
+            cancel_event: When set, the current round is the last one.
+
+        Returns:
+            A SAT SolveResult with the optimized plan. Its stats hold initial_length, final_length,
+            rounds, windows and improved_windows.
+        """
+        start_time = time.monotonic()
+        deadline = time.time() + self.time_budget
+        plan = [a.to_literal(t) for t, a in enumerate(sorted((parse_action(s) for s in steps), key=lambda a: a.time))]
+        final_map = self._replay(plan)[-1]
+        stats = {"initial_length": len(plan), "rounds": 0, "windows": 0, "improved_windows": 0}
+        offset, idle_rounds = 0, 0
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while idle_rounds < 2 and time.time() < deadline and not (cancel_event and cancel_event.is_set()):
+                windows = self._windows(plan, offset)
+                if not windows:
+                    break
+                futures = [pool.submit(_solve_window, w, self.domain_asp_file, self.fact_format,
+                                       min(deadline, time.time() + self.WINDOW_TIMEOUT)) for w in windows]
+                replacements = [future.result() for future in futures]
+                stats["rounds"] += 1
+                stats["windows"] += len(windows)
+                candidate = self._splice(plan, windows, replacements)
+                improved = sum(r is not None for r in replacements)
+                if improved and self._replay(candidate)[-1] == final_map and self._visits_goals(candidate):
+                    plan = candidate
+                    stats["improved_windows"] += improved
+                    idle_rounds = 0
+                else:
+                    idle_rounds += 1
+                offset = self.window // 2 if offset == 0 else 0
+        stats["final_length"] = len(plan)
+        return SolveResult(SolveResult.SAT, plan, len(plan), time.monotonic() - start_time, stats=stats)
+
+    def _replay(self, plan: List[str]) -> List[str]:
+        """Map after every prefix of the plan, replayed with SokobanMap."""
+        with contextlib.redirect_stdout(io.StringIO()):
+            return SokobanMap(self.map_str).get_map_steps(plan)
+
+    def _crate_labels(self, plan: List[str]) -> List[Dict[Cell, str]]:
+        """Crate cell -> crate name of the input plan, for the state before every action and after the last."""
+        labels = {cell: f"crate_{i:02d}" for i, cell in enumerate(parse_layout(self.map_str).crates, 1)}
+        states = [labels]
+        for literal in plan:
+            action = parse_action(literal)
+            if action.is_push:
+                labels = dict(labels)
+                labels[cell_coords(action.args[3])] = labels.pop(cell_coords(action.args[2]))
+            states.append(labels)
+        return states
+
+    def _visits_goals(self, plan: List[str]) -> bool:
+        """True if every crate stands on a goal at some step of the plan, as the encodings require."""
+        goals = parse_layout(self.map_str).goals
+        states = self._crate_labels(plan)
+        visited = {name for labels in states for cell, name in labels.items() if cell in goals}
+        return len(visited) == len(states[0])
+
+    def _windows(self, plan: List[str], offset: int) -> List[Window]:
+        maps = self._replay(plan)
+        states = self._crate_labels(plan)
+        goals = parse_layout(self.map_str).goals
+        bounds = [(s, min(s + self.window, len(plan))) for s in range(offset, len(plan), self.window)]
+        # Crate name -> steps at which it stands on a goal.
+        visits: Dict[str, List[int]] = {}
+        for t, labels_t in enumerate(states):
+            for cell, name in labels_t.items():
+                if cell in goals:
+                    visits.setdefault(name, []).append(t)
+        windows = []
+        for start, end in bounds:
+            if end - start < 2:
+                continue
+            labels = states[start]
+            visitors = {name for name, steps in visits.items() if all(start <= t <= end for t in steps)}
+            # Plan name -> instance name of the window's start map (row-major order).
+            instance_names = {labels[cell]: f"crate_{i:02d}"
+                              for i, cell in enumerate(parse_layout(maps[start]).crates, 1)}
+            windows.append(Window(start, end, maps[start], maps[end], dict(labels),
+                                  frozenset(instance_names[name] for name in visitors)))
+        return windows
+
+    @staticmethod
+    def _splice(plan: List[str], windows: List[Window], replacements: List[Optional[List[str]]]) -> List[str]:
+        """Replaces the improved windows and renumbers the plan from 0."""
+        actions, position = [], 0
+        for window, replacement in zip(windows, replacements):
+            if replacement is None:
+                continue
+            actions += plan[position:window.start] + replacement
+            position = window.end
+        actions += plan[position:]
+        return [parse_action(s).to_literal(t) for t, s in enumerate(actions)]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Solve a map, then shorten the plan window by window.")
+    parser.add_argument("map_file", help="Path to the Sokoban map file, or collection.sok#<number or title>.")
+    parser.add_argument("--engine", choices=SokobanSolver.ENGINES, default="native",
+                        help="Engine for the initial plan.")
+    parser.add_argument("--domain_file", default=os.path.join(BASE_DIR, "sokoban.lp"),
+                        help="Encoding for the windows (and the asp engine).")
+    parser.add_argument("--window", type=int, default=16, help="Actions per window.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: number of CPUs).")
+    parser.add_argument("--time_budget", type=float, default=30.0, help="Seconds for the optimization.")
+    args = parser.parse_args(argv)
+
+    map_str = SokobanMap.read_map_file(args.map_file)
+    with contextlib.redirect_stdout(io.StringIO()):
+        initial = SokobanSolver(args.domain_file, engine=args.engine).solve_plan(map_str)
+    if initial.status != SolveResult.SAT:
+        print(f"No plan to optimize: {initial.status} {initial.reason}")
+        return
+    result = PlanOptimizer(map_str, args.domain_file, window=args.window, workers=args.workers,
+                           time_budget=args.time_budget).optimize(initial.steps)
+    print(f"{result.stats['initial_length']} -> {result.stats['final_length']} actions in {result.elapsed:.2f}s "
+          f"({result.stats['improved_windows']} of {result.stats['windows']} windows improved, "
+          f"{result.stats['rounds']} rounds)")
+    for action in result.step_actions():
+        print(action)
+
+
+if __name__ == "__main__":
+    main()
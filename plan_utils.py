@@ -0,0 +1,199 @@
+# plan_utils.py
+
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from map_analysis import DIRECTIONS, Cell, parse_layout, step
+
+
+class Action(NamedTuple):
+    """A parsed do(Action, T) literal, e.g. do(pushRight(sokoban,l1_3,l1_4,l1_5,crate_01), 2)."""
+    name: str
+    args: List[str]
+    time: int
+
+    @property
+    def is_push(self) -> bool:
+        return self.name.startswith("push")
+
+    @property
+    def is_tunnel(self) -> bool:
+        """True for tunnel macro pushes, e.g. tunnelRight(sokoban,X,Y,Z,C)."""
+        return self.name.startswith("tunnel")
+
+    @property
+    def direction(self) -> str:
+        """Direction suffix of the action name (Left, Right, Up or Down)."""
+        for prefix in ("push", "move", "tunnel"):
+            if self.name.startswith(prefix):
+                return self.name[len(prefix):]
+        raise ValueError(f"Unknown action: {self.name}")
+
+    def to_literal(self, time: Optional[int] = None) -> str:
+        """Formats the action as a do/2 literal, optionally at another time step."""
+        return f"do({self.name}({','.join(self.args)}),{self.time if time is None else time})"
+
+
+def split_arguments(text: str) -> List[str]:
+    """Splits a comma separated argument list, ignoring commas inside parentheses."""
+    args, current, depth = [], '', 0
+    for char in text:
+        if char == ',' and depth == 0:
+            args.append(current.strip())
+            current = ''
+            continue
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        current += char
+    if current.strip():
+        args.append(current.strip())
+    return args
+
+
+def parse_action(literal: str) -> Action:
+    """
+    Parses a do(Action, T) literal.
+
+    Args:
+        literal: The literal, with or without spaces after commas.
+
+    Returns:
+        The parsed Action.
+
+    Raises:
+        ValueError: If the literal is not a do/2 atom over a function term.
+    """
+    literal = literal.strip()
+    if not literal.startswith("do(") or not literal.endswith(")"):
+        raise ValueError(f"Not a do/2 literal: {literal}")
+    parts = split_arguments(literal[len("do("):-1])
+    if len(parts) != 2 or '(' not in parts[0]:
+        raise ValueError(f"Incorrect action format: {literal}")
+    action_str, time_str = parts
+    name = action_str[:action_str.find('(')]
+    return Action(name, split_arguments(action_str[len(name) + 1:-1]), int(time_str))
+
+
+def cell_coords(cell_id: str) -> Cell:
+    """Converts 'l3_4' or 'cell(3,4)' into (3, 4)."""
+    if cell_id.startswith("cell("):
+        row, col = cell_id[len("cell("):-1].split(',')
+    else:
+        row, col = cell_id.lstrip('l').split('_')
+    return int(row), int(col)
+
+
+def cell_id_like(pos: Cell, example: str) -> str:
+    """Formats pos in the same cell id style as example."""
+    if example.startswith("cell("):
+        return f"cell({pos[0]},{pos[1]})"
+    return f"l{pos[0]}_{pos[1]}"
+
+
+def direction_between(src: Cell, dst: Cell) -> str:
+    """Name of the direction leading from src to the adjacent cell dst."""
+    delta = (dst[0] - src[0], dst[1] - src[1])
+    for name, candidate in DIRECTIONS.items():
+        if candidate == delta:
+            return name
+    raise ValueError(f"Cells {src} and {dst} are not adjacent")
+
+
+def shortest_walk(floor: Set[Cell], blocked: Set[Cell], src: Cell, dst: Cell) -> Optional[List[Cell]]:
+    """
+    Breadth-first shortest path for the sokoban.
+
+    Returns:
+        The cells visited after src up to and including dst, or None if dst is unreachable.
+    """
+    if src == dst:
+        return []
+    parents: Dict[Cell, Cell] = {src: src}
+    queue = deque([src])
+    while queue:
+        cell = queue.popleft()
+        for delta in DIRECTIONS.values():
+            nxt = step(cell, delta)
+            if nxt in parents or nxt not in floor or nxt in blocked:
+                continue
+            parents[nxt] = cell
+            if nxt == dst:
+                path = [nxt]
+                while parents[path[-1]] != src:
+                    path.append(parents[path[-1]])
+                return path[::-1]
+            queue.append(nxt)
+    return None
+
+
+def expand_tunnel(action: Action) -> List[Action]:
+    """
+    Splits a tunnel macro tunnelD(S,X,Y,Z,C) into the unit pushes pushD taking the crate from Y to Z.
+
+    The returned actions all carry the macro's time step.
+    """
+    delta = DIRECTIONS[action.direction]
+    sokoban, player, crate, target, name = action.args
+    pushes = []
+    pos, end = cell_coords(crate), cell_coords(target)
+    while pos != end:
+        nxt = step(pos, delta)
+        pushes.append(Action(f"push{action.direction}",
+                             [sokoban, player, cell_id_like(pos, crate), cell_id_like(nxt, crate), name],
+                             action.time))
+        player, pos = cell_id_like(pos, crate), nxt
+    return pushes
+
+
+def expand_walks(map_str: str, steps: List[str]) -> List[str]:
+    """
+    Replaces implicit walks and tunnel macros in a plan by explicit unit actions.
+
+    Plans of the macro encoding (sokoban_macro.lp) only contain pushes; the
+    sokoban walks to the pushing position in between. Every push whose start
+    cell differs from the current sokoban position gets the shortest walk
+    inserted before it. Tunnel macros (tunnelLeft, ...) are split into their
+    unit pushes. Plans that already contain every move are returned unchanged
+    apart from renumbering from 0.
+
+    Args:
+        map_str: The initial map.
+        steps: do(...) literals in any order.
+
+    Returns:
+        The expanded plan as do(...) literals with consecutive time steps.
+
+    Raises:
+        ValueError: If a pushing position cannot be reached.
+    """
+    layout = parse_layout(map_str)
+    crates = set(layout.crates)
+    player = layout.sokoban
+    expanded: List[str] = []
+    for action in sorted((parse_action(s) for s in steps), key=lambda a: a.time):
+        src, dst = cell_coords(action.args[1]), cell_coords(action.args[2])
+        if (action.is_push or action.is_tunnel) and player is not None and player != src:
+            path = shortest_walk(layout.floor, crates, player, src)
+            if path is None:
+                raise ValueError(f"Cannot walk from {player} to {src} before {action.to_literal()}")
+            for cell in path:
+                move = Action(f"move{direction_between(player, cell)}",
+                              [action.args[0], cell_id_like(player, action.args[1]), cell_id_like(cell, action.args[1])],
+                              len(expanded))
+                expanded.append(move.to_literal())
+                player = cell
+        if action.is_tunnel:
+            for push in expand_tunnel(action):
+                crates.discard(cell_coords(push.args[2]))
+                crates.add(cell_coords(push.args[3]))
+                expanded.append(push.to_literal(len(expanded)))
+                player = cell_coords(push.args[2])
+            continue
+        if action.is_push:
+            crates.discard(dst)
+            crates.add(cell_coords(action.args[3]))
+        expanded.append(action.to_literal(len(expanded)))
+        player = dst
+    return expanded
@@ -0,0 +1,265 @@
+# push_search.py
+
+import argparse
+import itertools
+import threading
+import time
+from typing import Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
+
+from map_analysis import (
+    DIRECTIONS,
+    Cell,
+    crate_reachable_cells,
+    find_unsolvable_reason,
+    parse_layout,
+    player_region,
+    push_distances,
+    step,
+)
+from pattern_db import PatternDatabase
+from plan_utils import cell_id_like, expand_walks
+from sokoban_map import SokobanMap
+from solver import SolveResult
+from state_hash import ZobristHasher
+
+Crates = FrozenSet[Cell]
+# A crate displacement (from, to); the sokoban's position follows from the direction.
+Shift = Tuple[Cell, Cell]
+# (state key, crates, normalized player cell)
+Node = Tuple[int, Crates, Cell]
+
+
+class PushSearch:
+    """
+    Native breadth-first search over push states.
+
+    A state is the set of crate cells plus the area the sokoban can reach
+    without pushing, which is identified by its smallest cell. Walking is free,
+    so the search counts pushes. Unlike the ASP encodings, a state is solved
+    only when all crates stand on goals at the same time.
+
+    Two modes are available:
+
+    - "forward" expands pushes from the start until a solved state appears.
+    - "bidirectional" also expands pulls backwards from every solved state,
+      with the sokoban in any area. The two frontiers meet through their
+      shared Zobrist state key. The pull half is reversed into pushes, and
+      the stitched plan is replayed before it is returned.
+
+    Both modes expand whole BFS layers, so the plan found uses the fewest pushes.
+    """
+
+    MODES = ("forward", "bidirectional")
+
+    def __init__(self, map_str: str, max_states: int = 2_000_000, pattern_db: bool = False):
+        """
+        Args:
+            map_str: The map in the text format SokobanMap reads.
+            max_states: Give up (CANCELLED) after storing this many states.
+            pattern_db: Skip pushes that leave two crates which can never both reach a goal,
+                according to the crate-pair PatternDatabase.
+        """
+        self.map_str = map_str
+        self.max_states = max_states
+        self.layout = parse_layout(map_str)
+        self.region = player_region(self.layout) if self.layout.sokoban is not None else set()
+        self.goals = self.layout.goals & self.region
+        self.hasher = ZobristHasher(self.layout)
+        # Cells a crate can still be pushed from onto a goal, and cells any crate can be pushed to.
+        self.live = set(push_distances(self.layout, self.region))
+        self.pullable: Set[Cell] = set()
+        for crate in self.layout.crates:
+            if crate in self.region:
+                self.pullable |= crate_reachable_cells(self.layout, crate, self.region)
+        self.pdb = PatternDatabase(self.layout, "simultaneous") if pattern_db and self.region else None
+        self.stats: Dict[str, int] = {}
+
+    def reachable(self, crates: Crates, player: Cell) -> Set[Cell]:
+        """Cells the sokoban can walk to from player without pushing."""
+        return player_region(self.layout, blocked=set(crates), start=player)
+
+    def key(self, crates: Crates, reach: Set[Cell]) -> int:
+        return self.hasher.hash_crates(crates) ^ self.hasher.player_key(min(reach))
+
+    def pushes(self, crates: Crates, reach: Set[Cell]) -> Iterator[Shift]:
+        """Pushes available in a state, skipping dead squares."""
+        for crate in crates:
+            for delta in DIRECTIONS.values():
+                target = step(crate, delta)
+                if target in self.live and target not in crates and (crate[0] - delta[0], crate[1] - delta[1]) in reach:
+                    if self.pdb is not None and any(self.pdb.pair_cost(target, other) is None
+                                                    for other in crates if other != crate):
+                        continue
+                    yield crate, target
+
+    def pulls(self, crates: Crates, reach: Set[Cell]) -> Iterator[Shift]:
+        """Pulls available in a state: the sokoban stands next to a crate and steps back, dragging it."""
+        for crate in crates:
+            for delta in DIRECTIONS.values():
+                target = step(crate, delta)
+                retreat = step(target, delta)
+                if target in reach and target in self.pullable and retreat in self.region and retreat not in crates:
+                    yield crate, target
+
+    def solve(self, mode: str = "bidirectional", cancel_event: Optional[threading.Event] = None) -> SolveResult:
+        """
+        Searches for a plan with the fewest pushes.
+
+        Args:
+            mode: One of MODES.
+            cancel_event: When set, the search stops with status CANCELLED.
+
+        Returns:
+            A SolveResult; horizon is the number of pushes and stats holds the search counters.
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        start_time = time.monotonic()
+        reason = find_unsolvable_reason(self.layout)
+        if reason is not None:
+            return SolveResult(SolveResult.UNSOLVABLE, reason=reason, elapsed=time.monotonic() - start_time)
+
+        self.stats = {"expanded": 0, "forward_states": 0, "backward_states": 0}
+        start_crates = frozenset(self.layout.crates)
+        start_reach = self.reachable(start_crates, self.layout.sokoban)
+        start_key = self.key(start_crates, start_reach)
+        forward: Dict[int, Tuple[Optional[int], Optional[Shift], Crates, Cell]] = {
+            start_key: (None, None, start_crates, min(start_reach))
+        }
+        forward_layer: List[Node] = [(start_key, start_crates, min(start_reach))]
+        backward: Dict[int, Tuple[Optional[int], Optional[Shift], Crates, Cell]] = {}
+        backward_layer: List[Node] = []
+        if mode == "bidirectional":
+            for crates, player in self._solved_states():
+                reach = self.reachable(crates, player)
+                key = self.key(crates, reach)
+                if key not in backward:
+                    backward[key] = (None, None, crates, min(reach))
+                    backward_layer.append((key, crates, min(reach)))
+
+        meeting = self._meeting(forward_layer, backward, mode)
+        while meeting is None:
+            if cancel_event is not None and cancel_event.is_set():
+                return self._result(SolveResult.CANCELLED, [], forward, backward, start_time, "cancelled")
+            if len(forward) + len(backward) > self.max_states:
+                return self._result(SolveResult.CANCELLED, [], forward, backward, start_time, "state limit reached")
+            grow_forward = mode == "forward" or len(forward_layer) <= len(backward_layer)
+            if grow_forward:
+                forward_layer = self._expand(forward_layer, forward, self.pushes, push=True)
+                meeting = self._meeting(forward_layer, backward, mode)
+            else:
+                backward_layer = self._expand(backward_layer, backward, self.pulls, push=False)
+                meeting = self._meeting(backward_layer, forward, mode, backward_side=True)
+            if not forward_layer or (mode == "bidirectional" and not backward_layer and meeting is None):
+                return self._result(SolveResult.UNSAT, [], forward, backward, start_time, "search space exhausted")
+
+        shifts = self._trace(forward, meeting) + self._trace_back(backward, meeting)
+        steps = self.plan_from_shifts(shifts)
+        return self._result(SolveResult.SAT, steps, forward, backward, start_time, horizon=len(shifts))
+
+    def _solved_states(self) -> Iterator[Tuple[Crates, Cell]]:
+        """Every goal configuration with the sokoban in each of its free areas."""
+        for goals in itertools.combinations(sorted(self.goals), len(self.layout.crates)):
+            crates = frozenset(goals)
+            seen: Set[Cell] = set()
+            for cell in sorted(self.region - crates):
+                if cell not in seen:
+                    seen |= self.reachable(crates, cell)
+                    yield crates, cell
+
+    def _expand(self, layer: List[Node], parents: Dict, moves, push: bool) -> List[Node]:
+        """Expands one BFS layer with pushes (forward) or pulls (backward)."""
+        next_layer = []
+        for key, crates, player in layer:
+            self.stats["expanded"] += 1
+            for src, dst in moves(crates, self.reachable(crates, player)):
+                new_crates = crates - {src} | {dst}
+                new_player = src if push else step(dst, (dst[0] - src[0], dst[1] - src[1]))
+                reach = self.reachable(new_crates, new_player)
+                new_key = self.key(new_crates, reach)
+                if new_key in parents:
+                    continue
+                parents[new_key] = (key, (src, dst), new_crates, min(reach))
+                next_layer.append((new_key, new_crates, min(reach)))
+        return next_layer
+
+    def _meeting(self, layer: List[Node], other: Dict, mode: str, backward_side: bool = False) -> Optional[int]:
+        """Returns the key of a state of the new layer that completes a plan, if any."""
+        for key, crates, _ in layer:
+            if mode == "forward" and not backward_side and crates <= self.goals:
+                return key
+            if key in other and other[key][2] == crates:
+                return key
+        return None
+
+    @staticmethod
+    def _trace(forward: Dict, key: int) -> List[Shift]:
+        """Pushes from the start to the state with the given key."""
+        shifts = []
+        while forward[key][0] is not None:
+            parent, shift = forward[key][:2]
+            shifts.append(shift)
+            key = parent
+        return shifts[::-1]
+
+    @staticmethod
+    def _trace_back(backward: Dict, key: int) -> List[Shift]:
+        """Pushes from the state with the given key to a solved state: the pulls, reversed."""
+        shifts = []
+        while key in backward and backward[key][0] is not None:
+            parent, (src, dst) = backward[key][:2]
+            shifts.append((dst, src))
+            key = parent
+        return shifts
+
+    def plan_from_shifts(self, shifts: List[Shift]) -> List[str]:
+        """
+        Turns crate displacements into a full move plan and validates it.
+
+        Raises:
+            ValueError: If the stitched plan does not replay to a solved map.
+        """
+        example = "l0_0"
+        names = {pos: f"crate_{i:02d}" for i, pos in enumerate(self.layout.crates, start=1)}
+        pushes = []
+        for t, (src, dst) in enumerate(shifts):
+            delta = (dst[0] - src[0], dst[1] - src[1])
+            direction = next(name for name, d in DIRECTIONS.items() if d == delta)
+            player = (src[0] - delta[0], src[1] - delta[1])
+            if src not in names or dst in names or dst not in self.region:
+                raise ValueError(f"Stitched plan pushes an absent crate or into a blocked cell at step {t}")
+            name = names.pop(src)
+            names[dst] = name
+            pushes.append(f"do(push{direction}(sokoban,{cell_id_like(player, example)},{cell_id_like(src, example)},"
+                          f"{cell_id_like(dst, example)},{name}),{t})")
+        if not set(names) <= self.goals:
+            raise ValueError("Stitched plan does not solve the map")
+        return expand_walks(self.map_str, pushes)
+
+    def _result(self, status: str, steps: List[str], forward: Dict, backward: Dict, start_time: float,
+                reason: str = "", horizon: int = 0) -> SolveResult:
+        self.stats["forward_states"] = len(forward)
+        self.stats["backward_states"] = len(backward)
+        return SolveResult(status, steps, horizon, time.monotonic() - start_time, reason, dict(self.stats))
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Solve a Sokoban map with the native push search.")
+    parser.add_argument("map_file", help="Path to the Sokoban map file, or collection.sok#<number or title>.")
+    parser.add_argument("--mode", choices=PushSearch.MODES, default="bidirectional")
+    parser.add_argument("--max_states", type=int, default=2_000_000)
+    parser.add_argument("--pattern_db", action="store_true", help="Prune pushes into dead crate pairs.")
+    args = parser.parse_args(argv)
+
+    map_str = SokobanMap.read_map_file(args.map_file)
+    result = PushSearch(map_str, max_states=args.max_states, pattern_db=args.pattern_db).solve(args.mode)
+    print(f"{result.status} after {result.elapsed:.2f}s: {result.horizon} pushes, {len(result.steps)} moves")
+    print(", ".join(f"{k}={v}" for k, v in result.stats.items()))
+    if result.reason:
+        print(result.reason)
+    for action in result.step_actions():
+        print(action)
+
+
+if __name__ == "__main__":
+    main()
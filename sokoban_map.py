@@ -1,6 +1,8 @@
 #sokoban_map.py
 from typing import List, Tuple
 
+from level_collection import is_collection, read_level, split_reference
+
 
 class SokobanMap:
     """
@@ -33,11 +35,15 @@ class SokobanMap:
         Reads the content of a map file and returns it as a string.
 
         Args:
-            file_path: Path to the map file.
+            file_path: Path to the map file, or a level of an XSB collection
+                addressed as "collection.sok#123" or "collection.sok#Title".
 
         Returns:
             A string containing the map.
         """
+        path, level = split_reference(file_path)
+        if level is not None or is_collection(path):
+            return read_level(file_path)
         try:
             with open(file_path, 'r', encoding='utf-8') as file:
                 return file.read()
@@ -240,7 +246,7 @@ class SokobanMap:
         Converts a cell identifier to row and column coordinates.
 
         Args:
-            cell_id: Cell identifier in string format, e.g., 'l0_1'.
+            cell_id: Cell identifier, either 'l0_1' or the coordinate term 'cell(0,1)'.
 
         Returns:
             A tuple of two integers (row, column).
@@ -249,6 +255,9 @@ class SokobanMap:
             ValueError: If the cell identifier format is incorrect.
         """
         try:
+            if cell_id.startswith('cell('):
+                row_str, col_str = cell_id[len('cell('):-1].split(',')
+                return int(row_str), int(col_str)
             if cell_id.startswith('l'):
                 cell_id = cell_id[1:]
             row_str, col_str = cell_id.split('_')
@@ -1,14 +1,76 @@
 # solver.py
 
-from json import dumps
+from json import dumps, load
 import clingo
 import argparse
+import copy
+import os
 import math
-from typing import List, Tuple, Set, Optional, Dict
+from typing import Callable, List, Tuple, Set, Optional, Dict
+from dataclasses import dataclass, field
 import datetime
+import threading
 import time
-
+import queue
+
+from cost_model import COST_MODEL_FILE, CostModel
+from ground_estimate import GROUND_MODEL_FILE, GroundEstimator, peak_rss_bytes
+from horizon_ledger import LEDGER_FILE, HorizonLedger
+from checkpoint import CHECKPOINT_DIR, Checkpoint, CheckpointStore
+from asp_validator import validate_asp_encoding
+from ground_profile import format_profile, profile_grounding
 from sokoban_map import SokobanMap
+from plan_utils import expand_walks
+from freeze_propagator import FreezePropagator
+from pattern_db import PatternDatabase
+from map_analysis import (
+    DIRECTIONS,
+    MapLayout,
+    TunnelPush,
+    crate_domains,
+    earliest_arrivals,
+    find_unsolvable_reason,
+    map_class,
+    map_features,
+    parse_layout,
+    player_region,
+    push_distances,
+    step,
+    tunnel_pushes,
+)
+
+
+@dataclass
+class SolveProgress:
+    """A progress report emitted by SokobanSolver.solve_plan."""
+    horizon: int
+    elapsed: float
+    best_steps: List[str]
+    message: str = ""
+
+
+@dataclass
+class SolveResult:
+    """Structured outcome of SokobanSolver.solve_plan."""
+    SAT = "SAT"
+    UNSAT = "UNSAT"
+    CANCELLED = "CANCELLED"
+    UNSOLVABLE = "UNSOLVABLE"
+    # Not attempted because grounding would exceed the memory budget.
+    REFUSED = "REFUSED"
+
+    status: str
+    steps: List[str] = field(default_factory=list)
+    horizon: int = 0
+    elapsed: float = 0.0
+    reason: str = ""
+    stats: Dict[str, int] = field(default_factory=dict)
+    # Engine that produced the result ("asp", "macro" or "native"), see SokobanSolver.ENGINES.
+    engine: str = ""
+
+    def step_actions(self) -> List[str]:
+        """Returns the plan's do(...) literals ordered by time step."""
+        return sorted(self.steps, key=SokobanSolver.step_number)
 
 
 class SokobanSolver:
@@ -16,96 +78,322 @@ class SokobanSolver:
     A solver for Sokoban puzzles using the Clingo ASP solver.
     """
 
-    def __init__(self, domain_asp_file: str, max_steps: int = 50):
+    # Seconds between checks of the cancel event while clingo is searching.
+    CANCEL_POLL_INTERVAL = 0.1
+
+    # Seconds between checkpoints while a horizon is being solved.
+    CHECKPOINT_INTERVAL = 5.0
+
+    # Supported instance formats: "location" (lX_Y constants with leftOf/below
+    # facts, for sokoban.lp) and "coord" (cell(R,C) terms, for sokoban_coord.lp).
+    FACT_FORMATS = ("location", "coord")
+
+    # Remaining-distance pruning modes -> values of the prune_max/prune_sum constants.
+    DISTANCE_PRUNING = {"none": (0, 0), "max": (1, 0), "sum": (0, 1), "both": (1, 1)}
+
+    # clingo decision heuristics; "Domain" loads HEURISTIC_FILE with map guidance.
+    HEURISTICS = ("default", "Domain")
+    HEURISTIC_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sokoban_heuristic.lp")
+
+    # "asp" solves with domain_asp_file horizon by horizon, "native" runs the bidirectional
+    # PushSearch, and "auto" lets the calibrated CostModel pick (or race) asp, macro and native.
+    ENGINES = ("asp", "native", "auto")
+    MACRO_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sokoban_macro.lp")
+
+    # What to do when the memory budget does not cover max_steps: refuse the map up front,
+    # solve the horizons that fit, or solve those and then switch to the native search.
+    MEMORY_POLICIES = ("refuse", "lower", "switch")
+
+    # Per-map-class clingo options written by tune.py; applied when no options are given explicitly.
+    TUNING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "clingo_tuning.json")
+
+    def __init__(
+        self,
+        domain_asp_file: str,
+        max_steps: int = 50,
+        presolve_checks: bool = True,
+        validate_facts: bool = False,
+        fact_format: str = "location",
+        distance_pruning: str = "none",
+        heuristic: str = "default",
+        freeze_propagator: bool = False,
+        tunnel_macros: bool = False,
+        pattern_db: bool = False,
+        arrival_bounds: bool = True,
+        crate_domains: bool = True,
+        clingo_options: Optional[List[str]] = None,
+        parallel_mode: Optional[str] = None,
+        tuning_file: Optional[str] = TUNING_FILE,
+        engine: str = "asp",
+        cost_model_file: Optional[str] = COST_MODEL_FILE,
+        memory_budget_mb: Optional[float] = None,
+        memory_policy: str = "refuse",
+        ground_model_file: Optional[str] = GROUND_MODEL_FILE,
+        ledger_file: Optional[str] = None,
+        checkpoint_dir: Optional[str] = None,
+        resume: bool = False,
+    ):
         """
         Initializes the SokobanSolver.
 
         Args:
             domain_asp_file: Path to the ASP domain rules file.
             max_steps: Maximum number of steps to search for a solution.
+            presolve_checks: Run the static unsolvability checks before grounding.
+            validate_facts: Check every generated instance against its map with asp_validator.
+            fact_format: Instance format matching the domain file, one of FACT_FORMATS.
+            distance_pruning: Which pushdist/2 bound the encoding enforces, one of
+                DISTANCE_PRUNING: the maximum over crates, their sum, both or none.
+            heuristic: "Domain" adds the domain heuristic layer, "default" keeps clingo's defaults.
+            freeze_propagator: Register a FreezePropagator that adds nogoods for frozen crates.
+            tunnel_macros: Add tunnelpush/5 facts so that pushing a crate through a one-wide
+                tunnel takes a single step (sokoban.lp and sokoban_macro.lp).
+            pattern_db: Start at the crate-pair lower bound and prune interfering crate pairs.
+            arrival_bounds: Add earliest/3 facts so that no action is grounded at a step before
+                the sokoban and its crate can have reached their cells (sokoban.lp).
+            crate_domains: Add canbe/2 facts so that every crate's pushes are only grounded
+                between the cells it can be pushed to (sokoban.lp).
+            clingo_options: Extra clingo arguments; None applies the recommendation from tuning_file.
+            parallel_mode: clingo --parallel-mode value, e.g. "4,compete".
+            tuning_file: Per-class recommendations written by tune.py, or None.
+            engine: One of ENGINES.
+            cost_model_file: Calibrated CostModel used by the "auto" engine.
+            memory_budget_mb: Memory one grounded horizon may take, as predicted by the
+                GroundEstimator; None disables the guard.
+            memory_policy: One of MEMORY_POLICIES.
+            ground_model_file: Coefficients written by ground_estimate.py; the defaults otherwise.
+            ledger_file: HorizonLedger with the horizons earlier runs proved UNSAT or SAT, e.g.
+                LEDGER_FILE; None (the default) neither reads nor writes one.
+            checkpoint_dir: Where running solves keep their Checkpoint, e.g. CHECKPOINT_DIR; None
+                (the default) disables checkpoints.
+            resume: Continue from the checkpoint of an earlier, interrupted run on the same map.
         """
+        if fact_format not in self.FACT_FORMATS:
+            raise ValueError(f"Unknown fact format: {fact_format}")
+        if distance_pruning not in self.DISTANCE_PRUNING:
+            raise ValueError(f"Unknown distance pruning mode: {distance_pruning}")
+        if heuristic not in self.HEURISTICS:
+            raise ValueError(f"Unknown heuristic: {heuristic}")
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
+        if memory_policy not in self.MEMORY_POLICIES:
+            raise ValueError(f"Unknown memory policy: {memory_policy}")
+        if pattern_db and tunnel_macros:
+            raise ValueError("pattern_db cannot be combined with tunnel_macros")
         self.domain_asp_file = domain_asp_file
         self.max_steps = max_steps
+        self.presolve_checks = presolve_checks
+        self.validate_facts = validate_facts
+        self.fact_format = fact_format
+        self.distance_pruning = distance_pruning
+        self.heuristic = heuristic
+        self.freeze_propagator = freeze_propagator
+        self.tunnel_macros = tunnel_macros
+        self.pattern_db = pattern_db
+        self.arrival_bounds = arrival_bounds
+        self.crate_domains = crate_domains
+        self.clingo_options = clingo_options
+        self.parallel_mode = parallel_mode
+        self.tuning_file = tuning_file
+        self.engine = engine
+        self.cost_model_file = cost_model_file
+        self.memory_budget_mb = memory_budget_mb
+        self.memory_policy = memory_policy
+        self.ground_model_file = ground_model_file
+        self.ledger_file = ledger_file
+        self.checkpoint_dir = checkpoint_dir
+        self.resume = resume
+        self.active_clingo_options: List[str] = list(clingo_options or [])
+        self.kernel_stats: Dict[str, int] = {}
+
+    @staticmethod
+    def step_number(action_literal: str) -> int:
+        """Extracts the time step from a do(Action, T) literal."""
+        return int(action_literal[action_literal.rfind(",") + 1:action_literal.rfind(")")])
 
     @staticmethod
     def cell_index(row: int, col: int) -> str:
         """Generates a unique cell identifier based on row and column."""
         return f"{row}_{col}"
 
+    def cell_term(self, pos: Tuple[int, int]) -> str:
+        """Returns the ASP term naming a cell in the configured fact format."""
+        if self.fact_format == "coord":
+            return f"cell({pos[0]},{pos[1]})"
+        return f"l{self.cell_index(*pos)}"
+
     def generate_facts_from_map(self, map_str: str) -> str:
         """
         Converts the Sokoban map into ASP facts.
 
+        Only the kernel of the map is encoded: the cells the sokoban can reach
+        (treating crates as passable) plus the walls bordering them. Everything
+        outside the playable region would only add atoms at every time step.
+        The cells of crates outside the region stay in as well, so that a crate
+        already standing on a goal there still reaches it.
+        The resulting reduction is stored in self.kernel_stats.
+
         Args:
             map_str: String representation of the Sokoban map.
-            max_steps: Maximum number of steps for the solver.
 
         Returns:
             A string containing ASP facts derived from the map.
         """
-        lines = [line.strip() for line in map_str.splitlines() if line.strip()]
-        height = len(lines)
-        width = max(len(row) for row in lines) if lines else 0
+        layout = parse_layout(map_str)
+        region = player_region(layout) if layout.sokoban is not None else set(layout.floor)
+        bordering_walls = {
+            step(cell, delta)
+            for cell in region
+            for delta in DIRECTIONS.values()
+            if step(cell, delta) in layout.walls
+        }
+        stranded = set(layout.crates) - region
+        cells = region | stranded
+        kernel = cells | bordering_walls
+
+        total_cells = sum(len(row) for row in layout.lines)
+        self.kernel_stats = {
+            "cells_total": total_cells,
+            "cells_kept": len(kernel),
+            "cells_dropped": total_cells - len(kernel),
+        }
+
+        if self.fact_format == "coord":
+            facts = self._coord_facts(layout, cells)
+        else:
+            facts = ["sokoban(sokoban)."]
+            for i, _ in enumerate(layout.crates, start=1):
+                facts.append(f"crate(crate_{i:02d}).")
+
+            location_list, goal_list, non_goal_list, walls_list = self._categorize_cells(
+                kernel, layout.goals & cells, layout.walls
+            )
+
+            facts.extend(self._format_facts(location_list, goal_list, non_goal_list, walls_list))
+            facts.extend(self._define_relations(kernel, region))
+            facts.extend(self._define_initial_positions(layout.sokoban, layout.crates, region))
+        tunnels = tunnel_pushes(layout, region) if self.tunnel_macros and layout.sokoban is not None else []
+        facts.extend(self._define_tunnels(tunnels))
+        facts.extend(self._define_distances(layout, region, tunnels))
+        if self.arrival_bounds:
+            facts.extend(self._define_arrivals(layout, region, tunnels))
+        if self.crate_domains:
+            facts.extend(self._define_domains(layout, region, tunnels))
+        if self.pattern_db and len(layout.crates) > 1:
+            facts.extend(self._define_pairs(PatternDatabase(layout)))
+        #facts.append(f"#const maxsteps={max_steps}.")
+        facts.append("time(0..maxsteps).")
+
+        return "\n".join(facts)
 
-        sokoban_pos: Optional[Tuple[int, int]] = None
-        crate_positions: Set[Tuple[int, int]] = set()
-        walls: Set[Tuple[int, int]] = set()
-        goal_positions: Set[Tuple[int, int]] = set()
-
-        for r, row in enumerate(lines):
-            for c, ch in enumerate(row):
-                pos = (r, c)
-                if ch == '#':
-                    walls.add(pos)
-                elif ch in ('S', 's'):
-                    sokoban_pos = pos
-                    if ch == 's' and pos not in walls:
-                        goal_positions.add(pos)
-                elif ch in ('C', 'c'):
-                    crate_positions.add(pos)
-                    if ch == 'c' and pos not in walls:
-                        goal_positions.add(pos)
-                elif ch == 'X' and pos not in walls:
-                    goal_positions.add(pos)
+    def _coord_facts(self, layout: MapLayout, region: Set[Tuple[int, int]]) -> List[str]:
+        """
+        Builds the compact instance for sokoban_coord.lp.
 
+        Cells are cell(R,C) terms and adjacency is left to arithmetic in the
+        encoding, so only floor cells, goals and initial positions are listed.
+        """
         facts = ["sokoban(sokoban)."]
-        for i, _ in enumerate(crate_positions, start=1):
-            facts.append(f"crate(crate_{i:02d}).")
+        if layout.crates:
+            facts.append(f"crate({';'.join(f'crate_{i:02d}' for i in range(1, len(layout.crates) + 1))}).")
+        if region:
+            facts.append(f"floor({';'.join(f'{r},{c}' for r, c in sorted(region))}).")
+        goals = sorted(layout.goals & region)
+        if goals:
+            facts.append(f"goal({';'.join(f'{r},{c}' for r, c in goals)}).")
+        if layout.sokoban:
+            facts.append(f"at(sokoban, {self.cell_term(layout.sokoban)}, 0).")
+        for i, pos in enumerate(layout.crates, start=1):
+            facts.append(f"at(crate_{i:02d}, {self.cell_term(pos)}, 0).")
+        return facts
 
-        location_list, goal_list, non_goal_list, walls_list = self._categorize_cells(
-            lines, height, width, goal_positions, walls
-        )
+    def _define_tunnels(self, tunnels: List[TunnelPush]) -> List[str]:
+        """Defines tunnelpush(D,X,Y,Z,P) and tunnelpath(Y,Z,L) for the tunnel macro pushes."""
+        facts = []
+        for tunnel in tunnels:
+            start, target = self.cell_term(tunnel.start), self.cell_term(tunnel.target)
+            facts.append(f"tunnelpush({tunnel.direction.lower()},{self.cell_term(tunnel.player)},"
+                         f"{start},{target},{self.cell_term(tunnel.player_end)}).")
+            facts.append(f"tunnelpath({';'.join(f'{start},{target},{self.cell_term(pos)}' for pos in tunnel.path)}).")
+        return facts
 
-        facts.extend(self._format_facts(location_list, goal_list, non_goal_list, walls_list))
-        facts.extend(self._define_relations(lines, height, width))
-        facts.extend(self._define_initial_positions(sokoban_pos, crate_positions, height, width, lines, walls))
-        #facts.append(f"#const maxsteps={max_steps}.")
-        facts.append("time(0..maxsteps).")
+    def _define_distances(
+        self, layout: MapLayout, region: Set[Tuple[int, int]], tunnels: Optional[List[TunnelPush]] = None
+    ) -> List[str]:
+        """Defines pushdist(L,N): a crate on L needs at least N pushes (tunnel macros counting once) to reach some goal."""
+        if layout.sokoban is None:
+            return []
+        distances = push_distances(layout, region, tunnels or ())
+        if not distances:
+            return []
+        facts = [f"pushdist({';'.join(f'{self.cell_term(pos)},{n}' for pos, n in sorted(distances.items()))})."]
+        if self.heuristic == "Domain":
+            facts.extend(self._define_guidance(distances))
+        return facts
 
-        return "\n".join(facts)
+    def _define_arrivals(
+        self, layout: MapLayout, region: Set[Tuple[int, int]], tunnels: Optional[List[TunnelPush]] = None
+    ) -> List[str]:
+        """Defines earliest(O,L,N): object O cannot stand on L before step N (see earliest_arrivals)."""
+        if layout.sokoban is None:
+            return []
+        player, crates = earliest_arrivals(layout, region, tunnels or ())
+        objects = [("sokoban", player)] + [(f"crate_{i:02d}", arrival) for i, arrival in enumerate(crates, start=1)]
+        return [f"earliest({';'.join(f'{name},{self.cell_term(pos)},{n}' for pos, n in sorted(arrival.items()))})."
+                for name, arrival in objects]
+
+    def _define_domains(
+        self, layout: MapLayout, region: Set[Tuple[int, int]], tunnels: Optional[List[TunnelPush]] = None
+    ) -> List[str]:
+        """Defines canbe(C,L): crate C can be pushed onto L (see crate_domains)."""
+        if layout.sokoban is None:
+            return []
+        domains = crate_domains(layout, region, tunnels or ())
+        return [f"canbe({';'.join(f'crate_{i:02d},{self.cell_term(pos)}' for pos in sorted(domain))})."
+                for i, domain in enumerate(domains, start=1)]
+
+    def _define_pairs(self, pdb: PatternDatabase) -> List[str]:
+        """Defines pairdist(L1,L2,N) and deadpair(L1,L2) for the pairs of cells where crates interfere."""
+        costs, dead = [], []
+        for (a, b), cost in pdb.interfering_pairs().items():
+            if cost is None:
+                dead.append(f"{self.cell_term(a)},{self.cell_term(b)}")
+            else:
+                costs.append(f"{self.cell_term(a)},{self.cell_term(b)},{cost}")
+        facts = []
+        if costs:
+            facts.append(f"pairdist({';'.join(costs)}).")
+        if dead:
+            facts.append(f"deadpair({';'.join(dead)}).")
+        return facts
+
+    def _define_guidance(self, distances: Dict[Tuple[int, int], int]) -> List[str]:
+        """Defines closer(Y,Z): pushing a crate from Y to the adjacent Z reduces its goal distance."""
+        closer = [
+            f"{self.cell_term(pos)},{self.cell_term(step(pos, delta))}"
+            for pos, n in sorted(distances.items())
+            for delta in DIRECTIONS.values()
+            if distances.get(step(pos, delta), n) < n
+        ]
+        return [f"closer({';'.join(closer)})."] if closer else []
 
     def _categorize_cells(
         self,
-        lines: List[str],
-        height: int,
-        width: int,
+        kernel: Set[Tuple[int, int]],
         goal_positions: Set[Tuple[int, int]],
         walls: Set[Tuple[int, int]],
     ) -> Tuple[List[str], List[str], List[str], List[str]]:
-        """Categorizes cells into locations, goals, non-goals, and walls."""
+        """Categorizes kernel cells into locations, goals, non-goals, and walls."""
         location_list, goal_list, non_goal_list, walls_list = [], [], [], []
-        for r in range(height):
-            row_length = len(lines[r])
-            for c in range(row_length):
-                cell_id = f"l{self.cell_index(r, c)}"
-                location_list.append(cell_id)
-                pos = (r, c)
-                if pos in goal_positions:
-                    goal_list.append(cell_id)
-                elif pos not in walls:
-                    non_goal_list.append(cell_id)
-                if pos in walls:
-                    walls_list.append(cell_id)
+        for pos in sorted(kernel):
+            cell_id = f"l{self.cell_index(*pos)}"
+            location_list.append(cell_id)
+            if pos in goal_positions:
+                goal_list.append(cell_id)
+            elif pos not in walls:
+                non_goal_list.append(cell_id)
+            if pos in walls:
+                walls_list.append(cell_id)
         assert not set(goal_list) & set(non_goal_list), "Conflict: Cells in both isgoal and isnongoal"
         return location_list, goal_list, non_goal_list, walls_list
 
@@ -128,29 +416,23 @@ class SokobanSolver:
             facts.append(f"wall({';'.join(walls)}).")
         return facts
 
-    def _define_relations(self, lines: List[str], height: int, width: int) -> List[str]:
-        """Defines spatial relations (leftOf, below) between cells."""
+    def _define_relations(self, kernel: Set[Tuple[int, int]], region: Set[Tuple[int, int]]) -> List[str]:
+        """Defines spatial relations (leftOf, below) between kernel cells; wall-to-wall pairs are skipped."""
         relations = []
-        for r in range(height):
-            row_length = len(lines[r])
-            for c in range(row_length):
-                current_id = self.cell_index(r, c)
-                if c + 1 < row_length:
-                    right_id = self.cell_index(r, c + 1)
-                    relations.append(f"leftOf(l{current_id}, l{right_id}).")
-                if r + 1 < height and c < len(lines[r + 1]):
-                    below_id = self.cell_index(r + 1, c)
-                    relations.append(f"below(l{below_id}, l{current_id}).")
+        for r, c in sorted(kernel):
+            current_id = self.cell_index(r, c)
+            right, down = (r, c + 1), (r + 1, c)
+            if right in kernel and ((r, c) in region or right in region):
+                relations.append(f"leftOf(l{current_id}, l{self.cell_index(*right)}).")
+            if down in kernel and ((r, c) in region or down in region):
+                relations.append(f"below(l{self.cell_index(*down)}, l{current_id}).")
         return relations
 
     def _define_initial_positions(
         self,
         sokoban_pos: Optional[Tuple[int, int]],
-        crate_positions: Set[Tuple[int, int]],
-        height: int,
-        width: int,
-        lines: List[str],
-        walls: Set[Tuple[int, int]],
+        crate_positions: List[Tuple[int, int]],
+        region: Set[Tuple[int, int]],
     ) -> List[str]:
         """Defines the initial positions of the Sokoban and crates."""
         initial_positions = []
@@ -163,14 +445,11 @@ class SokobanSolver:
             crate_id = self.cell_index(r, c)
             initial_positions.append(f"at({crate_name}, l{crate_id}, 0).")
 
-        occupied = crate_positions.union({sokoban_pos} if sokoban_pos else set())
-        for r in range(height):
-            row_length = len(lines[r])
-            for c in range(row_length):
-                pos = (r, c)
-                if pos not in occupied and pos not in walls:
-                    cell_id = self.cell_index(r, c)
-                    initial_positions.append(f"clear(l{cell_id}, 0).")
+        occupied = set(crate_positions).union({sokoban_pos} if sokoban_pos else set())
+        for pos in sorted(region):
+            if pos not in occupied:
+                cell_id = self.cell_index(*pos)
+                initial_positions.append(f"clear(l{cell_id}, 0).")
         return initial_positions
 
     def solve(self, map_str: str) -> str:
@@ -183,30 +462,151 @@ class SokobanSolver:
         Returns:
             A formatted string with the solution steps or "No solution found".
         """
+        result = self.solve_plan(map_str)
+        if result.status == SolveResult.SAT:
+            return self._format_solution(result.steps)
+        if result.reason:
+            return f"No solution found: {result.reason}"
+        return "No solution found"
+
+    def solve_plan(
+        self,
+        map_str: str,
+        on_progress: Optional[Callable[[SolveProgress], None]] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> SolveResult:
+        """
+        Solves the Sokoban puzzle and returns a structured result.
+
+        Unlike solve(), this method can be driven from a worker thread: progress is
+        reported through on_progress and the search stops as soon as cancel_event is set.
+
+        Args:
+            map_str: String representation of the Sokoban map.
+            on_progress: Optional callback receiving a SolveProgress for every horizon and model.
+            cancel_event: Optional event; when set, the running solve call is interrupted.
+
+        Returns:
+            A SolveResult with the status, the plan (as do(...) literals) and timing.
+        """
+        if self.engine == "native":
+            return self._run_engine("native", map_str, on_progress, cancel_event)
+        if self.engine == "auto":
+            return self._solve_auto(map_str, on_progress, cancel_event)
         solution_found = False
         solution_steps: List[str] = []
         min_steps = 1
+        solve_start = time.monotonic()
+
+        def report(horizon: int, message: str) -> None:
+            if on_progress is not None:
+                on_progress(SolveProgress(horizon, time.monotonic() - solve_start, list(solution_steps), message))
+
+        def cancelled() -> bool:
+            return cancel_event is not None and cancel_event.is_set()
+
+        layout = parse_layout(map_str)
+        stats: Dict[str, int] = {"freeze_nogoods": 0}
+        if self.presolve_checks:
+            reason = find_unsolvable_reason(layout)
+            if reason is not None:
+                print(f"\nMap is unsolvable: {reason}")
+                return SolveResult(SolveResult.UNSOLVABLE, [], 0, time.monotonic() - solve_start, reason)
+
         start_time = datetime.datetime.now().time().strftime('%H:%M:%S')
         instance_facts = self.generate_facts_from_map(map_str)
+        if self.validate_facts:
+            validate_asp_encoding(map_str, instance_facts, self.fact_format)
         end_time = datetime.datetime.now().time().strftime('%H:%M:%S')
         total_time = (datetime.datetime.strptime(end_time, '%H:%M:%S') - datetime.datetime.strptime(start_time, '%H:%M:%S'))
         print(f"\nfact generation took: {total_time}")
+        kept, total = self.kernel_stats["cells_kept"], self.kernel_stats["cells_total"]
+        print(f"kernel: {kept} of {total} cells encoded "
+              f"({100 * (total - kept) / max(total, 1):.0f}% fewer cell atoms per time step)")
+
+        if self.pattern_db and layout.sokoban is not None:
+            pdb = PatternDatabase(layout)
+            bound = pdb.lower_bound(layout.crates, done=[c for c in layout.crates if c in layout.goals])
+            print(f"pattern database ({'cached' if pdb.loaded_from_cache else 'computed'}): "
+                  f"at least {bound} pushes")
+            if bound is not None:
+                min_steps = max(min_steps, bound)
+                stats["pattern_db_bound"] = bound
+
+        self.active_clingo_options = self._select_clingo_options(layout)
+        if self.active_clingo_options:
+            print(f"clingo options: {' '.join(self.active_clingo_options)}")
+
+        horizon_limit = self.max_steps
+        if self.memory_budget_mb is not None:
+            estimator = GroundEstimator.load(self.ground_model_file)
+            features = map_features(layout)
+            horizon_limit = estimator.max_horizon(self.domain_asp_file, features, self.memory_budget_mb * 2 ** 20,
+                                                  self.max_steps)
+            estimate = estimator.estimate(self.domain_asp_file, features, self.max_steps)
+            stats["memory_horizon_limit"] = horizon_limit
+            print(f"memory guard: horizon {self.max_steps} needs about {estimate.megabytes:.0f} MB "
+                  f"({estimate.atoms} atoms, {estimate.rules} rules); "
+                  f"horizons up to {horizon_limit} fit in {self.memory_budget_mb} MB")
+            if horizon_limit < self.max_steps and self.memory_policy == "refuse":
+                reason = (f"grounding horizon {self.max_steps} would take about {estimate.megabytes:.0f} MB, "
+                          f"over the budget of {self.memory_budget_mb} MB")
+                print(reason)
+                return SolveResult(SolveResult.REFUSED, [], 0, time.monotonic() - solve_start, reason, stats)
+
+        run_key = self.run_key(instance_facts)
+        checkpoints = CheckpointStore(self.checkpoint_dir) if self.checkpoint_dir else None
+        learned_min_steps = min_steps
+        if self.resume and checkpoints is not None:
+            checkpoint = checkpoints.load(run_key)
+            if checkpoint is not None:
+                print(f"resuming: horizons up to {checkpoint.horizon_completed} solved, "
+                      f"{checkpoint.elapsed:.1f}s spent so far")
+                learned_min_steps = max(learned_min_steps, checkpoint.min_horizon)
+                min_steps = max(learned_min_steps, checkpoint.horizon_completed + 1)
+                stats.update(checkpoint.stats)
+                stats["resumed_from"] = checkpoint.horizon_completed
+                solution_steps = list(checkpoint.best_steps)
+                solve_start -= checkpoint.elapsed
+
+        def save_checkpoint(completed: int) -> None:
+            if checkpoints is not None:
+                checkpoints.save(Checkpoint(run_key, completed, list(solution_steps),
+                                            completed + 1 if solution_steps else None, learned_min_steps,
+                                            dict(stats), time.monotonic() - solve_start))
+
+        ledger = None
+        if self.ledger_file:
+            ledger = HorizonLedger(self.ledger_file)
+            entry = ledger.get(run_key)
+            if entry.start_horizon > min_steps:
+                print(f"ledger: horizons up to {entry.unsat_upto} are UNSAT"
+                      + (f", best plan at horizon {entry.best_sat}" if entry.best_sat is not None else ""))
+                min_steps = entry.start_horizon
+                stats["ledger_start"] = min_steps
 
         print(f"Generating plans of length: ", end='')
 
-        for steps in range(min_steps, self.max_steps + 1):
+        for steps in range(min_steps, horizon_limit + 1):
+            if cancelled():
+                save_checkpoint(steps - 1)
+                return SolveResult(SolveResult.CANCELLED, solution_steps, steps - 1, time.monotonic() - solve_start,
+                                   stats=stats)
             print(f"{steps}...", end='')
+            report(steps, f"grounding horizon {steps}")
             try:
                 # Find optimal plan
-                maxsteps_string = f"maxsteps={steps}"
-                ctl = clingo.Control(arguments=["--models=0", "--opt-mode=opt", '--stats', '--const', maxsteps_string])
+                ctl = clingo.Control(arguments=self._clingo_arguments(steps))
                 ctl.load(self.domain_asp_file)
+                if self.heuristic == "Domain":
+                    ctl.load(self.HEURISTIC_FILE)
                 ctl.add("base", [], instance_facts)
-                start_time = datetime.datetime.now().time().strftime('%H:%M:%S')
                 ctl.ground([("base", [])])
-                end_time = datetime.datetime.now().time().strftime('%H:%M:%S')
-                total_time = (datetime.datetime.strptime(end_time, '%H:%M:%S') - datetime.datetime.strptime(start_time, '%H:%M:%S'))
-                #print(f"\ngrounding took: {total_time}")
+                stats["ground_atoms"] = len(ctl.symbolic_atoms)
+                propagator = FreezePropagator(layout) if self.freeze_propagator else None
+                if propagator is not None:
+                    ctl.register_propagator(propagator)
+                report(steps, f"solving horizon {steps}")
 
                 def handle_model(model: clingo.Model):
                     nonlocal solution_found, solution_steps
@@ -214,24 +614,245 @@ class SokobanSolver:
                     print(f"\nFound solution: {model}")
 
                     atoms = [str(atom) for atom in model.symbols(shown=True)]
-                    moves = [atom for atom in atoms if atom.startswith("do(")]
-                    solution_steps.extend(moves)
-
-                ctl.solve(on_model=handle_model, on_statistics=print(dumps(
-                    ctl.statistics['summary']['times'],
-                        sort_keys=True,
-                        indent=4,
-                        separators=(',', ': '))), on_core=print, on_finish=print)
-
+                    # Every model of the optimization run is at least as good as the previous one.
+                    solution_steps = [atom for atom in atoms if atom.startswith("do(")]
+                    report(steps, f"found plan with {len(solution_steps)} actions")
+
+                with ctl.solve(on_model=handle_model, on_core=print, on_finish=print, async_=True) as handle:
+                    last_checkpoint = time.monotonic()
+                    while not handle.wait(self.CANCEL_POLL_INTERVAL):
+                        if cancelled():
+                            handle.cancel()
+                        if time.monotonic() - last_checkpoint >= self.CHECKPOINT_INTERVAL:
+                            save_checkpoint(steps - 1)
+                            last_checkpoint = time.monotonic()
+                    outcome = handle.get()
+                if ledger is not None:
+                    if solution_found:
+                        ledger.record_sat(run_key, steps)
+                    elif outcome.unsatisfiable:
+                        ledger.record_unsat(run_key, steps)
+                print(dumps(ctl.statistics['summary']['times'],
+                            sort_keys=True,
+                            indent=4,
+                            separators=(',', ': ')))
+                if propagator is not None:
+                    stats["freeze_nogoods"] += propagator.conflicts
+                    print(f"freeze propagator added {propagator.conflicts} nogoods")
+                stats["ground_rules"] = int(ctl.statistics['problem']['lp']['rules'])
+                # ru_maxrss cannot be reset, so this is the peak of the whole process, not of this horizon.
+                peak = peak_rss_bytes()
+                if peak is not None:
+                    stats["process_peak_rss_mb"] = round(peak / 2 ** 20)
+                    print(f"horizon {steps}: {stats['ground_atoms']} atoms, {stats['ground_rules']} rules, "
+                          f"process peak RSS {stats['process_peak_rss_mb']} MB")
+
+                # A plan found before a cancel is kept, even if its optimization was cut short.
+                if cancelled() and not solution_found:
+                    save_checkpoint(steps if outcome.unsatisfiable else steps - 1)
+                    return SolveResult(SolveResult.CANCELLED, expand_walks(map_str, solution_steps), steps,
+                                       time.monotonic() - solve_start, stats=stats)
                 if solution_found:
-                    return self._format_solution(solution_steps)
+                    if checkpoints is not None:
+                        checkpoints.discard(run_key)
+                    # Push-level encodings leave the walks between pushes implicit.
+                    return SolveResult(SolveResult.SAT, expand_walks(map_str, solution_steps), steps,
+                                       time.monotonic() - solve_start, stats=stats)
                 else:
+                    save_checkpoint(steps)
                     ctl.cleanup()
                     print(f"UNSAT, trying with ", end='')
             except Exception as e:
                 print(f"Error at steps={steps}: {str(e)}")
 
-        return "No solution found"
+        if checkpoints is not None:
+            checkpoints.discard(run_key)
+        if horizon_limit < self.max_steps:
+            reason = f"the memory budget caps the horizon at {horizon_limit}"
+            if self.memory_policy == "switch":
+                print(f"\n{reason}, switching to the native search")
+                result = self._run_engine("native", map_str, on_progress, cancel_event)
+                result.stats = dict(stats, **result.stats)
+                result.elapsed = time.monotonic() - solve_start
+                return result
+            return SolveResult(SolveResult.UNSAT, [], horizon_limit, time.monotonic() - solve_start, reason, stats)
+        return SolveResult(SolveResult.UNSAT, [], self.max_steps, time.monotonic() - solve_start, stats=stats)
+
+    def _solve_auto(
+        self,
+        map_str: str,
+        on_progress: Optional[Callable[[SolveProgress], None]],
+        cancel_event: Optional[threading.Event],
+    ) -> SolveResult:
+        """
+        Routes the map to the engine the cost model expects to be fastest.
+
+        When the model is not confident (the map is unlike the calibration maps, or two
+        engines are predicted to be close), the candidate engines race each other and
+        the first plan wins.
+        """
+        solve_start = time.monotonic()
+        layout = parse_layout(map_str)
+        if self.presolve_checks:
+            reason = find_unsolvable_reason(layout)
+            if reason is not None:
+                print(f"\nMap is unsolvable: {reason}")
+                return SolveResult(SolveResult.UNSOLVABLE, [], 0, time.monotonic() - solve_start, reason)
+
+        features = map_features(layout)
+        choice = CostModel.load(self.cost_model_file).choose(features)
+        print(f"\nfeatures: {', '.join(f'{k}={v}' for k, v in features._asdict().items())}")
+        print(f"predicted seconds: {', '.join(f'{e}={s}' for e, s in choice.predictions.items())}")
+        if choice.confident:
+            print(f"engine: {choice.engine}")
+            result = self._run_engine(choice.engine, map_str, on_progress, cancel_event)
+        else:
+            print(f"engine: racing {', '.join(choice.candidates)}")
+            result = self._race(choice.candidates, map_str, on_progress, cancel_event)
+        result.elapsed = time.monotonic() - solve_start
+        return result
+
+    def _run_engine(
+        self,
+        engine: str,
+        map_str: str,
+        on_progress: Optional[Callable[[SolveProgress], None]],
+        cancel_event: Optional[threading.Event],
+        checkpoints: bool = True,
+    ) -> SolveResult:
+        """
+        Solves with one engine ("asp", "macro" or "native") and the solver's other settings.
+
+        With checkpoints=False the ASP engines neither save nor resume checkpoints; raced
+        engines use this, since a cancelled loser would leave a checkpoint nobody discards.
+        """
+        if engine == "native":
+            # push_search imports SolveResult from this module.
+            from push_search import PushSearch
+            result = PushSearch(map_str, pattern_db=self.pattern_db).solve("bidirectional", cancel_event)
+        else:
+            solver = copy.copy(self)
+            solver.engine = "asp"
+            solver.kernel_stats = {}
+            if not checkpoints:
+                solver.checkpoint_dir = None
+            if engine == "macro":
+                solver.domain_asp_file = self.MACRO_FILE
+                solver.fact_format = "location"
+            result = solver.solve_plan(map_str, on_progress, cancel_event)
+        result.engine = engine
+        return result
+
+    def _race(
+        self,
+        engines: List[str],
+        map_str: str,
+        on_progress: Optional[Callable[[SolveProgress], None]],
+        cancel_event: Optional[threading.Event],
+    ) -> SolveResult:
+        """
+        Runs several engines in threads and returns the first plan found.
+
+        The losers are cancelled as soon as one engine reports SAT. If no engine finds
+        a plan, the result of the last engine to finish is returned.
+        """
+        race_cancel = threading.Event()
+        finished: "queue.Queue[SolveResult]" = queue.Queue()
+
+        def run(engine: str) -> None:
+            finished.put(self._run_engine(engine, map_str, on_progress, race_cancel, checkpoints=False))
+
+        threads = [threading.Thread(target=run, args=(engine,), daemon=True) for engine in engines]
+        for thread in threads:
+            thread.start()
+        result = None
+        for _ in threads:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    race_cancel.set()
+                try:
+                    result = finished.get(timeout=self.CANCEL_POLL_INTERVAL)
+                    break
+                except queue.Empty:
+                    continue
+            if result.status == SolveResult.SAT:
+                break
+        race_cancel.set()
+        for thread in threads:
+            thread.join()
+        if result.status == SolveResult.SAT:
+            print(f"\n{result.engine} won the race")
+        result.stats["raced_engines"] = len(engines)
+        return result
+
+    def profile_grounding(self, map_str: str, horizon: int, top: Optional[int] = 20) -> str:
+        """
+        Grounds one horizon of the map and ranks the encoding's rules by their ground instances.
+
+        Args:
+            map_str: String representation of the Sokoban map.
+            horizon: Number of time steps (maxsteps) to ground.
+            top: Number of rules to list; None lists all.
+
+        Returns:
+            The table printed by ground_profile.format_profile.
+        """
+        facts = self.generate_facts_from_map(map_str)
+        files = [self.domain_asp_file] + ([self.HEURISTIC_FILE] if self.heuristic == "Domain" else [])
+        arguments = [a for a in self._clingo_arguments(horizon) if a != "--stats"]
+        profiles, totals = profile_grounding(files, facts, arguments)
+        return format_profile(profiles, totals, top)
+
+    def run_key(self, instance_facts: str) -> str:
+        """
+        Identifies the instance, the encoding and the constants that decide which horizons are SAT.
+
+        The instance facts cover the map and everything the fact generator derives from it
+        (kernel, pushdist, earliest/3, canbe/2, ...), so a change to the generator or to its
+        options starts a new ledger entry and checkpoint.
+        """
+        arguments = self._clingo_arguments(0)
+        constants = sorted(value for flag, value in zip(arguments, arguments[1:])
+                           if flag == "--const" and not value.startswith("maxsteps="))
+        return HorizonLedger.key(instance_facts, self.domain_asp_file, {"constants": constants})
+
+    def _clingo_arguments(self, steps: int) -> List[str]:
+        """Builds the clingo command line for one horizon."""
+        prune_max, prune_sum = self.DISTANCE_PRUNING[self.distance_pruning]
+        return [
+            "--models=0", "--opt-mode=opt", '--stats',
+            '--const', f"maxsteps={steps}",
+            '--const', f"prune_max={prune_max}",
+            '--const', f"prune_sum={prune_sum}",
+            '--const', f"prune_pairs={int(self.pattern_db)}",
+            '--const', f"arrival_bounds={int(self.arrival_bounds)}",
+            '--const', f"crate_domains={int(self.crate_domains)}",
+        ] + (["--heuristic=Domain"] if self.heuristic == "Domain" else []) + self.active_clingo_options
+
+    def _select_clingo_options(self, layout: MapLayout) -> List[str]:
+        """
+        Chooses the extra clingo arguments for a map.
+
+        Explicit clingo_options win. Otherwise the recommendation for the map's class is read
+        from tuning_file, if there is one. A tuned --heuristic is dropped when the Domain
+        heuristic is active, since clingo accepts only one.
+        """
+        options = list(self.clingo_options) if self.clingo_options is not None else self._tuned_options(layout)
+        if self.heuristic == "Domain":
+            options = [o for o in options if not o.startswith("--heuristic")]
+        if self.parallel_mode:
+            options = [o for o in options if not o.startswith("--parallel-mode")]
+            options.append(f"--parallel-mode={self.parallel_mode}")
+        return options
+
+    def _tuned_options(self, layout: MapLayout) -> List[str]:
+        """Recommended clingo options for the map's class from tuning_file, or none."""
+        if not self.tuning_file or not os.path.exists(self.tuning_file):
+            return []
+        with open(self.tuning_file, 'r', encoding='utf-8') as file:
+            recommendations = load(file).get("recommendations", {})
+        recommendation = recommendations.get(map_class(layout))
+        return list(recommendation["options"]) if recommendation else []
 
     def _format_solution(self, steps: List[str]) -> str:
         """
@@ -283,14 +904,64 @@ class SokobanSolver:
 def main():
     parser = argparse.ArgumentParser(description="Solve Sokoban puzzles using Clingo.")
     parser.add_argument("domain_file", help="Path to the ASP domain rules file.")
-    parser.add_argument("map_file", help="Path to the Sokoban map file.")
+    parser.add_argument("map_file", help="Path to the Sokoban map file, or collection.sok#<number or title>.")
     parser.add_argument("--max_steps", type=int, default=50, help="Maximum number of steps to search.")
+    parser.add_argument("--fact_format", choices=SokobanSolver.FACT_FORMATS, default="location",
+                        help="Instance format; use 'coord' together with sokoban_coord.lp.")
+    parser.add_argument("--distance_pruning", choices=sorted(SokobanSolver.DISTANCE_PRUNING), default="none",
+                        help="Prune states whose remaining push distance exceeds the remaining horizon.")
+    parser.add_argument("--heuristic", choices=SokobanSolver.HEURISTICS, default="default",
+                        help="Use 'Domain' for the map-guided decision heuristic.")
+    parser.add_argument("--freeze_propagator", action="store_true",
+                        help="Detect frozen-crate deadlocks during search with a clingo propagator.")
+    parser.add_argument("--tunnel_macros", action="store_true",
+                        help="Push crates through one-wide tunnels in a single step.")
+    parser.add_argument("--pattern_db", action="store_true",
+                        help="Use crate-pair push costs for the starting horizon and for pruning.")
+    parser.add_argument("--no_arrival_bounds", action="store_true",
+                        help="Ground every action at every step instead of only from the earliest step it can apply.")
+    parser.add_argument("--no_crate_domains", action="store_true",
+                        help="Let every crate occupy every cell instead of only those it can be pushed to.")
+    parser.add_argument("--clingo_option", action="append", dest="clingo_options",
+                        help="Extra clingo argument, e.g. --clingo_option=--configuration=crafty (repeatable). "
+                             "Disables the tuned per-class options.")
+    parser.add_argument("--parallel-mode", "--parallel_mode", dest="parallel_mode",
+                        help="clingo --parallel-mode, e.g. 4,compete for a multithreaded portfolio.")
+    parser.add_argument("--engine", choices=SokobanSolver.ENGINES, default="asp",
+                        help="'auto' picks the expected-fastest engine for the map (see cost_model.py).")
+    parser.add_argument("--memory_budget", type=float, default=None,
+                        help="Memory in MB one grounded horizon may take (estimated before grounding).")
+    parser.add_argument("--memory_policy", choices=SokobanSolver.MEMORY_POLICIES, default="refuse",
+                        help="What to do when the budget does not cover --max_steps.")
+    parser.add_argument("--profile_grounding", action="store_true",
+                        help="Ground horizon --max_steps, print the rules ranked by ground instances and exit.")
+    parser.add_argument("--validate_facts", action="store_true",
+                        help="Check the generated instance against the map before solving.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run on this map from its checkpoint.")
+    parser.add_argument("--no_ledger", action="store_true",
+                        help=f"Neither use nor update {os.path.basename(LEDGER_FILE)}.")
+    parser.add_argument("--no_tuning", action="store_true", help=f"Ignore {os.path.basename(SokobanSolver.TUNING_FILE)}.")
     args = parser.parse_args()
 
-    with open(args.map_file, 'r') as f:
-        map_str = f.read()
-
-    solver = SokobanSolver(domain_asp_file=args.domain_file, max_steps=args.max_steps)
+    map_str = SokobanMap.read_map_file(args.map_file)
+
+    solver = SokobanSolver(domain_asp_file=args.domain_file, max_steps=args.max_steps, fact_format=args.fact_format,
+                           distance_pruning=args.distance_pruning, heuristic=args.heuristic,
+                           freeze_propagator=args.freeze_propagator, tunnel_macros=args.tunnel_macros,
+                           pattern_db=args.pattern_db, arrival_bounds=not args.no_arrival_bounds,
+                           crate_domains=not args.no_crate_domains,
+                           clingo_options=args.clingo_options,
+                           parallel_mode=args.parallel_mode,
+                           tuning_file=None if args.no_tuning else SokobanSolver.TUNING_FILE,
+                           engine=args.engine, memory_budget_mb=args.memory_budget,
+                           memory_policy=args.memory_policy,
+                           ledger_file=None if args.no_ledger else LEDGER_FILE,
+                           checkpoint_dir=CHECKPOINT_DIR, resume=args.resume,
+                           validate_facts=args.validate_facts)
+    if args.profile_grounding:
+        print(solver.profile_grounding(map_str, args.max_steps))
+        return
     solution = solver.solve(map_str)
 
     print(solution)
@@ -0,0 +1,229 @@
+# state_hash.py
+
+import random
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from map_analysis import Cell, MapLayout, parse_layout, player_region
+from plan_utils import cell_coords, expand_tunnel, parse_action
+
+
+class ZobristHasher:
+    """
+    64-bit Zobrist keys for Sokoban states.
+
+    Every floor cell gets one random key for "a crate stands here" and one for
+    "the sokoban stands here". The key of a state is the XOR of its crate keys
+    and the key of the (normalized) player cell, so pushing a crate from A to B
+    updates it in O(1): key ^ crate_key(A) ^ crate_key(B).
+
+    Push-level searches do not care where exactly the sokoban stands, only
+    which area it can reach. They should hash the normalized player cell: the
+    smallest cell (row-major) of the area the sokoban can reach without pushing.
+    """
+
+    def __init__(self, layout: MapLayout, seed: int = 0):
+        """
+        Args:
+            layout: The map layout.
+            seed: Seed of the key generator; equal seeds give equal keys.
+        """
+        self.layout = layout
+        rng = random.Random(seed)
+        cells = sorted(layout.floor)
+        self._crate_keys = {cell: rng.getrandbits(64) for cell in cells}
+        self._player_keys = {cell: rng.getrandbits(64) for cell in cells}
+
+    @classmethod
+    def from_map_str(cls, map_str: str, seed: int = 0) -> "ZobristHasher":
+        return cls(parse_layout(map_str), seed)
+
+    def crate_key(self, cell: Cell) -> int:
+        return self._crate_keys[cell]
+
+    def player_key(self, cell: Cell) -> int:
+        return self._player_keys[cell]
+
+    def hash_crates(self, crates: Iterable[Cell]) -> int:
+        """Key of a crate configuration, independent of the order of crates."""
+        key = 0
+        for cell in crates:
+            key ^= self._crate_keys[cell]
+        return key
+
+    def move_crate(self, key: int, src: Cell, dst: Cell) -> int:
+        """Updates a crate (or state) key for a crate moving from src to dst."""
+        return key ^ self._crate_keys[src] ^ self._crate_keys[dst]
+
+    def move_player(self, key: int, src: Cell, dst: Cell) -> int:
+        """Updates a state key for the (normalized) player cell changing from src to dst."""
+        return key ^ self._player_keys[src] ^ self._player_keys[dst]
+
+    def normalized_player(self, crates: Set[Cell], player: Cell) -> Cell:
+        """The smallest cell the sokoban can walk to from player without pushing a crate."""
+        return min(player_region(self.layout, blocked=crates, start=player))
+
+    def hash_state(self, crates: Set[Cell], player: Cell, normalize: bool = True) -> int:
+        """
+        Key of a full state.
+
+        Args:
+            crates: Crate cells.
+            player: Sokoban cell.
+            normalize: Hash the player's reachable area instead of the exact cell.
+        """
+        if normalize:
+            player = self.normalized_player(crates, player)
+        return self.hash_crates(crates) ^ self._player_keys[player]
+
+
+def plan_state_keys(map_str: str, steps: List[str], hasher: Optional[ZobristHasher] = None) -> List[int]:
+    """
+    Exact state keys along a plan, updated incrementally per action.
+
+    Args:
+        map_str: The initial map.
+        steps: do(...) literals in any order (moves, pushes or tunnel macros).
+        hasher: Hasher to use; a new one for map_str by default.
+
+    Returns:
+        The key of the initial state followed by the key after every action.
+        A repeated key means the plan revisits a state and contains a detour.
+    """
+    hasher = hasher or ZobristHasher.from_map_str(map_str)
+    layout = hasher.layout
+    if layout.sokoban is None:
+        raise ValueError("The map has no sokoban")
+    player = layout.sokoban
+    key = hasher.hash_crates(layout.crates) ^ hasher.player_key(player)
+    keys = [key]
+    for action in sorted((parse_action(s) for s in steps), key=lambda a: a.time):
+        for unit in expand_tunnel(action) if action.is_tunnel else [action]:
+            dst = cell_coords(unit.args[2])
+            if unit.is_push:
+                key = hasher.move_crate(key, dst, cell_coords(unit.args[3]))
+            key = hasher.move_player(key, player, dst)
+            player = dst
+        keys.append(key)
+    return keys
+
+
+class TranspositionTable:
+    """
+    A bounded map from state keys to the best cost seen so far.
+
+    Storing a key that is already known with a cost that is not lower returns False,
+    which is the "already visited" test of a search. When the table is full, the
+    replacement policy decides what happens:
+
+    - "lru" evicts the least recently used entry.
+    - "depth" also looks at the least recently used entry but keeps it if the
+      new entry has a higher cost, since states closer to the root are
+      revisited more often. The new entry is dropped instead.
+
+    Memory use is tracked per entry with sys.getsizeof plus ENTRY_OVERHEAD for the
+    dictionary slot and the ordering links.
+    """
+
+    POLICIES = ("lru", "depth")
+    # Approximate bytes per entry of the OrderedDict itself (hash slot, entry and linked list node).
+    ENTRY_OVERHEAD = 104
+
+    def __init__(self, max_entries: int = 1_000_000, max_bytes: Optional[int] = None, policy: str = "lru"):
+        """
+        Args:
+            max_entries: Maximum number of stored states.
+            max_bytes: Optional limit on the accounted memory.
+            policy: Replacement policy, one of POLICIES.
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown replacement policy: {policy}")
+        if max_entries < 1:
+            raise ValueError("max_entries must be positive")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._entries: "OrderedDict[int, Tuple[int, Any]]" = OrderedDict()
+        self.memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._entries
+
+    def lookup(self, key: int) -> Optional[Tuple[int, Any]]:
+        """Returns (cost, payload) for a known key, or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def store(self, key: int, cost: int, payload: Any = None) -> bool:
+        """
+        Records a state reached with the given cost.
+
+        Returns:
+            True if the state is new or improved, False if it was already known at
+            no higher cost or the replacement policy dropped it.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            if entry[0] <= cost:
+                return False
+            self._account(key, entry, -1)
+        else:
+            self.misses += 1
+            while self._entries and self._is_full(key, (cost, payload)):
+                oldest_key, oldest = next(iter(self._entries.items()))
+                if self.policy == "depth" and oldest[0] < cost:
+                    self.rejected += 1
+                    return False
+                del self._entries[oldest_key]
+                self._account(oldest_key, oldest, -1)
+                self.evictions += 1
+        self._entries[key] = (cost, payload)
+        self._account(key, (cost, payload), 1)
+        self.stores += 1
+        return True
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.memory_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for reporting: entries, memory_bytes, hits, misses, stores, evictions, rejected."""
+        return {
+            "entries": len(self._entries),
+            "memory_bytes": self.memory_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "rejected": self.rejected,
+        }
+
+    def _is_full(self, key: int, entry: Tuple[int, Any]) -> bool:
+        if len(self._entries) >= self.max_entries:
+            return True
+        return self.max_bytes is not None and self.memory_bytes + self._entry_size(key, entry) > self.max_bytes
+
+    def _account(self, key: int, entry: Tuple[int, Any], sign: int) -> None:
+        self.memory_bytes += sign * self._entry_size(key, entry)
+
+    def _entry_size(self, key: int, entry: Tuple[int, Any]) -> int:
+        size = sys.getsizeof(key) + sys.getsizeof(entry) + sys.getsizeof(entry[0]) + self.ENTRY_OVERHEAD
+        if entry[1] is not None:
+            size += sys.getsizeof(entry[1])
+        return size
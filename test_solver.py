@@ -1,14 +1,31 @@
 # test_solver.py
 
+import json
 import re
 from asp_validator import validate_asp_encoding  # Ensure this module is available
 import pytest
 import difflib
 from typing import Dict, Set, List, Tuple
 from tabulate import tabulate
+import multiprocessing
 import os
-
-from solver import SokobanSolver, SokobanMap  # Updated import to reflect class-based structure
+import threading
+import time
+
+from solver import SokobanSolver, SokobanMap, SolveResult  # Updated import to reflect class-based structure
+from map_analysis import find_unsolvable_reason, map_class, map_features, parse_layout
+from state_hash import TranspositionTable, ZobristHasher, plan_state_keys
+from push_search import PushSearch
+from parallel_search import ParallelPushSearch
+from pattern_db import PatternDatabase
+from ground_estimate import GroundEstimator
+from plan_optimizer import PlanOptimizer
+from horizon_ledger import HorizonLedger
+from level_collection import LevelCollection
+from lurd import decode_rle, from_lurd, to_lurd
+from ground_profile import profile_grounding
+import benchmark
+from tune import recommend
 
 
 # Directories for maps and expected outputs
@@ -102,6 +119,7 @@ def test_generate_sokoban_lp(map_file: str, expected_file: str) :
 
     solver = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp"))
     actual_output = solver.generate_facts_from_map(map_str) 
+    assert validate_asp_encoding(map_str, actual_output)
 
     os.makedirs(MAPS_OUT_DIR, exist_ok=True)
 
@@ -146,3 +164,526 @@ def test_generate_sokoban_lp(map_file: str, expected_file: str) :
         map_obj.apply_step(step)
         print(f"\nAfter step {i}: {step}")
         map_obj.visualize()
+
+
+def test_solve_plan_can_be_cancelled():
+    """A set cancel event stops solve_plan before any horizon is solved."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map1.txt"))
+    solver = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp"))
+    cancel_event = threading.Event()
+    cancel_event.set()
+
+    result = solver.solve_plan(map_str, cancel_event=cancel_event)
+
+    assert result.status == SolveResult.CANCELLED
+    assert result.steps == []
+
+
+@pytest.mark.parametrize("map_str,reason", [
+    ("#####\n#CX #\n#####", "no sokoban"),
+    ("#####\n#S X#\n#  C#\n#####", "dead square"),
+    ("#####\n#S X#\n#####\n#C  #\n#####", "outside the sokoban's region"),
+])
+def test_unsolvable_maps_short_circuit(map_str: str, reason: str):
+    """Provably unsolvable maps are rejected before any grounding."""
+    solver = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp"))
+    result = solver.solve_plan(map_str)
+
+    assert result.status == SolveResult.UNSOLVABLE
+    assert reason in result.reason
+
+
+@pytest.mark.parametrize("map_str", [
+    "########\n#      #\n#   C  #\n# SCX  #\n#      #\n#      #\n########\n",
+    "#########\n#S C X#c#\n#########\n",
+])
+def test_presolve_checks_keep_solvable_maps(map_str: str):
+    """Crates may share a goal, and a crate already on a goal needs no checks."""
+    solver = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp"), max_steps=10)
+
+    assert find_unsolvable_reason(parse_layout(map_str)) is None
+    assert solver.solve_plan(map_str).status == SolveResult.SAT
+
+
+@pytest.mark.parametrize("domain_file,fact_format", [("sokoban.lp", "location"), ("sokoban_coord.lp", "coord")])
+def test_kernel_keeps_stranded_crates_on_goals(domain_file: str, fact_format: str):
+    """A crate the sokoban cannot reach still counts when it already stands on a goal."""
+    map_str = "#########\n#S C X#c#\n#########\n"
+    solver = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, domain_file), max_steps=5,
+                           presolve_checks=False, validate_facts=True, fact_format=fact_format)
+    result = solver.solve_plan(map_str)
+
+    assert result.status == SolveResult.SAT
+    assert result.horizon == 3
+
+
+def test_coord_encoding_plan_replays():
+    """The cell(R,C) instance format solves maps and its plans replay on SokobanMap."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map4.txt"))
+    solver = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban_coord.lp"), fact_format="coord")
+    result = solver.solve_plan(map_str)
+
+    assert result.status == SolveResult.SAT
+    final_map = SokobanMap(map_str).get_map_steps(result.step_actions())[-1]
+    assert SokobanMap.SYMBOL_CRATE not in final_map
+
+
+def test_macro_encoding_expands_walks():
+    """Push-level plans are expanded into explicit moves that replay on SokobanMap."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map1.txt"))
+    solver = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban_macro.lp"))
+    result = solver.solve_plan(map_str)
+
+    assert result.status == SolveResult.SAT
+    assert result.horizon < len(result.steps)
+    assert [SokobanSolver.step_number(s) for s in result.step_actions()] == list(range(len(result.steps)))
+    final_map = SokobanMap(map_str).get_map_steps(result.step_actions())[-1]
+    assert SokobanMap.SYMBOL_CRATE not in final_map
+
+
+@pytest.mark.parametrize("mode", ["max", "sum", "both"])
+def test_distance_pruning_keeps_optimal_horizon(mode: str):
+    """Remaining-distance pruning never cuts off the shortest plan."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map1.txt"))
+    baseline = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp")).solve_plan(map_str)
+    pruned = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp"), distance_pruning=mode).solve_plan(map_str)
+
+    assert pruned.status == SolveResult.SAT
+    assert pruned.horizon == baseline.horizon
+
+
+def test_domain_heuristic_keeps_optimal_horizon():
+    """The domain heuristic changes the search order, not the shortest horizon."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map1.txt"))
+    solver = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp"), heuristic="Domain")
+
+    assert "closer(" in solver.generate_facts_from_map(map_str)
+    result = solver.solve_plan(map_str)
+    assert result.status == SolveResult.SAT
+    assert result.horizon == 13
+
+
+def test_freeze_propagator_keeps_optimal_horizon():
+    """Frozen-crate nogoods only cut deadlocked states, so the shortest plan is still found."""
+    # Pushing both crates up leaves them side by side against the top wall, off the goals.
+    # crate_domains would already keep them out of the dead top row.
+    map_str = "######\n#    #\n# CC #\n# S  #\n#  XX#\n######\n"
+    domain_file = os.path.join(BASE_DIR, "sokoban.lp")
+    baseline = SokobanSolver(domain_asp_file=domain_file, crate_domains=False, tuning_file=None).solve_plan(map_str)
+    solver = SokobanSolver(domain_asp_file=domain_file, freeze_propagator=True, crate_domains=False,
+                           tuning_file=None, ledger_file=None)
+
+    result = solver.solve_plan(map_str)
+    assert result.status == SolveResult.SAT
+    assert result.horizon == baseline.horizon == 16
+    assert result.stats["freeze_nogoods"] > 0
+
+
+@pytest.mark.parametrize("domain_file", ["sokoban.lp", "sokoban_macro.lp"])
+def test_tunnel_macros_shorten_horizon(domain_file: str):
+    """A push through a tunnel takes one step and is expanded back into unit pushes."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map4.txt"))
+    baseline = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, domain_file)).solve_plan(map_str)
+    solver = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, domain_file), tunnel_macros=True)
+
+    assert "tunnelpush(" in solver.generate_facts_from_map(map_str)
+    result = solver.solve_plan(map_str)
+    assert result.status == SolveResult.SAT
+    assert result.horizon < baseline.horizon
+    assert len(result.steps) == len(baseline.steps)
+    final_map = SokobanMap(map_str).get_map_steps(result.step_actions())[-1]
+    assert SokobanMap.SYMBOL_CRATE not in final_map
+
+
+def test_zobrist_keys_and_transposition_table():
+    """Incremental state keys match fresh hashes, and the table stays within its bounds."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map1.txt"))
+    result = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp")).solve_plan(map_str)
+    hasher = ZobristHasher.from_map_str(map_str)
+    keys = plan_state_keys(map_str, result.steps, hasher)
+
+    final_map = SokobanMap(map_str).get_map_steps(result.step_actions())[-1]
+    final = parse_layout(final_map)
+    assert keys[-1] == hasher.hash_state(set(final.crates), final.sokoban, normalize=False)
+    assert len(set(keys)) == len(keys)  # an optimal plan never revisits a state
+
+    table = TranspositionTable(max_entries=4)
+    assert all(table.store(key, cost) for cost, key in enumerate(keys))
+    assert not table.store(keys[-1], len(keys))
+    assert len(table) == 4 and table.stats()["evictions"] == len(keys) - 4
+    assert table.memory_bytes > 0
+
+
+@pytest.mark.parametrize("map_name", ["map1.txt", "map7.txt"])
+def test_bidirectional_push_search_matches_forward(map_name: str):
+    """Meeting in the middle finds a plan with as few pushes as the forward search, and it replays."""
+    map_str = read_file(os.path.join(MAPS_DIR, map_name))
+    forward = PushSearch(map_str).solve("forward")
+    bidirectional = PushSearch(map_str).solve("bidirectional")
+
+    assert forward.status == bidirectional.status == SolveResult.SAT
+    assert bidirectional.horizon == forward.horizon
+    assert bidirectional.stats["backward_states"] > 0
+    final_map = SokobanMap(map_str).get_map_steps(bidirectional.step_actions())[-1]
+    assert SokobanMap.SYMBOL_CRATE not in final_map
+
+
+def test_parallel_push_search_matches_single_process():
+    """Hash-partitioned workers find a plan with the same number of pushes and report their throughput."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map7.txt"))
+    engine = ParallelPushSearch(map_str, workers=2)
+    result = engine.solve()
+
+    assert result.status == SolveResult.SAT
+    assert result.horizon == PushSearch(map_str).solve("forward").horizon
+    assert result.stats["workers"] == 2
+    assert {"worker_0_states_per_second", "worker_1_states_per_second", "load_balance_pct"} <= set(result.stats)
+    # Time blocked on the exchange is reported apart from the busy time.
+    assert all(w["busy_seconds"] + w["wait_seconds"] <= result.elapsed for w in engine.worker_stats)
+    final_map = SokobanMap(map_str).get_map_steps(result.step_actions())[-1]
+    assert SokobanMap.SYMBOL_CRATE not in final_map
+
+
+def test_pattern_database_bound_is_tighter_and_cached(tmp_path):
+    """Pair costs beat the per-crate distance sum on map7, stay admissible and are reloaded from disk."""
+    layout = parse_layout(read_file(os.path.join(MAPS_DIR, "map7.txt")))
+    pdb = PatternDatabase(layout, cache_dir=str(tmp_path))
+
+    assert not pdb.loaded_from_cache
+    assert sum(pdb.singles[c] for c in layout.crates) < pdb.lower_bound(layout.crates) <= 7
+    cached = PatternDatabase(layout, cache_dir=str(tmp_path))
+    assert cached.loaded_from_cache and cached.pairs == pdb.pairs
+
+    map_str = read_file(os.path.join(MAPS_DIR, "map1.txt"))
+    result = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp"), pattern_db=True).solve_plan(map_str)
+    assert result.status == SolveResult.SAT
+    assert result.horizon == 13
+
+
+def test_tuned_clingo_options_follow_map_class(tmp_path):
+    """Recommendations from tune.py are picked up per map class, and explicit options take precedence."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map1.txt"))
+    tuning_file = tmp_path / "clingo_tuning.json"
+    tuning_file.write_text(json.dumps({"recommendations": {
+        map_class(parse_layout(map_str)): {"options": ["--configuration=crafty", "--restarts=L,128"]}}}))
+
+    solver = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp"), tuning_file=str(tuning_file),
+                           parallel_mode="2,compete")
+    result = solver.solve_plan(map_str)
+    assert result.status == SolveResult.SAT
+    assert result.horizon == 13
+    assert solver.active_clingo_options == ["--configuration=crafty", "--restarts=L,128", "--parallel-mode=2,compete"]
+
+    explicit = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp"), tuning_file=str(tuning_file),
+                             clingo_options=["--configuration=jumpy"])
+    explicit.solve_plan(map_str)
+    assert explicit.active_clingo_options == ["--configuration=jumpy"]
+
+
+def test_tuning_only_counts_plans_as_solved():
+    """A configuration that crashes or gives up quickly does not beat one that finds plans."""
+    records = [
+        {"class": "small", "map": "map1.txt", "status": status, "seconds": seconds,
+         "options": {"clingo_options": [f"--configuration={name}"]}}
+        for name, status, seconds in [("crafty", "SAT", 20.0), ("jumpy", "CRASHED", 0.5), ("trendy", "UNSAT", 1.0)]
+    ]
+
+    assert recommend(records, timeout=60.0)["small"]["options"] == ["--configuration=crafty"]
+
+
+def test_auto_engine_routes_or_races(tmp_path):
+    """The front door routes by the calibrated cost model, and races the engines when it has no samples."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map7.txt"))
+    routed = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp"), engine="auto").solve_plan(map_str)
+    assert routed.status == SolveResult.SAT
+    assert routed.engine == "native"
+    assert "raced_engines" not in routed.stats
+    final_map = SokobanMap(map_str).get_map_steps(routed.step_actions())[-1]
+    assert SokobanMap.SYMBOL_CRATE not in final_map
+
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    raced = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp"), engine="auto",
+                          cost_model_file=None, checkpoint_dir=checkpoint_dir).solve_plan(
+        read_file(os.path.join(MAPS_DIR, "map1.txt")))
+    assert raced.status == SolveResult.SAT
+    assert raced.engine in ("asp", "macro", "native")
+    assert raced.stats["raced_engines"] == 3
+    # Cancelled losers leave no checkpoints behind.
+    assert not os.path.exists(checkpoint_dir) or not os.listdir(checkpoint_dir)
+
+
+def test_memory_guard_refuses_or_switches():
+    """The ground estimate tracks clingo's grounding, and a tight budget refuses the map or hands it to the native search."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map7.txt"))
+    domain_file = os.path.join(BASE_DIR, "sokoban.lp")
+    solver = SokobanSolver(domain_asp_file=domain_file, max_steps=20, memory_budget_mb=1000)
+    result = solver.solve_plan(map_str)
+    assert result.status == SolveResult.SAT
+    assert result.stats["process_peak_rss_mb"] > 0
+    estimate = GroundEstimator().estimate(domain_file, map_features(parse_layout(map_str)), result.horizon)
+    assert 0.5 < estimate.atoms / result.stats["ground_atoms"] < 2
+    assert 0.5 < estimate.rules / result.stats["ground_rules"] < 2
+
+    refused = SokobanSolver(domain_asp_file=domain_file, max_steps=30, memory_budget_mb=12).solve_plan(map_str)
+    assert refused.status == SolveResult.REFUSED
+
+    switched = SokobanSolver(domain_asp_file=domain_file, max_steps=30, memory_budget_mb=12,
+                             memory_policy="switch").solve_plan(map_str)
+    assert switched.status == SolveResult.SAT
+    assert switched.engine == "native"
+    assert switched.stats["memory_horizon_limit"] < 19
+
+
+def test_plan_optimizer_shortens_native_plan():
+    """Re-solving windows of the native plan with clingo removes detours and keeps the final map."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map7.txt"))
+    initial = PushSearch(map_str).solve("forward")
+    result = PlanOptimizer(map_str, window=10, workers=1, time_budget=30).optimize(initial.steps)
+
+    assert result.status == SolveResult.SAT
+    assert result.stats["initial_length"] == len(initial.steps)
+    assert len(result.steps) < len(initial.steps)
+    final_map = SokobanMap(map_str).get_map_steps(result.step_actions())[-1]
+    assert final_map == SokobanMap(map_str).get_map_steps(initial.step_actions())[-1]
+    assert SokobanMap.SYMBOL_CRATE not in final_map
+
+
+def test_plan_optimizer_keeps_goal_visits():
+    """A crate that only passes over a goal keeps that visit: windows pin it and splices are re-checked."""
+    map_str = "#######\n# S   #\n# C   #\n# X   #\n#     #\n#######\n"
+    optimizer = PlanOptimizer(map_str, window=5, workers=1)
+    # The crate is pushed onto the goal and off it again.
+    passing = from_lurd(map_str, "DldRR")
+    assert optimizer._visits_goals(passing)
+    assert optimizer._windows(passing, 0)[0].goal_visitors == {"crate_01"}
+    # Here it never reaches the goal.
+    missing = from_lurd(map_str, "ldR")
+    assert not optimizer._visits_goals(missing)
+    assert optimizer._windows(missing, 0)[0].goal_visitors == frozenset()
+
+    # End to end: the crate is pushed onto the goal, back up, and then right, with a detour.
+    # Pushing it right straight away takes 3 moves but never reaches the goal.
+    detour = from_lurd(map_str, "DlrlddrUluR")
+    result = PlanOptimizer(map_str, window=12, workers=1, time_budget=30).optimize(detour)
+    assert len(result.steps) < len(detour)
+    maps = SokobanMap(map_str).get_map_steps(result.step_actions())
+    assert any(SokobanMap.SYMBOL_CRATE_GOAL in state for state in maps)
+    assert maps[-1] == SokobanMap(map_str).get_map_steps(detour)[-1]
+
+
+def test_horizon_ledger_resumes_after_proven_horizons(tmp_path):
+    """A run that gives up early still records its UNSAT horizons, and later runs start after them."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map1.txt"))
+    domain_file = os.path.join(BASE_DIR, "sokoban.lp")
+    ledger_file = str(tmp_path / "ledger.json")
+
+    short = SokobanSolver(domain_asp_file=domain_file, max_steps=5, ledger_file=ledger_file).solve_plan(map_str)
+    assert short.status == SolveResult.UNSAT
+    solver = SokobanSolver(domain_asp_file=domain_file)
+    key = solver.run_key(solver.generate_facts_from_map(map_str))
+    assert HorizonLedger(ledger_file).get(key).unsat_upto == 5
+
+    resumed = SokobanSolver(domain_asp_file=domain_file, ledger_file=ledger_file).solve_plan(map_str)
+    assert resumed.status == SolveResult.SAT
+    assert resumed.stats["ledger_start"] == 6
+    assert resumed.horizon == 13
+
+    again = SokobanSolver(domain_asp_file=domain_file, ledger_file=ledger_file).solve_plan(map_str)
+    assert again.stats["ledger_start"] == 13
+    assert again.horizon == 13
+
+
+def test_checkpoint_resumes_cancelled_solve(tmp_path):
+    """A cancelled solve leaves a checkpoint behind, and resume=True continues after its horizons."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map1.txt"))
+    domain_file = os.path.join(BASE_DIR, "sokoban.lp")
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    cancel_event = threading.Event()
+
+    def cancel_at_horizon_six(progress):
+        if progress.horizon >= 6:
+            cancel_event.set()
+
+    first = SokobanSolver(domain_asp_file=domain_file, ledger_file=None, checkpoint_dir=checkpoint_dir)
+    interrupted = first.solve_plan(map_str, on_progress=cancel_at_horizon_six, cancel_event=cancel_event)
+    assert interrupted.status == SolveResult.CANCELLED
+    assert os.listdir(checkpoint_dir)
+
+    resumed = SokobanSolver(domain_asp_file=domain_file, ledger_file=None, checkpoint_dir=checkpoint_dir,
+                            resume=True).solve_plan(map_str)
+    assert resumed.status == SolveResult.SAT
+    assert resumed.stats["resumed_from"] >= 5
+    assert resumed.horizon == 13
+    assert not os.listdir(checkpoint_dir)
+
+    # A cancel that arrives after a plan was found keeps the plan.
+    found_event = threading.Event()
+
+    def cancel_on_plan(progress):
+        if progress.message.startswith("found plan"):
+            found_event.set()
+
+    found = SokobanSolver(domain_asp_file=domain_file, ledger_file=None, checkpoint_dir=checkpoint_dir).solve_plan(
+        map_str, on_progress=cancel_on_plan, cancel_event=found_event)
+    assert found.status == SolveResult.SAT
+    assert found.horizon == 13 and found.steps
+    assert not os.listdir(checkpoint_dir)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="the patched run_map must reach the child")
+def test_isolated_run_is_stopped_after_its_timeout(monkeypatch):
+    """A child that never returns, e.g. stuck in grounding, is stopped and recorded as TIMEOUT."""
+    monkeypatch.setattr(benchmark, "run_map", lambda *args: time.sleep(60))
+    monkeypatch.setattr(benchmark, "KILL_GRACE", 0.5)
+    started = time.monotonic()
+    record = benchmark.run_map_isolated(os.path.join(MAPS_DIR, "map1.txt"),
+                                        {"domain_asp_file": os.path.join(BASE_DIR, "sokoban.lp")}, 0.5)
+
+    assert record["status"] == "TIMEOUT"
+    assert time.monotonic() - started < 10
+
+
+def test_level_collection_reads_xsb_levels(tmp_path):
+    """Levels of an XSB collection are found by number and title and converted to the map format."""
+    collection_file = tmp_path / "set.sok"
+    collection_file.write_text(
+        "Sample collection\n\n"
+        "; 1\n\n"
+        "######\n#+   #\n#$$$.#\n#.   #\n######\n"
+        "Title: Three in a row\nAuthor: someone\n\n"
+        "#####\n#@$.#\n#####\n"
+        "Title: Corridor\n\n"
+        "; Last one\n"
+        "  ####\n###--#\n#@*$.#\n######\n",
+        encoding="utf-8")
+
+    with LevelCollection(str(collection_file)) as collection:
+        assert len(collection) == 3
+        assert [entry.title for entry in collection.entries] == ["Three in a row", "Corridor", "Last one"]
+        assert collection[1].map_str == read_file(os.path.join(MAPS_DIR, "map1.txt"))
+        assert collection.find("corridor").number == 2
+        assert collection[3].map_str.splitlines()[1] == "###  #"
+
+    assert SokobanMap.read_map_file(f"{collection_file}#Corridor") == "#####\n#SCX#\n#####\n"
+    result = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp"), ledger_file=None).solve_plan(
+        SokobanMap.read_map_file(f"{collection_file}#1"))
+    assert result.horizon == 13
+    with pytest.raises(ValueError):
+        SokobanMap.read_map_file(str(collection_file))
+
+
+def test_lurd_round_trip():
+    """Plans survive LURD export and import, with and without run-length encoding."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map7.txt"))
+    plan = PushSearch(map_str).solve().step_actions()
+
+    lurd = to_lurd(plan)
+    rle = to_lurd(plan, run_length=True)
+    assert len(lurd) == len(plan)
+    assert len(rle) < len(lurd)
+    assert decode_rle(rle) == lurd
+    assert decode_rle("2(lU)d") == "lUlUd"
+    with pytest.raises(ValueError):
+        decode_rle("2(lU3)r")
+
+    imported = from_lurd(map_str, rle)
+    assert imported == plan
+    assert SokobanMap(map_str).get_map_steps(imported)[-1] == SokobanMap(map_str).get_map_steps(plan)[-1]
+    with pytest.raises(ValueError):
+        from_lurd(map_str, lurd.swapcase())
+
+
+def test_asp_validator_checks_instance_vocabulary():
+    """The validator accepts generated instances in both formats and reports broken facts."""
+    map_str = read_file(os.path.join(MAPS_DIR, "map1.txt"))
+    facts = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban.lp")).generate_facts_from_map(map_str)
+    coord_facts = SokobanSolver(domain_asp_file=os.path.join(BASE_DIR, "sokoban_coord.lp"),
+                                fact_format="coord").generate_facts_from_map(map_str)
+    assert validate_asp_encoding(map_str, facts)
+    assert validate_asp_encoding(map_str, coord_facts, "coord")
+
+    broken = (facts.replace("leftOf(l1_1, l1_2).\n", "")
+              .replace("isgoal(l1_1;", "isgoal(l1_2;")
+              .replace("at(crate_01, l2_1, 0)", "at(crate_01, l2_2, 0)"))
+    with pytest.raises(AssertionError) as error:
+        validate_asp_encoding(map_str, broken)
+    message = str(error.value)
+    assert "Missing leftOf facts: leftOf(l1_1,l1_2)" in message
+    assert "Cells both isgoal and isnongoal: l1_2" in message
+    assert "Unexpected at facts: at(crate_01,l2_2,0)" in message
+
+
+def test_ground_profile_attributes_rules():
+    """Tag rules count the ground instances of each rule without changing the ground program."""
+    import clingo
+
+    map_str = read_file(os.path.join(MAPS_DIR, "map1.txt"))
+    domain_file = os.path.join(BASE_DIR, "sokoban.lp")
+    solver = SokobanSolver(domain_asp_file=domain_file, tuning_file=None)
+    facts = solver.generate_facts_from_map(map_str)
+    arguments = [a for a in solver._clingo_arguments(10) if a != "--stats"]
+
+    profiles, totals = profile_grounding([domain_file], facts, arguments)
+    ctl = clingo.Control(arguments)
+    ctl.load(domain_file)
+    ctl.add("base", [], facts)
+    ctl.ground([("base", [])])
+    assert totals["ground_atoms"] == len(ctl.symbolic_atoms)
+
+    assert [p.instances for p in profiles] == sorted((p.instances for p in profiles), reverse=True)
+    assert sum(p.instances for p in profiles) == totals["instances"]
+    choice = next(p for p in profiles if p.rule.startswith("0 <= { do(M,T)"))
+    assert choice.instances == 10 and choice.atoms > 0
+    assert profiles[0].rule == "#false :- crate(C); at(C,L1,T); at(C,L2,T); L1 != L2."
+
+
+def test_arrival_bounds_thin_early_steps_and_keep_optimal_horizon():
+    """earliest/3 facts keep do/2 atoms out of steps they cannot apply in, and no plan is lost."""
+    import clingo
+
+    map_str = read_file(os.path.join(MAPS_DIR, "map1.txt"))
+    domain_file = os.path.join(BASE_DIR, "sokoban.lp")
+
+    def ground_atoms(solver: SokobanSolver, name: str, arity: int) -> Dict[int, int]:
+        """Ground atoms of name/arity per time step (the last argument)."""
+        ctl = clingo.Control([a for a in solver._clingo_arguments(8) if a != "--stats"])
+        ctl.load(domain_file)
+        ctl.add("base", [], solver.generate_facts_from_map(map_str))
+        ctl.ground([("base", [])])
+        counts: Dict[int, int] = {}
+        for atom in ctl.symbolic_atoms.by_signature(name, arity):
+            step = atom.symbol.arguments[-1].number
+            counts[step] = counts.get(step, 0) + 1
+        return counts
+
+    plain = SokobanSolver(domain_asp_file=domain_file, arrival_bounds=False, tuning_file=None)
+    bounded = SokobanSolver(domain_asp_file=domain_file, tuning_file=None)
+    assert "earliest(" in bounded.generate_facts_from_map(map_str)
+    assert "earliest(" not in plain.generate_facts_from_map(map_str)
+    plain_do, bounded_do = ground_atoms(plain, "do", 2), ground_atoms(bounded, "do", 2)
+    # At step 0 only the moves out of the start cell remain; later steps keep more actions.
+    assert bounded_do[0] < plain_do[0] and sum(bounded_do.values()) < sum(plain_do.values())
+    assert all(bounded_do.get(t, 0) <= n for t, n in plain_do.items())
+    # at/3 is already limited to reachable cells by grounding.
+    assert ground_atoms(bounded, "at", 3) == ground_atoms(plain, "at", 3)
+
+    result = bounded.solve_plan(map_str)
+    assert result.status == SolveResult.SAT
+    assert result.horizon == 13
+
+
+def test_crate_domains_keep_crates_in_their_rooms():
+    """canbe/2 facts confine each crate's pushes to the cells it can reach, without losing the plan."""
+    map_str = "#########\n#S      #\n# C # C #\n#X  #  X#\n#########\n"
+    domain_file = os.path.join(BASE_DIR, "sokoban.lp")
+    plain = SokobanSolver(domain_asp_file=domain_file, crate_domains=False, tuning_file=None, ledger_file=None)
+    solver = SokobanSolver(domain_asp_file=domain_file, tuning_file=None, ledger_file=None)
+
+    facts = solver.generate_facts_from_map(map_str)
+    # The top row is dead (no goal on it), so neither crate can cross to the other room.
+    assert "canbe(crate_01,l2_1;crate_01,l2_2;crate_01,l3_1;crate_01,l3_2)." in facts
+    assert "canbe(crate_02,l2_6;crate_02,l2_7;crate_02,l3_6;crate_02,l3_7)." in facts
+
+    result = solver.solve_plan(map_str)
+    assert result.status == SolveResult.SAT
+    assert result.horizon == plain.solve_plan(map_str).horizon == 15
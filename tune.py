@@ -0,0 +1,117 @@
+# tune.py
+
+import argparse
+import itertools
+import json
+import os
+from typing import Dict, List, Optional
+
+from tabulate import tabulate
+
+from benchmark import BASE_DIR, default_map_files, run_map
+from map_analysis import map_class, parse_layout
+from solver import SokobanSolver
+from sokoban_map import SokobanMap
+
+# Default grid: clasp's preset configurations, two decision heuristics and two restart policies.
+CONFIGURATIONS = ["trendy", "crafty", "jumpy", "handy"]
+HEURISTICS = ["default", "Vsids", "Berkmin"]
+RESTARTS = ["default", "L,128"]
+PARALLEL_MODES = ["none"]
+
+
+def grid_options(configurations: List[str], heuristics: List[str], restarts: List[str],
+                 parallel_modes: List[str]) -> List[List[str]]:
+    """Every combination of the grid values as clingo arguments; "default"/"none" leave an option out."""
+    grid = []
+    for configuration, heuristic, restart, parallel in itertools.product(
+            configurations, heuristics, restarts, parallel_modes):
+        options = [f"--configuration={configuration}"]
+        if heuristic != "default":
+            options.append(f"--heuristic={heuristic}")
+        if restart != "default":
+            options.append(f"--restarts={restart}")
+        if parallel != "none":
+            options.append(f"--parallel-mode={parallel}")
+        grid.append(options)
+    return grid
+
+
+def recommend(records: List[Dict], timeout: float) -> Dict[str, Dict]:
+    """
+    Picks the best clingo options per map class.
+
+    Options are ranked by the number of maps solved (status SAT) within the class, then by the
+    total time with every other outcome (timeout, refusal, crash, UNSAT) counted as the full timeout.
+
+    Returns:
+        Mapping class -> {"options", "solved", "seconds", "maps"}.
+    """
+    scores: Dict[str, Dict[str, Dict]] = {}
+    for record in records:
+        label = " ".join(record["options"]["clingo_options"])
+        score = scores.setdefault(record["class"], {}).setdefault(
+            label, {"options": record["options"]["clingo_options"], "solved": 0, "seconds": 0.0, "maps": []})
+        solved = record["status"] == "SAT"
+        score["solved"] += int(solved)
+        score["seconds"] += record["seconds"] if solved else timeout
+        score["maps"].append(record["map"])
+    recommendations = {}
+    for map_cls, by_options in sorted(scores.items()):
+        best = min(by_options.values(), key=lambda s: (-s["solved"], s["seconds"]))
+        recommendations[map_cls] = dict(best, seconds=round(best["seconds"], 3), maps=sorted(set(best["maps"])))
+    return recommendations
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark a grid of clingo configurations and recommend one per map class.")
+    parser.add_argument("maps", nargs="*", help="Map files (default: every map in maps/).")
+    parser.add_argument("--domain_file", default=os.path.join(BASE_DIR, "sokoban.lp"), help="ASP encoding.")
+    parser.add_argument("--max_steps", type=int, default=50)
+    parser.add_argument("--configurations", default=",".join(CONFIGURATIONS),
+                        help="Comma separated clasp configurations.")
+    parser.add_argument("--heuristics", default=",".join(HEURISTICS),
+                        help="Comma separated clasp heuristics ('default' leaves it unset).")
+    parser.add_argument("--restarts", default=";".join(RESTARTS),
+                        help="Semicolon separated restart policies ('default' leaves it unset).")
+    parser.add_argument("--parallel_modes", default=";".join(PARALLEL_MODES),
+                        help="Semicolon separated --parallel-mode values, e.g. 'none;4,compete;4,split'.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds per map and configuration.")
+    parser.add_argument("--output", default=SokobanSolver.TUNING_FILE,
+                        help="Where to write the results and recommendations (read by SokobanSolver).")
+    parser.add_argument("--verbose", action="store_true", help="Show the solver output.")
+    args = parser.parse_args(argv)
+
+    grid = grid_options(args.configurations.split(","), args.heuristics.split(","),
+                        args.restarts.split(";"), args.parallel_modes.split(";"))
+    records = []
+    for map_path in args.maps or default_map_files():
+        map_cls = map_class(parse_layout(SokobanMap.read_map_file(map_path)))
+        for options in grid:
+            solver_kwargs = {
+                "domain_asp_file": args.domain_file,
+                "max_steps": args.max_steps,
+                "clingo_options": options,
+                "tuning_file": None,
+                "ledger_file": None,
+            }
+            record = run_map(map_path, solver_kwargs, args.timeout, args.verbose)
+            record["class"] = map_cls
+            print(f"{record['map']:<12} {map_cls:<18} {' '.join(options):<55} -> {record['status']} "
+                  f"({record['seconds']}s)", flush=True)
+            records.append(record)
+
+    recommendations = recommend(records, args.timeout)
+    print(tabulate([(cls, " ".join(r["options"]), r["solved"], r["seconds"], ", ".join(r["maps"]))
+                    for cls, r in recommendations.items()],
+                   headers=["Class", "Options", "Solved", "Seconds", "Maps"], tablefmt="grid"))
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump({"domain_file": os.path.basename(args.domain_file), "timeout": args.timeout,
+                   "recommendations": recommendations, "results": records}, file, indent=2)
+    print(f"Recommendations written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
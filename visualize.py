@@ -2,13 +2,18 @@
 
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-from typing import List
-import subprocess
+from typing import List, Optional
 import os
-from solver import SokobanMap  # Updated import to use SokobanMap
+import queue
+import threading
+from level_collection import LevelCollection, is_collection
+from solver import SokobanMap, SokobanSolver, SolveProgress, SolveResult
 
 
 class SokobanVisualizer:
+    # How often the Tk main loop polls the solver thread for progress.
+    POLL_INTERVAL_MS = 100
+
     def __init__(self, master):
         self.master = master
         self.master.title("Sokoban Visualizer")
@@ -16,21 +21,16 @@ class SokobanVisualizer:
         # Directories
         self.BASE_DIR = os.path.dirname(os.path.abspath(__file__))
         self.MAPS_DIR = os.path.join(self.BASE_DIR, 'maps')
-        self.EXPECTED_DIR = os.path.join(self.BASE_DIR, 'expected')
-        self.MAPS_OUT_DIR = os.path.join(self.BASE_DIR, 'maps_out')
         self.DOMAIN_FILE = os.path.join(self.BASE_DIR, "sokoban.lp")
-        self.TEST_FILE = os.path.join(self.BASE_DIR, "test_solver.py")
-
-        os.makedirs(self.MAPS_OUT_DIR, exist_ok=True)
 
         # Control Frame
         control_frame = tk.Frame(master)
         control_frame.pack(pady=10)
 
-        # Dropdown for map selection
+        # Dropdown for map selection; a path or collection.sok#<number or title> can be typed in as well
         tk.Label(control_frame, text="Select Map:").grid(row=0, column=0, padx=5, pady=5)
         self.map_var = tk.StringVar()
-        self.map_combobox = ttk.Combobox(control_frame, textvariable=self.map_var, state="readonly")
+        self.map_combobox = ttk.Combobox(control_frame, textvariable=self.map_var, width=30)
         self.map_combobox['values'] = self.get_map_files()
         self.map_combobox.grid(row=0, column=1, padx=5, pady=5)
         if self.map_combobox['values']:
@@ -40,6 +40,14 @@ class SokobanVisualizer:
         self.run_button = tk.Button(control_frame, text="Run Test", command=self.run_test, width=10)
         self.run_button.grid(row=0, column=2, padx=5, pady=5)
 
+        # Cancel Button
+        self.cancel_button = tk.Button(control_frame, text="Cancel", command=self.cancel_test, state=tk.DISABLED, width=10)
+        self.cancel_button.grid(row=0, column=3, padx=5, pady=5)
+
+        # Live solver progress
+        self.status_var = tk.StringVar(value="Idle")
+        tk.Label(control_frame, textvariable=self.status_var, anchor="w").grid(row=1, column=0, columnspan=4, sticky="w", padx=5)
+
         # Tabs
         self.notebook = ttk.Notebook(master)
         self.notebook.pack(expand=True, fill='both')
@@ -52,9 +60,9 @@ class SokobanVisualizer:
         self.asp_map_tab = ttk.Frame(self.notebook)
         self.notebook.add(self.asp_map_tab, text="Generated ASP Map")
 
-        # Pytest Output Tab
-        self.pytest_output_tab = ttk.Frame(self.notebook)
-        self.notebook.add(self.pytest_output_tab, text="Pytest Output")
+        # Solver Output Tab
+        self.solver_output_tab = ttk.Frame(self.notebook)
+        self.notebook.add(self.solver_output_tab, text="Solver Output")
 
         # Canvas for Visualization
         self.cell_size = 50
@@ -86,9 +94,9 @@ class SokobanVisualizer:
         self.asp_text = scrolledtext.ScrolledText(self.asp_map_tab, wrap=tk.WORD, width=60, height=25)
         self.asp_text.pack(padx=10, pady=10)
 
-        # Text widget for Pytest Output
-        self.pytest_text = scrolledtext.ScrolledText(self.pytest_output_tab, wrap=tk.WORD, width=60, height=25)
-        self.pytest_text.pack(padx=10, pady=10)
+        # Text widget for Solver Output
+        self.solver_text = scrolledtext.ScrolledText(self.solver_output_tab, wrap=tk.WORD, width=60, height=25)
+        self.solver_text.pack(padx=10, pady=10)
 
         # Step counter
         self.current_step = 0
@@ -96,63 +104,121 @@ class SokobanVisualizer:
         self.maps: List[str] = []
         self.sokoban_map: SokobanMap = None
 
+        # Background solver state
+        self.selected_map = ""
+        self.map_str = ""
+        self.cancel_event: Optional[threading.Event] = None
+        self.progress_queue: "queue.Queue" = queue.Queue()
+        self.worker: Optional[threading.Thread] = None
+
     def get_map_files(self) -> List[str]:
-        """Retrieve a list of map files from the maps directory."""
-        return sorted([
-            f for f in os.listdir(self.MAPS_DIR)
-            if os.path.isfile(os.path.join(self.MAPS_DIR, f)) and f.endswith('.txt')
-        ])
+        """Retrieve a list of map files, and the levels of collection files, from the maps directory."""
+        files = sorted(f for f in os.listdir(self.MAPS_DIR) if os.path.isfile(os.path.join(self.MAPS_DIR, f)))
+        levels = []
+        for f in files:
+            if is_collection(f):
+                with LevelCollection(os.path.join(self.MAPS_DIR, f)) as collection:
+                    levels += [f"{f}#{entry.number}" for entry in collection.entries]
+        return [f for f in files if f.endswith('.txt')] + levels
 
     def run_test(self):
-        """Run the pytest for the selected map and update the visualization."""
+        """Start solving the selected map in a background thread."""
         selected_map = self.map_var.get()
         if not selected_map:
             messagebox.showwarning("No Map Selected", "Please select a map to run the test.")
             return
 
         map_path = os.path.join(self.MAPS_DIR, selected_map)
-        expected_file = self.get_expected_file(selected_map)
-        if not expected_file:
-            messagebox.showerror("Expected File Missing", f"No expected file found for {selected_map}.")
-            return
-        expected_path = os.path.join(self.EXPECTED_DIR, expected_file)
-
-        # Run pytest for the selected map
         try:
-            cmd = [
-                'pytest',
-                self.TEST_FILE,
-                '--tb=short',
-                '-v',
-                '-s',
-                f'--map={selected_map}'
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            pytest_output = result.stdout
-        except subprocess.CalledProcessError as e:
-            pytest_output = e.stdout + "\n" + e.stderr
-            messagebox.showerror("Pytest Error", f"An error occurred while running pytest:\n{pytest_output}")
-
-        # Display Pytest Output
-        self.pytest_text.delete(1.0, tk.END)
-        self.pytest_text.insert(tk.END, pytest_output)
-
-        # Parse Solution Steps from Pytest Output
-        self.solution_steps = self.parse_solution_steps(pytest_output)
-        if not self.solution_steps:
-            messagebox.showinfo("No Solution", "No solution steps found in the pytest output.")
+            map_str = SokobanMap.read_map_file(map_path)
+        except Exception as e:
+            messagebox.showerror("Map Read Error", f"An error occurred while reading the map file:\n{e}")
             return
 
-        # Initialize SokobanMap
+        solver = SokobanSolver(domain_asp_file=self.DOMAIN_FILE)
+        self.display_generated_asp_map(solver.generate_facts_from_map(map_str))
+        self.solver_text.delete(1.0, tk.END)
+
+        self.selected_map = selected_map
+        self.map_str = map_str
+        self.cancel_event = threading.Event()
+        self.progress_queue = queue.Queue()
+        self.worker = threading.Thread(target=self._solve_worker, args=(solver, map_str), daemon=True)
+        self.worker.start()
+
+        self.run_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.status_var.set(f"Solving {selected_map}...")
+        self.master.after(self.POLL_INTERVAL_MS, self._poll_solver)
+
+    def cancel_test(self):
+        """Ask the running solver to stop."""
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+            self.status_var.set("Cancelling...")
+            self.cancel_button.config(state=tk.DISABLED)
+
+    def _solve_worker(self, solver: SokobanSolver, map_str: str):
+        """Runs the solver off the Tk main loop and forwards everything through the queue."""
         try:
-            map_str = SokobanMap.read_map_file(map_path)  # Now works correctly
+            result = solver.solve_plan(
+                map_str,
+                on_progress=lambda progress: self.progress_queue.put(("progress", progress)),
+                cancel_event=self.cancel_event,
+            )
+            self.progress_queue.put(("done", result))
         except Exception as e:
-            messagebox.showerror("Map Read Error", f"An error occurred while reading the map file:\n{e}")
-            return
+            self.progress_queue.put(("error", e))
+
+    def _poll_solver(self):
+        """Drain solver messages; reschedules itself until the worker finishes."""
+        finished = False
+        while True:
+            try:
+                kind, payload = self.progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                self.show_progress(payload)
+            elif kind == "done":
+                self.show_result(payload)
+                finished = True
+            else:
+                messagebox.showerror("Solver Error", f"An error occurred while solving:\n{payload}")
+                self.status_var.set("Solver error")
+                finished = True
+
+        if finished:
+            self.run_button.config(state=tk.NORMAL)
+            self.cancel_button.config(state=tk.DISABLED)
+            self.cancel_event = None
+        else:
+            self.master.after(self.POLL_INTERVAL_MS, self._poll_solver)
+
+    def show_progress(self, progress: SolveProgress):
+        """Display live solver progress."""
+        best = f", best plan: {len(progress.best_steps)} actions" if progress.best_steps else ""
+        self.status_var.set(f"Horizon {progress.horizon} | {progress.elapsed:.1f}s{best}")
+        self.solver_text.insert(tk.END, f"[{progress.elapsed:7.2f}s] {progress.message}\n")
+        self.solver_text.see(tk.END)
+
+    def show_result(self, result: SolveResult):
+        """Load the plan of a finished solve into the visualization."""
+        self.solver_text.insert(tk.END, f"\n{result.status} after {result.elapsed:.2f}s (horizon {result.horizon})\n")
+        if result.reason:
+            self.solver_text.insert(tk.END, f"Reason: {result.reason}\n")
+        self.solution_steps = result.step_actions()
+        for step in self.solution_steps:
+            self.solver_text.insert(tk.END, f"{step}\n")
+        self.solver_text.see(tk.END)
 
-        self.sokoban_map = SokobanMap(map_str)
+        if not self.solution_steps:
+            self.status_var.set(f"{self.selected_map}: {result.status}")
+            detail = f": {result.reason}" if result.reason else f" ({result.status})"
+            messagebox.showinfo("No Solution", f"No solution found for {self.selected_map}{detail}.")
+            return
 
-        # Gather map steps using the new method
+        self.sokoban_map = SokobanMap(self.map_str)
         try:
             self.maps = self.sokoban_map.get_map_steps(self.solution_steps)
         except Exception as e:
@@ -160,16 +226,6 @@ class SokobanVisualizer:
             return
 
         self.current_step = 0
-
-        # Display Generated ASP Map
-        generated_map_path = os.path.join(self.MAPS_OUT_DIR, f"generated_{selected_map}")
-        try:
-            #SokobanMap.write_map_file(generated_map_path, self.maps[-1])  # Now works correctly
-            self.display_generated_asp_map(generated_map_path)
-        except Exception as e:
-            messagebox.showerror("ASP Map Write Error", f"An error occurred while writing the generated ASP map:\n{e}")
-
-        # Render the initial map
         self.render_map(self.maps[self.current_step])
 
         # Enable navigation buttons if there are steps to navigate
@@ -179,39 +235,15 @@ class SokobanVisualizer:
             # Disable Previous button initially
             self.prev_button.config(state=tk.DISABLED)
 
-        messagebox.showinfo("Test Completed", f"Test for {selected_map} completed successfully.")
-
-    def get_expected_file(self, map_file: str) -> str:
-        """Get the corresponding expected file for a given map file."""
-        base_name = os.path.splitext(map_file)[0]
-        expected_file = f"expected{base_name[-1]}.txt"  # Assumes naming like map4.txt -> expected4.txt
-        if os.path.exists(os.path.join(self.EXPECTED_DIR, expected_file)):
-            return expected_file
-        return ""
-
-    def parse_solution_steps(self, pytest_output: str) -> List[str]:
-        """Extract solution steps from pytest output."""
-        steps = []
-        for line in pytest_output.splitlines():
-            if line.startswith("Step"):
-                parts = line.split(": ", 1)
-                if len(parts) == 2:
-                    steps.append(parts[1])
-        return steps
-
-    def display_generated_asp_map(self, asp_map_path: str):
-        """Display the generated ASP map in the ASP Map tab."""
-        try:
-            with open(asp_map_path, 'r', encoding='utf-8') as file:
-                asp_map = file.read()
-            self.asp_text.delete(1.0, tk.END)
-            self.asp_text.insert(tk.END, asp_map)
-        except FileNotFoundError:
-            self.asp_text.delete(1.0, tk.END)
-            self.asp_text.insert(tk.END, f"Generated ASP map file not found: {asp_map_path}")
-        except Exception as e:
-            self.asp_text.delete(1.0, tk.END)
-            self.asp_text.insert(tk.END, f"Error reading ASP map file: {e}")
+        if result.status == SolveResult.CANCELLED:
+            self.status_var.set(f"{self.selected_map}: cancelled, showing best plan so far")
+        else:
+            self.status_var.set(f"{self.selected_map}: solved in {result.elapsed:.1f}s")
+
+    def display_generated_asp_map(self, asp_map: str):
+        """Display the generated ASP facts in the ASP Map tab."""
+        self.asp_text.delete(1.0, tk.END)
+        self.asp_text.insert(tk.END, asp_map)
 
     def render_map(self, map_str: str):
         """Render the given map string onto the Tkinter Canvas."""